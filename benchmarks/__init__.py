@@ -0,0 +1,10 @@
+"""Micro-benchmarks for the skill engine.
+
+Every module is a standalone script, run it from the repository root, e.g.:
+
+    python -m benchmarks.skill_graph
+"""
+
+import os
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "project.settings.unit_test")
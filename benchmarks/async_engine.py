@@ -0,0 +1,143 @@
+"""Concurrent conversations per worker.
+
+Every conversation starts a skill of 5 prompt blocks followed by an input block, against a
+binder whose state and message hooks take LATENCY seconds, like a database or a websocket
+would. The asyncio engine runs all conversations on one event loop; the synchronous engine
+runs them on a pool of THREADS threads.
+"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import time
+
+from . import common
+from main.Binder import AsyncBinder, Registry
+from main.Flag import FLAG_START_SKILL
+from main.State import ChannelState
+from main.Statement import InputStatement
+
+
+LATENCY = 0.002
+THREADS = 32
+
+
+def make_skill():
+    skill = common.make_skill(5)
+    skill["blocks"][-1] = {
+        "id": "b5",
+        "component": "main.Block.InputText",
+        "properties": [{"name": "key", "value": "name"}, {"name": "required", "value": True}],
+        "connections": [],
+    }
+    return skill
+
+
+class SleepingBinder(common.MemoryBinder):
+    def on_post_message(self, statement):
+        time.sleep(LATENCY)
+        super().on_post_message(statement)
+
+    def on_load_state(self):
+        time.sleep(LATENCY)
+        return super().on_load_state()
+
+    def on_save_state(self, state_json):
+        time.sleep(LATENCY)
+        super().on_save_state(state_json)
+
+
+class AsyncMemoryBinder(AsyncBinder):
+    def __init__(self, skills):
+        super().__init__(REGISTRY)
+        self.skills = skills
+        self.state = ChannelState("user", "operator", "channel")
+        self.messages = []
+
+    def on_load_oauth_token(self, component, user_id):
+        return None
+
+    def on_save_oauth_token(self, component, user_id, token):
+        pass
+
+    def on_context(self):
+        return {}
+
+    def on_get_component_config(self, component):
+        return {}
+
+    async def on_standard_input(self, input, output):
+        return None
+
+    async def on_post_message(self, statement):
+        await asyncio.sleep(LATENCY)
+        self.messages.append(statement)
+
+    async def on_load_state(self):
+        await asyncio.sleep(LATENCY)
+        return ChannelState.from_dict(self.state.serialize())
+
+    async def on_save_state(self, state_json):
+        await asyncio.sleep(LATENCY)
+        self.state = ChannelState.from_dict(state_json)
+
+    async def on_get_skill(self, package):
+        return self.skills.get(package)
+
+    async def on_cancel_intent(self, statement):
+        return False
+
+    async def on_skill_intent(self, statement):
+        return None
+
+
+REGISTRY = Registry()
+
+
+def start_statement(skill):
+    return InputStatement("user", input=skill["package"], flag=FLAG_START_SKILL)
+
+
+def run_async(conversations, skill):
+    binders = [AsyncMemoryBinder({skill["package"]: skill}) for _ in range(conversations)]
+
+    async def run():
+        turns = (binder.select_processor(start_statement(skill)) for binder in binders)
+        await asyncio.gather(*turns)
+
+    start = time.perf_counter()
+    asyncio.run(run())
+    elapsed = time.perf_counter() - start
+    assert all(len(binder.messages) == 1 for binder in binders)
+    return elapsed
+
+
+def run_threads(conversations, skill):
+    binders = [SleepingBinder({skill["package"]: skill}) for _ in range(conversations)]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(THREADS) as pool:
+        list(pool.map(lambda binder: binder.select_processor(start_statement(skill)), binders))
+    elapsed = time.perf_counter() - start
+    assert all(len(binder.messages) == 1 for binder in binders)
+    return elapsed
+
+
+def main():
+    skill = make_skill()
+    rows = []
+    for conversations in (100, 1000, 5000):
+        elapsed = run_async(conversations, skill)
+        rows.append(
+            (f"{conversations} conversations, asyncio", f"{conversations / elapsed:8.0f} turns/s")
+        )
+        elapsed = run_threads(conversations, skill)
+        rows.append(
+            (
+                f"{conversations} conversations, {THREADS} threads",
+                f"{conversations / elapsed:8.0f} turns/s",
+            )
+        )
+    common.report(f"Concurrent conversations ({LATENCY * 1000:.0f} ms per backend call)", rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+"""Per-turn block construction cost.
+
+A block object is constructed on every turn just to call process(). This compares construction
+with the template built per instance (former behaviour) and with the class level template.
+"""
+
+from . import common
+from main.Block import DataExchange, InputSelection, PromptText, TerminalBlock
+
+
+BLOCKS = [
+    (PromptText, [{"name": "primary_text", "value": ["Hello"]}]),
+    (DataExchange, [{"name": "component", "value": "apps.bench.Exchange"}]),
+    (InputSelection, [{"name": "selections", "value": [["a", "A"], ["b", "B"]]}]),
+    (TerminalBlock, [{"name": "post_skill", "value": None}]),
+]
+
+
+def construct(block_class, properties):
+    kwargs = {}
+    if block_class is InputSelection:
+        kwargs["nlp"] = object()
+    return block_class(context={}, id="b0", properties=properties, connections=[], **kwargs)
+
+
+def construct_with_template(block_class, properties):
+    block = construct(block_class, properties)
+    block._template_properties = []
+    block.load_template()
+    return block
+
+
+def main():
+    rows = []
+    for block_class, properties in BLOCKS:
+        before = common.measure(lambda: construct_with_template(block_class, properties), 20000)
+        after = common.measure(lambda: construct(block_class, properties), 20000)
+        rows.append((f"{block_class.__name__}: per instance template", f"{before:6.2f} us"))
+        rows.append((f"{block_class.__name__}: class template", f"{after:6.2f} us"))
+    common.report("Block construction", rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""Memory per block and property lookups per turn.
+
+Compares the slotted, indexed blocks with a dict backed equivalent that scans self.properties
+and self.connections linearly, as blocks did before.
+"""
+
+import tracemalloc
+
+from . import common
+from main.Block import InputSelection, PromptText, index_connections, index_properties
+
+
+class LegacyPromptText(PromptText):
+    """PromptText with a __dict__ and linear lookups."""
+
+    def __init__(self, **kwargs):
+        super().__init__(values={}, targets={}, **kwargs)
+
+    def property_value(self, key):
+        return next((prop["value"] for prop in self.properties if prop["name"] == key), None)
+
+    def find_connection(self, code):
+        if self.connections:
+            for item in self.connections:
+                if item[0] == code:
+                    return item[1]
+
+
+PROPERTIES = [{"name": f"property_{index}", "value": index} for index in range(20)]
+PROPERTIES.append({"name": "primary_text", "value": ["Hello"]})
+CONNECTIONS = [[1, "b1"], [-1, "b0"]]
+
+# At runtime the indexes are built once per skill and shared, see main.Skill.CompiledSkill
+SHARED = {"values": index_properties(PROPERTIES), "targets": index_connections(CONNECTIONS)}
+
+
+def memory_per_block(block_class, number=10000, **kwargs):
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    blocks = [
+        block_class(context={}, id="b0", properties=PROPERTIES, connections=CONNECTIONS, **kwargs)
+        for _ in range(number)
+    ]
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    size = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    del blocks
+    return size / number
+
+
+def lookups(block):
+    block.property_value("primary_text")
+    block.property_value("property_0")
+    block.find_connection(-1)
+
+
+def main():
+    legacy = LegacyPromptText(context={}, id="b0", properties=PROPERTIES, connections=CONNECTIONS)
+    block = PromptText(context={}, id="b0", properties=PROPERTIES, connections=CONNECTIONS)
+    selections = [[str(index), f"Option {index}"] for index in range(100)]
+    selection = InputSelection(
+        nlp=object(),
+        context={},
+        id="b0",
+        properties=[{"name": "selections", "value": selections}],
+        connections=CONNECTIONS,
+    )
+
+    rows = [
+        ("dict backed block", f"{memory_per_block(LegacyPromptText):8.1f} bytes"),
+        ("slotted block, own indexes", f"{memory_per_block(PromptText):8.1f} bytes"),
+        ("slotted block, shared indexes", f"{memory_per_block(PromptText, **SHARED):8.1f} bytes"),
+        ("3 lookups, linear", f"{common.measure(lambda: lookups(legacy), 100000):8.3f} us"),
+        ("3 lookups, indexed", f"{common.measure(lambda: lookups(block), 100000):8.3f} us"),
+        (
+            "100 selections fuzzy match, per turn",
+            f"{common.measure(lambda: selection._fuzzy_item('Option 99'), 10000):8.3f} us",
+        ),
+    ]
+    common.report("Block runtime (21 properties)", rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+"""Helpers shared by the benchmarks."""
+
+import time
+
+# the in-memory binder of the unit tests, the benchmarks drive the same one
+from tests.main.binder import MemoryBinder  # noqa: F401
+
+
+def measure(func, number=1000):
+    """Return the mean time of func() in microseconds."""
+    start = time.perf_counter()
+    for _ in range(number):
+        func()
+    return (time.perf_counter() - start) / number * 1e6
+
+
+def report(title, rows):
+    """Print a table of (label, value) rows."""
+    print(title)
+    for label, value in rows:
+        print(f"  {label:<40} {value}")
+
+
+def make_skill(size, package="com.bench.skill"):
+    """Return a linear skill with size PromptText blocks followed by a TerminalBlock."""
+    blocks = []
+    for index in range(size):
+        blocks.append(
+            {
+                "id": f"b{index}",
+                "component": "main.Block.PromptText",
+                "properties": [{"name": "primary_text", "value": [f"Step {index}"]}],
+                "connections": [[1, f"b{index + 1}"]],
+            }
+        )
+    blocks.append(
+        {
+            "id": f"b{size}",
+            "component": "main.Block.TerminalBlock",
+            "properties": [{"name": "post_skill", "value": None}],
+            "connections": [],
+        }
+    )
+    return {"name": "Benchmark", "package": package, "start": "b0", "blocks": blocks}
@@ -0,0 +1,72 @@
+"""Similarity of messages with reference phrases, parsing both sides every call vs DocCache.
+
+Every message is compared with REFERENCES reference phrases. Messages repeat like real traffic:
+MESSAGES messages drawn from a Zipf distribution over DISTINCT texts. The model is a blank
+English pipeline with a tok2vec and random static vectors.
+"""
+
+import warnings
+
+import numpy as np
+import spacy
+
+from . import common
+from main.Intents import SentenceSimilarity
+from main.Nlp import DocCache
+
+
+REFERENCES = 20
+MESSAGES = 200
+DISTINCT = 100
+
+
+def make_nlp():
+    nlp = spacy.blank("en")
+    random = np.random.default_rng(0)
+    for index in range(500):
+        nlp.vocab.set_vector(f"word{index}", random.random(96, dtype=np.float32))
+    nlp.add_pipe("tok2vec")
+    nlp.initialize()
+    return nlp
+
+
+def main():
+    nlp = make_nlp()
+    random = np.random.default_rng(1)
+    references = [f"word{a} word{b} word{c}" for a, b, c in random.integers(500, size=(REFERENCES, 3))]
+    texts = [f"word{a} and word{b}" for a, b in random.integers(500, size=(DISTINCT, 2))]
+    messages = [texts[min(rank, DISTINCT) - 1] for rank in random.zipf(1.3, MESSAGES)]
+
+    def uncached():
+        for message in messages:
+            for reference in references:
+                nlp(message).similarity(nlp(reference))
+
+    cache = DocCache()
+    similarity = SentenceSimilarity(nlp, cache)
+
+    def cached():
+        for message in messages:
+            for reference in references:
+                similarity.get_similarity(message, reference)
+
+    pairs = MESSAGES * REFERENCES
+    legacy = common.measure(uncached, 1) / pairs
+    first = common.measure(cached, 1) / pairs
+    stats = cache.stats()
+    common.report(
+        f"Similarity with reference phrases ({pairs} pairs)",
+        [
+            ("parse both sides", f"{legacy:10.1f} us per pair"),
+            ("DocCache, cold", f"{first:10.1f} us per pair"),
+            ("DocCache, warm", f"{common.measure(cached, 5) / pairs:10.1f} us per pair"),
+            ("doc hit rate (cold run)", f"{stats['hit_rate']:10.2f}"),
+            ("similarity hit rate (cold run)", f"{stats['similarity_hit_rate']:10.2f}"),
+            ("cached docs", f"{stats['docs']:10d}, {stats['memory'] / 1024:.0f} KB"),
+        ],
+    )
+
+
+if __name__ == "__main__":
+    warnings.simplefilter("ignore")
+    main()
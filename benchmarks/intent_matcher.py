@@ -0,0 +1,78 @@
+"""Intent matching, one Matcher per intent built on every call vs the compiled IntentIndex.
+
+The docs are annotated by hand (words, POS, tags, lemmas, dependencies) so the benchmark doesn't
+need a trained pipeline; the matching cost is the same.
+"""
+
+import spacy
+from spacy.matcher import Matcher
+from spacy.tokens import Doc
+
+from . import common
+from main.matcher import get_intent_index, load_intent_patterns
+
+
+def make_docs(nlp):
+    sentences = [
+        [("please", "INTJ", "UH"), ("book", "VERB", "VB"), ("a", "DET", "DT")]
+        + [("table", "NOUN", "NN")],
+        [("i", "PRON", "PRP"), ("want", "VERB", "VBP"), ("the", "DET", "DT")]
+        + [("news", "NOUN", "NN")],
+        [("hello", "INTJ", "UH"), ("there", "ADV", "RB")],
+        [("what", "PRON", "WP"), ("is", "AUX", "VBZ"), ("the", "DET", "DT")]
+        + [("time", "NOUN", "NN")],
+    ]
+    docs = []
+    for sentence in sentences:
+        words, pos, tags = zip(*sentence)
+        docs.append(
+            Doc(
+                nlp.vocab,
+                words=list(words),
+                pos=list(pos),
+                tags=list(tags),
+                lemmas=list(words),
+                deps=["dep"] * len(words),
+                heads=[0] * len(words),
+            )
+        )
+    return docs
+
+
+def per_call_intent(doc, patterns):
+    # ProcessText.get_intent before the index: a Matcher per intent on every call
+    for name, value in patterns.items():
+        matcher = Matcher(doc.vocab)
+        matcher.add(name, value)
+        if matcher(doc):
+            return name
+    return None
+
+
+def main():
+    nlp = spacy.blank("en")
+    docs = make_docs(nlp)
+    patterns = load_intent_patterns()
+    index = get_intent_index(nlp.vocab)
+
+    def per_call():
+        for doc in docs:
+            per_call_intent(doc, patterns)
+
+    def indexed():
+        for doc in docs:
+            index.match(doc)
+
+    legacy = common.measure(per_call, 200) / len(docs)
+    compiled = common.measure(indexed, 5000) / len(docs)
+    common.report(
+        f"Intent matching ({len(patterns)} intents)",
+        [
+            ("matcher per intent per call", f"{1e6 / legacy:10.0f} intents/s"),
+            ("compiled intent index", f"{1e6 / compiled:10.0f} intents/s"),
+        ],
+    )
+
+
+if __name__ == "__main__":
+    main()
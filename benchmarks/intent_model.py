@@ -0,0 +1,60 @@
+"""UtteranceDistance per query, training the intent model on every query vs the offline artifact.
+
+The training data has INTENTS intents of EXAMPLES generated examples each. The per query
+training stands for the former Rasa interpreter trained in UtteranceDistance._compute, with the
+same classifier the train_intent_model command fits, so the cost is a lower bound.
+"""
+
+import tempfile
+
+import numpy as np
+
+from . import common
+from main.IntentModel import IntentModel
+from main.Utterance import UtteranceDistance
+
+
+INTENTS = 20
+EXAMPLES = 30
+WORDS = ["book", "table", "weather", "order", "pizza", "flight", "hotel", "cancel", "remind"]
+WORDS += ["call", "balance", "invoice", "rain", "tomorrow", "tonight", "paris", "car", "task"]
+
+
+def make_examples():
+    random = np.random.default_rng(0)
+    return {
+        f"intent{intent}": [
+            " ".join(random.choice(WORDS, 3)) + f" topic{intent}" for _ in range(EXAMPLES)
+        ]
+        for intent in range(INTENTS)
+    }
+
+
+def main():
+    examples = make_examples()
+    utterances = [texts[0] for texts in examples.values()]
+    query = "book a table for tonight topic3"
+
+    def per_query():
+        UtteranceDistance(utterances, query, model=IntentModel.train(examples))
+
+    with tempfile.TemporaryDirectory() as path:
+        IntentModel.train(examples).save(path)
+        load = common.measure(lambda: IntentModel.load(path), 100)
+        model = IntentModel.load(path)
+        rank = common.measure(lambda: model.rank(query), 1000)
+
+        def inference():
+            UtteranceDistance(utterances, query, model=model)
+
+        rows = [
+            ("train per query", f"{common.measure(per_query, 5) / 1000:10.2f} ms"),
+            ("artifact load, once per worker", f"{load / 1000:10.2f} ms"),
+            ("inference only", f"{common.measure(inference, 200) / 1000:10.2f} ms"),
+            ("  of which intent ranking", f"{rank / 1000:10.2f} ms"),
+        ]
+    common.report(f"UtteranceDistance per query ({INTENTS} intents)", rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""Keyword prefilter before intent detection: precision, recall and latency.
+
+CORPUS holds (message, has intent) pairs: requests matching an intent of main/pattern.json or a
+cancel phrase, and plain answers given to input blocks. Recall is the share of messages with an
+intent that the prefilter lets through, precision the share of let through messages that have
+one. Latency is compared with parsing the message with a tok2vec+tagger pipeline.
+"""
+
+import spacy
+
+from . import common
+from main.matcher import IntentPrefilter
+
+
+CORPUS = [
+    ("Please book a table for two", True),
+    ("I'd like to check my balance", True),
+    ("Call the support team", True),
+    ("Can you create a new invoice", True),
+    ("Remove my last order", True),
+    ("When will my package be delivered", True),
+    ("I want a pizza", True),
+    ("Hello!", True),
+    ("Good morning", True),
+    ("I ordered a laptop yesterday", True),
+    ("I bought the wrong size", True),
+    ("Any news about the launch?", True),
+    ("Rate my last ride", True),
+    ("Remind me to call mom", True),
+    ("I need to rent a car", True),
+    ("Find flights to Paris", True),
+    ("Look for a cheap hotel", True),
+    ("What is the weather like", True),
+    ("Set an alarm for 7", True),
+    ("Update my address", True),
+    ("Add a task to review the report", True),
+    ("Attach this to the project", True),
+    ("Finish the design by Friday", True),
+    ("Cancel", True),
+    ("never mind", True),
+    ("stop please", True),
+    ("Dear sir", True),
+    ("Made a mistake, change it", True),
+    ("John Smith", False),
+    ("42", False),
+    ("john@example.com", False),
+    ("Tomorrow at 5 pm", False),
+    ("yes", False),
+    ("no", False),
+    ("Blue", False),
+    ("Berlin, Germany", False),
+    ("The second one", False),
+    ("+1 555 010 9999", False),
+    ("3 pieces", False),
+    ("Large", False),
+    ("Visa ending in 4242", False),
+    ("My daughter Emma", False),
+    ("Next Monday", False),
+    ("Sure thing", False),
+    ("Chocolate and vanilla", False),
+    ("ok", False),
+    ("Apartment 12B", False),
+    ("Bob", False),
+    ("his name is Ted", False),
+    ("This notebook", False),
+]
+
+
+def make_nlp():
+    nlp = spacy.blank("en")
+    nlp.add_pipe("tok2vec")
+    tagger = nlp.add_pipe("tagger")
+    tagger.add_label("NN")
+    nlp.initialize()
+    return nlp
+
+
+def main():
+    prefilter = IntentPrefilter()
+    predicted = [(prefilter.may_match(text), expected) for text, expected in CORPUS]
+    true_positives = sum(1 for value, expected in predicted if value and expected)
+    precision = true_positives / sum(1 for value, _ in predicted if value)
+    recall = true_positives / sum(1 for _, expected in predicted if expected)
+    skipped = sum(1 for value, expected in predicted if not value and not expected)
+    answers = sum(1 for _, expected in predicted if not expected)
+
+    nlp = make_nlp()
+    texts = [text for text, _ in CORPUS]
+
+    def prefilter_all():
+        for text in texts:
+            prefilter.may_match(text)
+
+    def parse_all():
+        for text in texts:
+            nlp(text)
+
+    rows = [
+        ("precision", f"{precision:8.2f}"),
+        ("recall", f"{recall:8.2f}"),
+        ("plain answers skipping the NLP", f"{skipped} / {answers}"),
+        ("prefilter per message", f"{common.measure(prefilter_all, 1000) / len(texts):8.2f} us"),
+        ("spaCy parse per message", f"{common.measure(parse_all, 20) / len(texts):8.2f} us"),
+    ]
+    common.report(f"Intent prefilter ({len(CORPUS)} messages)", rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""NLP inference under load, one nlp(text) call per turn vs micro-batched nlp.pipe.
+
+THREADS concurrent turns each parse TEXTS texts. The model is a blank English pipeline with a
+tok2vec and a tagger, so parsing costs like a small trained pipeline.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import statistics
+import time
+
+import spacy
+
+from . import common
+from main.Nlp import NlpBatcher
+
+
+THREADS = 32
+TEXTS = 32
+
+
+def make_nlp():
+    nlp = spacy.blank("en")
+    nlp.add_pipe("tok2vec")
+    tagger = nlp.add_pipe("tagger")
+    for label in ("NN", "VB", "DT", "IN"):
+        tagger.add_label(label)
+    nlp.initialize()
+    return nlp
+
+
+def run(parse):
+    latencies = []
+
+    def turn(index):
+        for number in range(TEXTS):
+            start = time.perf_counter()
+            parse(f"book a table for {number} people at restaurant {index} tomorrow evening")
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(THREADS) as pool:
+        list(pool.map(turn, range(THREADS)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    p99 = latencies[int(len(latencies) * 0.99) - 1]
+    return len(latencies) / elapsed, statistics.median(latencies) * 1000, p99 * 1000
+
+
+def main():
+    nlp = make_nlp()
+    nlp("warm up")
+    rows = []
+    for label, parse in (
+        ("nlp(text) per call", nlp),
+        ("batched, 2 ms wait", NlpBatcher(nlp, max_wait=0.002)),
+        ("batched, 5 ms wait", NlpBatcher(nlp, max_wait=0.005)),
+    ):
+        throughput, p50, p99 = run(parse)
+        rows.append((label, f"{throughput:7.0f} texts/s, p50 {p50:6.1f} ms, p99 {p99:6.1f} ms"))
+    common.report(f"NLP inference, {THREADS} concurrent turns", rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""Node deserialization, the if/elif chain on the node string vs the NODE_CLASSES table.
+
+INPUTS is a mix of plain text messages, which InputStatement.get_node now answers without
+deserializing, and nodes sent by the clients. The catalog row compares building Node.all() on
+every request with the cached one.
+"""
+
+from . import common
+from main import Node
+from main.Node import BaseNode, SearchNode
+from main.Statement import InputStatement
+
+
+LEGACY_ORDER = [
+    "big.bot.core.audio",
+    "big.bot.core.binary",
+    "big.bot.core.cancel",
+    "big.bot.core.delegates",
+    "big.bot.core.iframe",
+    "big.bot.core.image",
+    "big.bot.core.notification",
+    "big.bot.core.oauth",
+    "big.bot.core.payment",
+    "big.bot.core.picker.date",
+    "big.bot.core.picker.datetime",
+    "big.bot.core.picker.duration",
+    "big.bot.core.picker.file",
+    "big.bot.core.preview",
+    "big.bot.core.search",
+    "big.bot.core.skip",
+    "big.bot.core.text",
+]
+
+INPUTS = [
+    "Ada Lovelace",
+    "ada@example.com",
+    "yes",
+    "Tomorrow at 5 pm",
+    SearchNode.wrap_text("Large", "large").serialize(),
+    SearchNode.wrap_cancel().serialize(),
+    {"node": "big.bot.core.text", "data": "hello", "meta": None},
+    {"node": "big.bot.core.picker.date", "data": "2023-06-01", "meta": None},
+]
+
+
+def legacy_deserialize(object):
+    # BaseNode.deserialize before the table: one string comparison per branch, in this order
+    if isinstance(object, dict):
+        node = object.get("node")
+        for node_type in LEGACY_ORDER:
+            if node == node_type:
+                return Node.NODE_CLASSES[node_type](object.get("data"), object.get("meta"))
+        raise ValueError(f"Invalid node type: {node}")
+
+
+def legacy_all():
+    return [node_type(None, None).serialize() for node_type in Node.NODE_TYPES]
+
+
+def main():
+    statements = [InputStatement("user", input=value) for value in INPUTS]
+    nodes = [value for value in INPUTS if isinstance(value, dict)]
+
+    def chain():
+        for statement in statements:
+            legacy_deserialize(statement.input)
+        for node in nodes:
+            legacy_deserialize(node)
+
+    def table():
+        for statement in statements:
+            statement.get_node()
+        for node in nodes:
+            BaseNode.deserialize(node)
+
+    count = len(statements) + len(nodes)
+    rows = [
+        ("if/elif chain", f"{common.measure(chain, 20000) / count:8.3f} us per input"),
+        ("table and text fast path", f"{common.measure(table, 20000) / count:8.3f} us per input"),
+        ("Node.all() built per call", f"{common.measure(legacy_all, 200):8.1f} us"),
+        ("Node.all() cached", f"{common.measure(Node.all, 200):8.1f} us"),
+    ]
+    common.report(f"Node deserialization ({count} inputs)", rows)
+
+
+if __name__ == "__main__":
+    main()
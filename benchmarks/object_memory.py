@@ -0,0 +1,85 @@
+"""Memory per active conversation, with and without __slots__.
+
+An active conversation keeps its ChannelState (loaded from the store), the InputStatement of the
+turn and an OutputStatement of three nodes. The dict-backed layout, used before the classes
+declared __slots__, is rebuilt from their namespaces. Memory is measured with tracemalloc over
+CONVERSATIONS conversations.
+"""
+
+import tracemalloc
+import types
+
+from . import common
+from .state_codec import make_states
+from main import StateCodec
+from main.Node import BaseNode, ImageNode, SearchNode, TextNode
+from main.State import ChannelState
+from main.Statement import InputStatement, OutputStatement
+
+
+CONVERSATIONS = 10000
+
+
+def dict_backed(cls):
+    """Return a copy of cls keeping its attributes in a __dict__ instead of slots."""
+    namespace = {}
+    for klass in reversed(cls.__mro__[:-1]):
+        for name, value in vars(klass).items():
+            if name in ("__slots__", "__dict__", "__weakref__"):
+                continue
+            if not isinstance(value, types.MemberDescriptorType):
+                namespace[name] = value
+    return type(cls.__name__, (object,), namespace)
+
+
+def conversation(encoded, state_cls, input_cls, output_cls, node_cls):
+    state_dict = StateCodec.decode(encoded)
+    state = state_cls(**state_dict)
+    state.mark_saved()
+    statement = input_cls(state.user_id, text="I want two of them", input="I want two of them")
+    output = output_cls(state.user_id)
+    output.contents.append(node_cls(TextNode.NODE_TYPE, "How many would you like?", None))
+    output.contents.append(node_cls("big.bot.core.image", "https://cdn.example.com/p.png", None))
+    output.contents.append(node_cls(SearchNode.NODE_TYPE, "2", {"node": TextNode.NODE_TYPE}))
+    return state, statement, output
+
+
+def slotted_node(node, data, meta):
+    node_class = {TextNode.NODE_TYPE: TextNode, "big.bot.core.image": ImageNode}
+    if node in node_class:
+        return node_class[node](data, meta)
+    return SearchNode(data, meta)
+
+
+def measure_memory(encoded, classes):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    conversations = [conversation(encoded, *classes) for _ in range(CONVERSATIONS)]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del conversations
+    return (after - before) / CONVERSATIONS
+
+
+def main():
+    slotted = (ChannelState, InputStatement, OutputStatement, slotted_node)
+    legacy = tuple(dict_backed(cls) for cls in (ChannelState, InputStatement, OutputStatement))
+    legacy += (dict_backed(BaseNode),)
+
+    rows = []
+    for label, state in make_states():
+        encoded = StateCodec.encode(state.serialize())
+        before = measure_memory(encoded, legacy)
+        after = measure_memory(encoded, slotted)
+        rows.append(
+            (
+                f"{label} state",
+                f"{before:8.0f} -> {after:8.0f} bytes per conversation "
+                f"({1 - after / before:5.1%} less)",
+            )
+        )
+    common.report(f"Memory per active conversation ({CONVERSATIONS} conversations)", rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""InputSelection matching, per user message.
+
+Compares the former matching (every label parsed and compared token by token on every message)
+with the precomputed label vectors, for selections of 10, 100 and 1000 options. The model is a
+blank English pipeline with random 300 dimensional vectors, like a model with static vectors.
+"""
+
+import warnings
+
+import numpy as np
+import spacy
+
+from . import common
+from main.Block import InputSelection
+
+
+VOCABULARY = 5000
+WIDTH = 300
+
+
+def make_nlp():
+    nlp = spacy.blank("en")
+    random = np.random.default_rng(0)
+    for index in range(VOCABULARY):
+        nlp.vocab.set_vector(f"word{index}", random.random(WIDTH, dtype=np.float32))
+    return nlp
+
+
+def make_selections(size):
+    random = np.random.default_rng(size)
+    labels = random.integers(VOCABULARY, size=(size, 3))
+    return [
+        [str(index), " ".join(f"word{word}" for word in words)]
+        for index, words in enumerate(labels)
+    ]
+
+
+def legacy_augment_results(nlp, selections, value):
+    doc = nlp(value)
+    tokens = [token for token in doc if not token.is_stop]
+    results = []
+    for item in selections:
+        txt, val = item[1], item[0]
+        item_doc = nlp(txt)
+        item_tokens = [token for token in item_doc if not token.is_stop]
+        score = doc.similarity(item_doc)
+        for token in tokens:
+            score += max(token.similarity(item_token) for item_token in item_tokens)
+        score /= len(tokens) + len(item_tokens)
+        results.append((score, val))
+    results.sort(reverse=True)
+    return [result[1] for result in results]
+
+
+def main():
+    nlp = make_nlp()
+    query = "word1 the word2 word3"
+    rows = []
+    for size in (10, 100, 1000):
+        selections = make_selections(size)
+        block = InputSelection(
+            nlp=nlp,
+            context={},
+            id="b0",
+            properties=[{"name": "selections", "value": selections}],
+            connections=[],
+        )
+        expected = legacy_augment_results(nlp, selections, query)
+        assert block._augment_results(query)[:10] == expected[:10]
+
+        number = max(10000 // size, 5)
+        legacy = common.measure(lambda: legacy_augment_results(nlp, selections, query), number)
+        vectorized = common.measure(lambda: block._augment_results(query), number * 10)
+        rows.append((f"{size} options, token loops", f"{legacy:12.1f} us"))
+        rows.append((f"{size} options, label vectors", f"{vectorized:12.1f} us"))
+    common.report("Selection matching per message", rows)
+
+
+if __name__ == "__main__":
+    warnings.simplefilter("ignore")
+    main()
@@ -0,0 +1,35 @@
+"""Block lookup cost against skill size.
+
+Compares the former linear scan over skill["blocks"] and the registry with the CompiledSkill
+index used by main.Block.get_block_by_id.
+"""
+
+from . import common
+from main.Skill import CompiledSkill, compile_skill
+
+
+def linear_lookup(registry, skill, block_id):
+    block_data = next(item for item in skill["blocks"] if item["id"] == block_id)
+    component = block_data["component"]
+    return next(b for b in registry.blocks if f"{b.__module__}.{b.__name__}" == component)
+
+
+def main():
+    binder = common.MemoryBinder()
+    registry = binder.get_registry()
+    rows = []
+    for size in (10, 100, 1000, 5000):
+        skill = common.make_skill(size)
+        last = f"b{size}"
+        build = common.measure(lambda: CompiledSkill(skill, registry), number=10)
+        compile_skill(skill, registry)
+        linear = common.measure(lambda: linear_lookup(registry, skill, last))
+        compiled = common.measure(lambda: compile_skill(skill, registry).get_block_class(last))
+        rows.append((f"{size} blocks: linear", f"{linear:8.2f} us"))
+        rows.append((f"{size} blocks: compiled", f"{compiled:8.2f} us"))
+        rows.append((f"{size} blocks: one-time compile", f"{build:8.2f} us"))
+    common.report("Block lookup (last block of the skill)", rows)
+
+
+if __name__ == "__main__":
+    main()
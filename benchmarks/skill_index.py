@@ -0,0 +1,64 @@
+"""Skill routing, a cosine per utterance in a Python loop vs the SkillIndex matrix.
+
+SKILLS skills of UTTERANCES utterances each, with random WIDTH dimensional vectors standing for
+the embeddings. Routing a message takes the best utterance of every skill.
+"""
+
+import tempfile
+
+import numpy as np
+
+from . import common
+from main.SkillIndex import SkillIndex
+
+
+SKILLS = 500
+UTTERANCES = 40
+WIDTH = 96
+
+
+def main():
+    random = np.random.default_rng(0)
+    skills = {
+        f"com.bench.skill{n}": random.standard_normal((UTTERANCES, WIDTH)).astype(np.float32)
+        for n in range(SKILLS)
+    }
+    queries = random.standard_normal((32, WIDTH)).astype(np.float32)
+    query = queries[0]
+
+    def loop():
+        best = {}
+        for package, vectors in skills.items():
+            best[package] = max(
+                float(vector @ query / (np.linalg.norm(vector) * np.linalg.norm(query)))
+                for vector in vectors
+            )
+        return sorted(best.items(), key=lambda item: -item[1])[:5]
+
+    rows = [("python loop", f"{common.measure(loop, 3) / 1000:10.2f} ms")]
+    for dtype in (np.float32, np.float16):
+        index = SkillIndex(dtype=dtype)
+        for package, vectors in skills.items():
+            index.add(package, None, vectors)
+        assert [package for package, _ in index.search(query, 5)][:1] == [loop()[0][0]]
+        name = np.dtype(dtype).name
+        single = common.measure(lambda: index.search(query, 5), 100)
+        batch = common.measure(lambda: index.search(queries, 5), 20) / len(queries)
+        rows.append((f"{name} matrix, one message", f"{single / 1000:10.2f} ms"))
+        rows.append((f"{name} matrix, 32 messages, per message", f"{batch / 1000:10.2f} ms"))
+        rows.append((f"{name} matrix size", f"{index.vectors.nbytes / 2 ** 20:10.2f} MB"))
+
+    with tempfile.TemporaryDirectory() as path:
+        index.save(path)
+        load = common.measure(lambda: SkillIndex.load(path), 100)
+        rows.append(("memory-mapped load", f"{load / 1000:10.2f} ms"))
+
+    def publish():
+        index.add("com.bench.new", None, skills["com.bench.skill0"])
+
+    rows.append(("publish a skill", f"{common.measure(publish, 20) / 1000:10.2f} ms"))
+    common.report(f"Skill routing ({SKILLS} skills, {SKILLS * UTTERANCES} utterances)", rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""Size and encode/decode time of ChannelState encodings.
+
+The states are the ones our skills leave between turns: a skill that just started, a signup form
+half filled by the input blocks (text, email, date, number, selection) and an order skill holding
+a cart, a payment and an OAuth token. stdlib json is the encoding ChannelState.to_json used
+before main.StateCodec.
+"""
+
+import json
+
+from . import common
+from main import StateCodec
+from main.State import ChannelState
+
+
+SKILL = {"package": "com.bigbot.order", "version": "1.4.2"}
+
+
+def make_states():
+    started = ChannelState("42", "7", "telegram-9000", skill=SKILL, block_id="b0")
+    signup = ChannelState(
+        "42",
+        "7",
+        "telegram-9000",
+        skill={"package": "com.bigbot.signup", "version": "2.0.0"},
+        block_id="b5",
+        data={
+            "name": "Ada Lovelace",
+            "email": "ada@example.com",
+            "birthday": "1815-12-10",
+            "meeting": "2023-06-01T10:30:00",
+            "guests": 3,
+            "plan": ["pro"],
+            "newsletter": True,
+        },
+        extra={"lang": "en", "retries": 1},
+    )
+    cart = [
+        {"sku": f"SKU-{n:05d}", "name": f"Product {n}", "quantity": n % 3 + 1, "price": 9.99 + n}
+        for n in range(12)
+    ]
+    order = ChannelState(
+        "42",
+        "7",
+        "telegram-9000",
+        skill=SKILL,
+        block_id="b14",
+        data={
+            "cart": cart,
+            "address": {"street": "12 Baker Street", "city": "London", "zip": "NW1 6XE"},
+            "delivery": "2023-06-03",
+            "payment": {"amount": 187.76, "currency": "USD", "status": "authorized"},
+            "receipt": {"name": "receipt.pdf", "url": "https://files.example.com/r/8812.pdf"},
+        },
+        extra={
+            "oauth": {"access_token": "ya29." + "x" * 120, "expires_in": 3599, "scope": "email"},
+            "history": [f"b{n}" for n in range(14)],
+        },
+        lang="en",
+    )
+    return [("started", started), ("signup", signup), ("order", order)]
+
+
+def main():
+    rows = []
+    for label, state in make_states():
+        state_dict = state.serialize()
+        encodings = (
+            ("json", lambda: json.dumps(state_dict), json.loads),
+            ("codec json", lambda: StateCodec.encode_json(state_dict), StateCodec.decode),
+            ("codec binary", lambda: StateCodec.encode(state_dict), StateCodec.decode),
+        )
+        for name, encode, decode in encodings:
+            encoded = encode()
+            encoding = common.measure(encode, 20000)
+            decoding = common.measure(lambda: decode(encoded), 20000)
+            rows.append(
+                (
+                    f"{label}, {name}",
+                    f"{len(encoded):6d} bytes {encoding:6.2f} us encode {decoding:6.2f} us decode",
+                )
+            )
+    common.report("ChannelState encodings", rows)
+
+
+if __name__ == "__main__":
+    main()
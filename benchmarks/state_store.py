@@ -0,0 +1,75 @@
+"""ChannelState load and save throughput per StateStore backend.
+
+A turn loads the state of one of CHANNELS channels, sets a value and saves it, either the whole
+state or its changes (ChannelState.delta). Every state holds the HISTORY previous answers. The Django
+backend runs on an in-memory SQLite database (the unit test settings with IS_DEVELOPMENT),
+the key-value backend on LocalKeyValue; a Redis server adds a network round trip per call.
+"""
+
+import json
+import os
+
+import django
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "project.settings.unit_test")
+os.environ.setdefault("IS_DEVELOPMENT", "1")
+django.setup()
+
+from django.db import connection  # noqa: E402
+
+from . import common  # noqa: E402
+from core.state import DjangoStateStore  # noqa: E402
+from main.State import ChannelState, KeyValueStateStore, LruStateStore  # noqa: E402
+
+
+CHANNELS = 100
+TURNS = 2000
+HISTORY = 50
+
+
+def make_state(key):
+    data = {"name": "Ada", **{f"answer{n}": f"answer number {n}" for n in range(HISTORY)}}
+    return ChannelState(*key, block_id="b0", data=data)
+
+
+def run(store, delta):
+    keys = [("user", "operator", f"channel{n}") for n in range(CHANNELS)]
+    for key in keys:
+        store.save(key, make_state(key).serialize())
+    turn = 0
+
+    def one_turn():
+        nonlocal turn
+        key = keys[turn % CHANNELS]
+        state = ChannelState.from_dict(store.load(key))
+        state.update_data("turn", turn)
+        # as main.State.StateStoreMixin does, a store without partial updates saves it all
+        if not delta or not store.save_delta(key, state.delta()):
+            store.save(key, state.serialize())
+        turn += 1
+
+    return 1e6 / common.measure(one_turn, TURNS)
+
+
+def main():
+    connection.creation.create_test_db(verbosity=0)
+    rows = []
+    for label, store in (
+        ("key-value (LocalKeyValue)", KeyValueStateStore),
+        ("LRU + key-value", lambda: LruStateStore(KeyValueStateStore())),
+        ("Django ORM", DjangoStateStore),
+        ("LRU + Django ORM", lambda: LruStateStore(DjangoStateStore())),
+    ):
+        full = run(store(), delta=False)
+        changes = run(store(), delta=True)
+        rows.append((label, f"{full:10.0f} turns/s full, {changes:10.0f} turns/s delta"))
+
+    state = ChannelState.from_dict(make_state(("user", "operator", "channel")).serialize())
+    state.update_data("turn", 1)
+    rows.append(("full state written", f"{len(state.to_json()):10d} bytes"))
+    rows.append(("delta written", f"{len(json.dumps(state.delta().to_dict())):10d} bytes"))
+    common.report(f"State store, load + save per turn ({CHANNELS} channels)", rows)
+
+
+if __name__ == "__main__":
+    main()
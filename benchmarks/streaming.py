@@ -0,0 +1,97 @@
+"""Time to first node, buffered vs streamed output.
+
+The skill runs 3 prompt blocks, then an InterpreterSkill whose provider takes DELAY seconds,
+then waits for input. With the buffered output (Constant.OUTPUT_COALESCE) the user sees nothing
+until the interpreter returns; with Constant.OUTPUT_NODES the prompts are sent right away.
+"""
+
+import statistics
+import time
+
+from . import common
+from main.Component import SkillProvider
+from main.Constant import OUTPUT_COALESCE, OUTPUT_NODES, OUTPUT_STREAM
+from main.Flag import FLAG_START_SKILL
+from main.Statement import InputStatement
+
+
+DELAY = 0.1
+TURNS = 20
+
+
+class SlowProvider(SkillProvider):
+    def on_execute(self, binder, user_id, package, data, *args, **kwargs):
+        time.sleep(DELAY)
+        return {"orders": 3}
+
+    def on_search(self, binder, user_id, package, searchable, query, **kwargs):
+        return []
+
+
+def make_skill():
+    skill = common.make_skill(3)
+    skill["blocks"][-1] = {
+        "id": "b3",
+        "component": "main.Block.InterpreterSkill",
+        "properties": [
+            {"name": "component", "value": f"{__name__}.SlowProvider"},
+            {
+                "name": "nodes",
+                "value": [{"node": "big.bot.core.text", "content": "{{ result.orders }} orders"}],
+            },
+        ],
+        "connections": [[1, "b4"]],
+    }
+    skill["blocks"].append(
+        {
+            "id": "b4",
+            "component": "main.Block.InputText",
+            "properties": [{"name": "key", "value": "name"}, {"name": "required", "value": True}],
+            "connections": [],
+        }
+    )
+    return skill
+
+
+class TimedBinder(common.MemoryBinder):
+    def __init__(self, skills, **kwargs):
+        super().__init__(skills, **kwargs)
+        self.registry.register(SlowProvider)
+        self.times = []
+
+    def on_get_component_config(self, component):
+        return {"component": component}
+
+    def on_post_message(self, statement):
+        self.times.append(time.perf_counter())
+        super().on_post_message(statement)
+
+
+def run(mode, skill):
+    first, total = [], []
+    for _ in range(TURNS):
+        binder = TimedBinder({skill["package"]: skill}, OUTPUT_MODE=mode)
+        statement = InputStatement("user", input=skill["package"], flag=FLAG_START_SKILL)
+        start = time.perf_counter()
+        binder.select_processor(statement)
+        total.append(time.perf_counter() - start)
+        first.append(binder.times[0] - start)
+    return statistics.median(first) * 1000, statistics.median(total) * 1000, len(binder.messages)
+
+
+def main():
+    skill = make_skill()
+    rows = []
+    for mode in (OUTPUT_COALESCE, OUTPUT_STREAM, OUTPUT_NODES):
+        first, total, messages = run(mode, skill)
+        rows.append(
+            (
+                f"{mode} ({messages} messages)",
+                f"first node {first:7.2f} ms, turn {total:7.2f} ms",
+            )
+        )
+    common.report(f"Time to first node ({DELAY * 1000:.0f} ms interpreter)", rows)
+
+
+if __name__ == "__main__":
+    main()
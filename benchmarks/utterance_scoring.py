@@ -0,0 +1,57 @@
+"""Utterance scoring per query, textdistance in a Python loop vs UtteranceIndex.
+
+A delegate has UTTERANCES utterances of 3 to 8 words drawn from a made up vocabulary, the query
+is one of them with a typo. The textdistance loop is measured over the first SAMPLE utterances
+and scaled, scoring them all takes tens of seconds.
+"""
+
+import numpy as np
+import textdistance
+
+from . import common
+from main.Utterance import UtteranceIndex
+
+
+UTTERANCES = 20000
+SAMPLE = 500
+SYLLABLES = ["ka", "lo", "mi", "ren", "ta", "po", "su", "vi", "de", "na", "tor", "bel", "gra"]
+SYLLABLES += ["fu", "che", "wan", "zo", "ix"]
+
+
+def make_utterances():
+    random = np.random.default_rng(0)
+    words = ["".join(random.choice(SYLLABLES, random.integers(1, 4))) for _ in range(3000)]
+    return [" ".join(random.choice(words, random.integers(3, 9))) for _ in range(UTTERANCES)]
+
+
+def main():
+    utterances = make_utterances()
+    query = utterances[7][:-2] + "x"
+    index = UtteranceIndex(utterances)
+    expected = [textdistance.levenshtein.normalized_similarity(query, t) for t in utterances]
+    assert index.scores(query).tolist() == expected
+    ranked = sorted(range(UTTERANCES), key=lambda i: (-expected[i], i))
+    rows = []
+
+    def loop():
+        for text in utterances[:SAMPLE]:
+            textdistance.levenshtein.normalized_similarity(query, text)
+
+    legacy = common.measure(loop, 3) * UTTERANCES / SAMPLE
+    rows.append(("textdistance loop", f"{legacy / 1000:10.1f} ms"))
+    scores = common.measure(lambda: index.scores(query), 20)
+    rows.append(("bit-parallel, all utterances", f"{scores / 1000:10.1f} ms"))
+
+    index.postings
+    bounds = index.bounds(query)
+    for k in (1, 10):
+        assert index.top(query, k) == [(i, expected[i]) for i in ranked[:k]]
+        top = common.measure(lambda: index.top(query, k), 20)
+        candidates = int((bounds >= expected[ranked[k - 1]]).sum())
+        rows.append((f"n-gram pruning + top {k}", f"{top / 1000:10.1f} ms"))
+        rows.append((f"  candidates left for top {k}", f"{candidates:10d}"))
+    common.report(f"Utterance scoring per query ({UTTERANCES} utterances)", rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,33 @@
+import os
+
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class CoreConfig(AppConfig):
     name = 'core'
+
+    def ready(self):
+        import core.signals
+        from main import Nlp
+
+        Nlp.DOC_CACHE.max_docs = settings.NLP_DOC_CACHE_SIZE
+        Nlp.DOC_CACHE.memory_budget = settings.NLP_DOC_CACHE_MEMORY
+        if getattr(settings, "NLP_BATCHING", False):
+            Nlp.enable_batching(max_batch=settings.NLP_BATCH_SIZE, max_wait=settings.NLP_BATCH_WAIT)
+        if getattr(settings, "NLP_WARM_UP", False):
+            from main.matcher import get_intent_index
+
+            Nlp.MODELS.warm_up(settings.NLP_MODELS)
+            for name in settings.NLP_MODELS:
+                if name in Nlp.MODELS:
+                    get_intent_index(Nlp.MODELS.get(name).vocab)
+
+        if os.path.exists(os.path.join(settings.INTENT_MODEL_PATH, "meta.json")):
+            from main import IntentModel
+
+            IntentModel.warm_up(settings.INTENT_MODEL_PATH)
+
+        from main import SkillIndex
+
+        SkillIndex.warm_up(settings.SKILL_INDEX_PATH)
@@ -0,0 +1,30 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.models import SkillStore
+from core.signals import skill_utterances
+from main.SkillIndex import rebuild_skill_index
+
+
+class Command(BaseCommand):
+    help = "Rebuild the skill routing index from the published skills of the SkillStore"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--output", default=settings.SKILL_INDEX_PATH)
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        published = SkillStore.objects.filter(state=SkillStore.STATE_PUBLISHED).order_by("id")
+        index = rebuild_skill_index(
+            ((skill.package, skill_utterances(skill)) for skill in published.iterator()),
+            options["output"],
+        )
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Indexed {len(index)} skills, {len(index.vectors)} utterances in "
+                f"{time.perf_counter() - start:.1f}s, written to {options['output']}"
+            )
+        )
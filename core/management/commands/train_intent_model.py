@@ -0,0 +1,36 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from main.IntentModel import FORMAT_VERSION, IntentModel, load_training_data
+
+
+class Command(BaseCommand):
+    help = "Train the intent model of UtteranceDistance and write its artifact"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--data", required=True, help="Rasa markdown or JSON file")
+        parser.add_argument("--output", default=settings.INTENT_MODEL_PATH)
+        parser.add_argument("--epochs", type=int, default=settings.INTENT_MODEL_EPOCHS)
+
+    def handle(self, *args, **options):
+        try:
+            examples = load_training_data(options["data"])
+        except OSError as e:
+            raise CommandError(f"Failed to read training data: {e}")
+
+        start = time.perf_counter()
+        try:
+            model = IntentModel.train(examples, epochs=options["epochs"])
+        except ValueError as e:
+            raise CommandError(str(e))
+        model.save(options["output"])
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Trained {len(model.intents)} intents on {model.meta['examples']} examples in "
+                f"{time.perf_counter() - start:.1f}s, format {FORMAT_VERSION} model written to "
+                f"{options['output']}"
+            )
+        )
@@ -0,0 +1,31 @@
+# Generated by Django 3.0.4 on 2026-10-18 09:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_keycloakrealm_public_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChannelStateRecord',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('user_id', models.CharField(max_length=128)),
+                ('operator_id', models.CharField(max_length=128)),
+                ('channel_id', models.CharField(max_length=128)),
+                ('skill', models.TextField(null=True)),
+                ('block_id', models.CharField(max_length=128, null=True)),
+                ('data', models.TextField(default='{}')),
+                ('extra', models.TextField(default='{}')),
+                ('kwargs', models.TextField(default='{}')),
+                ('updated', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'unique_together': {('user_id', 'operator_id', 'channel_id')},
+            },
+        ),
+    ]
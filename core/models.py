@@ -730,6 +730,37 @@ class SkillStore(models.Model):
         return self.name
 
 
+class ChannelStateRecord(models.Model):
+    """State of a conversation channel, stored by core.state.DjangoStateStore.
+
+    Every part of main.State.ChannelState has its own column so a save only writes the parts
+    that changed, see Model.save(update_fields=...).
+
+    Attributes:
+        skill (str): JSON reference to the running skill, null when no skill runs.
+        block_id (str): Id of the current block of the skill.
+        data (str): JSON object with the values collected by the skill.
+        extra (str): JSON object with extra values of the skill.
+        kwargs (str): JSON object with any other value of the state.
+    """
+
+    user_id = models.CharField(max_length=128)
+    operator_id = models.CharField(max_length=128)
+    channel_id = models.CharField(max_length=128)
+    skill = models.TextField(null=True)
+    block_id = models.CharField(max_length=128, null=True)
+    data = models.TextField(default="{}")
+    extra = models.TextField(default="{}")
+    kwargs = models.TextField(default="{}")
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ("user_id", "operator_id", "channel_id")
+
+    def __str__(self):
+        return f"{self.operator_id}:{self.user_id}:{self.channel_id}"
+
+
 class Stack(models.Model):
     """This class asynchronously creates and setups customers stack. A stack includes a keycloak
     realm, a gitlab pipeline and project, and a django server.
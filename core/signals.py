@@ -1,11 +1,71 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+
 from contrib.keycloak import MasterRealmController
-from core.models import KeycloakRealm
-from django.db.models.signals import post_delete
+from core.models import SkillStore
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models.signals import post_delete, post_save
+from main import Log
+from main.Skill import SKILL_CACHE
+
+# one worker, the index updates are applied in the order of the commits
+_index_updates = ThreadPoolExecutor(max_workers=1, thread_name_prefix="SkillIndex")
 
 
 def on_realm_deleted(sender, instance, *args, **kwargs):
+    """Delete the realm of a KeycloakRealm in Keycloak.
+
+    Not connected: deleting a KeycloakRealm row must not delete the realm of the Keycloak server,
+    connect it with post_delete.connect(on_realm_deleted, sender=KeycloakRealm) where it should."""
     mc = MasterRealmController()
     mc.delete_realm(instance.realm)
 
 
-post_delete.connect(on_realm_deleted, sender=KeycloakController)
+def skill_utterances(instance):
+    """Return the utterances of a SkillStore row, none when its data isn't a skill."""
+    try:
+        return json.loads(instance.data or "{}").get("utterances", [])
+    except (ValueError, AttributeError):
+        return []
+
+
+def index_skill(package, path=None):
+    """Bring the package in the skill routing index in step with the SkillStore.
+
+    The last published row of the package gives its utterances, like rebuild_skill_index, the
+    package is removed when none is published. A failure is logged, the rebuild_skill_index
+    command brings the index back in step."""
+    from main.SkillIndex import get_skill_index, update_skill_index
+
+    path = path or settings.SKILL_INDEX_PATH
+    try:
+        skill = (
+            SkillStore.objects.filter(package=package, state=SkillStore.STATE_PUBLISHED)
+            .order_by("-id")
+            .first()
+        )
+        if skill is not None:
+            update_skill_index(package, skill_utterances(skill), path)
+        elif package in get_skill_index(path):
+            update_skill_index(package, [], path)
+    except Exception as e:
+        Log.error("index_skill", f"{package} not indexed: {e!r}")
+    finally:
+        connection.close()
+
+
+def on_skill_store_changed(sender, instance, *args, **kwargs):
+    """Update the skill routing index of the package once the change is committed, see
+    index_skill and main.SkillIndex.
+
+    The update runs in the background, embedding the utterances loads the NLP model and the save
+    doesn't wait for it."""
+    package, path = instance.package, settings.SKILL_INDEX_PATH
+    transaction.on_commit(lambda: _index_updates.submit(index_skill, package, path))
+    # a skill published again under the same version must not be served from the cache
+    transaction.on_commit(lambda: SKILL_CACHE.invalidate(package))
+
+
+post_save.connect(on_skill_store_changed, sender=SkillStore)
+post_delete.connect(on_skill_store_changed, sender=SkillStore)
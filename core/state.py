@@ -0,0 +1,147 @@
+"""Channel states stored with the Django ORM, see main.State.StateStore."""
+
+from collections import OrderedDict
+import json
+import threading
+
+from django.utils import timezone
+
+from main import Constant
+from main.State import StateStore
+
+from .models import ChannelStateRecord
+
+
+STATE_FIELDS = ("skill", "block_id", "data", "extra")
+
+
+def _columns(state_dict):
+    """Return the column values of ChannelStateRecord for a state dictionary."""
+    kwargs = {
+        key: value
+        for key, value in state_dict.items()
+        if key not in STATE_FIELDS and key not in ("user_id", "operator_id", "channel_id")
+    }
+    skill = state_dict.get("skill")
+    return {
+        "skill": json.dumps(skill) if skill is not None else None,
+        "block_id": state_dict.get("block_id"),
+        "data": json.dumps(state_dict.get("data") or {}),
+        "extra": json.dumps(state_dict.get("extra") or {}),
+        "kwargs": json.dumps(kwargs),
+    }
+
+
+class DjangoStateStore(StateStore):
+    """Keeps the states in ChannelStateRecord rows.
+
+    The columns of the rows loaded or saved by the process are remembered (for the max_size most
+    recent channels), a save then only updates the columns that changed and writes nothing when
+    the state didn't change. save_delta decodes and writes only the columns its changes touch.
+    Rows the process doesn't know, or that were deleted since, are inserted or updated as a
+    whole.
+
+    Attributes:
+        writes (int): Number of rows inserted or updated.
+    """
+
+    def __init__(self, max_size=Constant.STATE_CACHE_SIZE):
+        self.max_size = max_size
+        self.writes = 0
+        self._known = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _filter(key):
+        user_id, operator_id, channel_id = map(str, key)
+        return {"user_id": user_id, "operator_id": operator_id, "channel_id": channel_id}
+
+    def load(self, key):
+        record = ChannelStateRecord.objects.filter(**self._filter(key)).first()
+        if record is None:
+            self._forget(key)
+            return None
+        columns = {field: getattr(record, field) for field in (*STATE_FIELDS, "kwargs")}
+        self._remember(key, record.pk, columns)
+        return {
+            "user_id": record.user_id,
+            "operator_id": record.operator_id,
+            "channel_id": record.channel_id,
+            "skill": json.loads(record.skill) if record.skill is not None else None,
+            "block_id": record.block_id,
+            "data": json.loads(record.data),
+            "extra": json.loads(record.extra),
+            **json.loads(record.kwargs),
+        }
+
+    def save(self, key, state_dict):
+        columns = _columns(state_dict)
+        with self._lock:
+            known = self._known.get(key)
+        if known is not None:
+            pk, previous = known
+            changed = [field for field, value in columns.items() if previous.get(field) != value]
+            if not changed:
+                return
+            values = {field: columns[field] for field in changed}
+            # same UPDATE as save(update_fields=changed), without failing when the row is gone
+            if ChannelStateRecord.objects.filter(pk=pk).update(**values, updated=timezone.now()):
+                self.writes += 1
+                self._remember(key, pk, columns)
+                return
+            self._forget(key)
+
+        record, _ = ChannelStateRecord.objects.update_or_create(
+            **self._filter(key), defaults=columns
+        )
+        self.writes += 1
+        self._remember(key, record.pk, columns)
+
+    def save_delta(self, key, delta):
+        if delta.snapshot is not None:
+            self.save(key, delta.snapshot)
+            return True
+        if not delta:
+            return True
+        with self._lock:
+            known = self._known.get(key)
+        if known is None:
+            return False
+
+        # only the columns of the fields the changes touch are decoded and written
+        pk, previous = known
+        touched = {op[1] for op in delta.ops}
+        state_dict = {}
+        for field in touched:
+            value = previous[field]
+            state_dict[field] = json.loads(value) if field != "block_id" and value else value
+        state_dict = delta.apply(state_dict)
+        columns = dict(previous)
+        for field in touched:
+            value = state_dict[field]
+            encode = field != "block_id" and value is not None
+            columns[field] = json.dumps(value) if encode else value
+        values = {field: columns[field] for field in touched if columns[field] != previous[field]}
+        if not values:
+            return True
+        if not ChannelStateRecord.objects.filter(pk=pk).update(**values, updated=timezone.now()):
+            self._forget(key)
+            return False
+        self.writes += 1
+        self._remember(key, pk, columns)
+        return True
+
+    def delete(self, key):
+        self._forget(key)
+        ChannelStateRecord.objects.filter(**self._filter(key)).delete()
+
+    def _remember(self, key, pk, columns):
+        with self._lock:
+            self._known[key] = (pk, columns)
+            self._known.move_to_end(key)
+            while len(self._known) > self.max_size:
+                self._known.popitem(last=False)
+
+    def _forget(self, key):
+        with self._lock:
+            self._known.pop(key, None)
@@ -6,6 +6,8 @@
 
 import abc
 from abc import ABC, abstractmethod
+import asyncio
+from contextlib import asynccontextmanager, contextmanager
 import json
 import base64
 from deprecated import deprecated
@@ -13,11 +15,21 @@ import urllib.parse as urlparse
 
 from contrib.exceptions import JsonRPCException
 
-from . import Flag, Log
+from . import Constant, Flag, Log
 from .Component import PaymentProvider, state_from_response, user_id_from_state
 from .Flag import FlagManager
-from .Processor import StartSkill, SkillProcessor # ,CancelSkill, StandardInput,
-from .Statement import InputStatement
+from .Processor import (
+    AsyncSkillProcessor,
+    AsyncStartSkill,
+    SkillProcessor,
+    StartSkill,
+    async_standard_input,
+    cancel_skill,
+    standard_input,
+)
+from .Skill import SKILL_CACHE, is_reference
+from .State import StateSession
+from .Statement import InputStatement, OutputBuffer
 from .Block import (
     get_block_by_id,
     DataExchange,
@@ -35,6 +47,7 @@ from .Block import (
     InputSkill,
     InputText,
     InterpreterSkill,
+    ParallelBlock,
     PromptBinary,
     PromptChatPlatform,
     PromptDate,
@@ -77,7 +90,7 @@ class BlockType:
         InputText,
     ]
 
-    INTERPRETER_BLOCKS = [InterpreterSkill]
+    INTERPRETER_BLOCKS = [InterpreterSkill, ParallelBlock]
 
     DATA_EXCHANGE = [DataExchange]
 
@@ -113,10 +126,10 @@ def get_component(query, filter):
 
 def get_connections(component_name, properties):
     reg = Registry()
-    for block in reg.blocks:
-        if block.__module__ + "." + block.__name__ == component_name:
-            block_object = block(None, None, None, None)
-            return block_object.get_connections(properties)
+    block = reg.get_block_class(component_name)
+    if block is not None:
+        block_object = block(context=None, id=None, properties=None, connections=None)
+        return block_object.get_connections(properties)
     return None
 
 
@@ -157,6 +170,14 @@ def validate_skill(skill):
     return True
 
 
+def follow_skill_version(state, skill):
+    """Point the state to the version of its skill that was loaded, e.g. after a new publish."""
+    reference = state.skill
+    if skill is not None and is_reference(reference):
+        if reference.get("version") != skill["version"]:
+            state.skill = {"package": skill.get("package"), "version": skill["version"]}
+
+
 class Registry:
     def __init__(self):
         self.blocks = []
@@ -167,11 +188,28 @@ class Registry:
         self.blocks.extend(BlockType.INTERPRETER_BLOCKS)
         self.blocks.extend(BlockType.DATA_EXCHANGE)
         self.blocks.extend(BlockType.OTHER_BLOCKS)
+        self._block_table = {}
+        self._block_key = ()
 
     def register(self, object):
         self.components.append(object)
         pass
 
+    def get_block_class(self, component_name):
+        """Return the block class for a component name, e.g. "main.Block.PromptText"."""
+        if len(self._block_table) != len(self.blocks):
+            self._block_table = {
+                item.__module__ + "." + item.__name__: item for item in self.blocks
+            }
+        return self._block_table.get(component_name)
+
+    def block_key(self):
+        """Return the registered block classes, registries with the same blocks share compiled
+        skills, see main.Skill.compile_skill."""
+        if len(self._block_key) != len(self.blocks):
+            self._block_key = tuple(self.blocks)
+        return self._block_key
+
     def get_component(self, binder, component_name):
         for item in self.components:
             item_name = item.__module__ + "." + item.__name__
@@ -179,6 +217,13 @@ class Registry:
                 config = binder.on_get_component_config(item_name)
                 return item(config)
 
+    def get_data_exchange(self, binder, component_name):
+        """Return the registered data exchange function, called by main.Block.DataExchange."""
+        for item in self.components:
+            item_name = item.__module__ + "." + item.__name__
+            if item_name == component_name:
+                return item
+
     def payment_providers(self, binder):
         array_list = []
         for item in self.components:
@@ -196,6 +241,14 @@ class Binder(ABC):
         self.oauth_redirect_url = kwargs.get("OAUTH_REDIRECT_URL")
         self.payment_redirect_url = kwargs.get("PAYMENT_REDIRECT_URL")
         self.html_render_url = kwargs.get("HTML_RENDER_URL")
+        self.max_steps_per_turn = kwargs.get("MAX_STEPS_PER_TURN", Constant.MAX_STEPS_PER_TURN)
+        self.max_time_per_turn = kwargs.get("MAX_TIME_PER_TURN", Constant.MAX_TIME_PER_TURN)
+        self.output_mode = kwargs.get("OUTPUT_MODE", Constant.OUTPUT_COALESCE)
+        # skip on_cancel_intent for answers without any intent keyword, see main.Flag
+        self.intent_prefilter = kwargs.get("INTENT_PREFILTER", False)
+        self.session = None
+        self.last_session = None
+        self.output = None
 
         pass
 
@@ -235,32 +288,114 @@ class Binder(ABC):
     def on_save_state(self, state_json):
         pass
 
+    # receives the changes of the state since it was loaded, see main.State.ChannelState.delta,
+    # override to write them as a partial update
+    def on_save_state_delta(self, state, delta):
+        if delta:
+            self.on_save_state(state.serialize())
+
     # should return json
     @abc.abstractmethod
     def on_get_skill(self, package):
         pass
 
+    # statement.analysis holds the parsed text, shared with the blocks processing the statement
     @abc.abstractmethod
     def on_cancel_intent(self, statement):
         pass
 
+    # returns the package of the skill to start, see main.SkillIndex for a routing index
     @abc.abstractmethod
     def on_skill_intent(self, statement):
         pass
 
-    # send new message
+    # returns the state of the current turn, see state_session
+    def load_state(self):
+        if self.session:
+            return self.session.load()
+        return self.on_load_state()
+
+    # saves the state, within a session it's written once when the turn ends
+    def save_state(self, state):
+        if self.session:
+            self.session.save(state)
+        else:
+            self.on_save_state_delta(state, state.delta())
+            state.mark_saved()
+
+    @contextmanager
+    def state_session(self):
+        """Share one ChannelState between every load_state/save_state call of a turn.
+
+        The state is written when the outermost session exits without error. The session is kept
+        in last_session afterwards, its counters tell how many backend calls the turn made.
+        """
+        if self.session:
+            yield self.session
+            return
+
+        self.session = StateSession(self)
+        try:
+            yield self.session
+            self.session.flush()
+        finally:
+            self.last_session = self.session
+            self.session = None
+
+    # returns the skill definition referenced by the state
+    def load_skill(self, state):
+        skill = SKILL_CACHE.resolve(state.skill, self.on_get_skill)
+        follow_skill_version(state, skill)
+        return skill
+
+    # send new message, within an output buffer it's sent when the block or the turn ends
     def post_message(self, statement):
-        self.on_post_message(statement)
+        if self.output is not None:
+            self.output.post(statement)
+            if self.output.immediate:
+                self.flush_output()
+        else:
+            self.on_post_message(statement)
+
+    def flush_output(self):
+        """Send the pending messages when the output is streamed."""
+        if self.output is not None:
+            for statement in self.output.checkpoint():
+                self.on_post_message(statement)
+
+    @contextmanager
+    def output_buffer(self):
+        """Collect the messages posted during a turn.
+
+        With OUTPUT_MODE set to Constant.OUTPUT_COALESCE (the default) the turn posts a single
+        OutputStatement when the outermost buffer exits without error. With
+        Constant.OUTPUT_STREAM the messages of each block are posted after the block, see
+        flush_output, and with Constant.OUTPUT_NODES the new nodes of a statement are posted as
+        soon as the statement is.
+        """
+        if self.output is not None:
+            yield self.output
+            return
+
+        self.output = OutputBuffer(self.output_mode)
+        try:
+            yield self.output
+            pending = self.output.take()
+        finally:
+            self.output = None
+        for statement in pending:
+            self.on_post_message(statement)
 
     def search_query(self, query=None):
-        state = self.on_load_state()
-        if state.is_active():
-            user_id = state.user_id
-            client = get_block_by_id(self, state.skill, state.block_id)
-            items = client.on_search(self, user_id, query)
-            return items
-        else:
-            pass
+        with self.state_session():
+            state = self.load_state()
+            if state.is_active():
+                user_id = state.user_id
+                client = get_block_by_id(self, self.load_skill(state), state.block_id)
+                items = client.on_search(self, user_id, query)
+                return items
+            else:
+                pass
         return []
 
     @deprecated(version="1.0.0", reason="You should use notify_request function")
@@ -283,18 +418,244 @@ class Binder(ABC):
     def select_processor(self, input):
         if input.text:
             Log.message("Message", input.text, True)
-        # get flag from input
-        flag_manager = FlagManager()
-        statement, flag = flag_manager.load(self, input)
-        Log.debug("Flag Detection", flag)
-        Log.debug("Statement", statement)
-
-        # based on flag select processor
-        if flag == Flag.FLAG_START_SKILL:
-            StartSkill().on_process(self, statement)
-        elif flag == Flag.FLAG_SKILL_PROCESSOR:
-            SkillProcessor().on_process(self, statement)
-        elif flag == Flag.FLAG_CANCEL_SKILL:
-            CancelSkill().on_process(self, statement)
-        else:
-            StandardInput().on_process(self, statement)
+        # the state is written before the messages of the turn are sent
+        with self.output_buffer(), self.state_session():
+            # get flag from input
+            flag_manager = FlagManager()
+            statement, flag = flag_manager.load(self, input)
+            Log.debug("Flag Detection", flag)
+            Log.debug("Statement", statement)
+
+            # based on flag select processor
+            if flag == Flag.FLAG_START_SKILL:
+                StartSkill().on_process(self, statement)
+            elif flag == Flag.FLAG_SKILL_PROCESSOR:
+                SkillProcessor().on_process(self, statement)
+            elif flag == Flag.FLAG_CANCEL_SKILL:
+                cancel_skill(self)
+            else:
+                standard_input(self, statement)
+
+
+class AsyncBinder(Binder):
+    """Binder for the asyncio skill engine.
+
+    The state, message, skill and intent hooks are coroutines, so one event loop can serve many
+    conversations at once. select_processor, search_query and notify_request must be awaited.
+
+    Blocks stay synchronous: within a turn the state is loaded before any block runs and
+    written after the last one (see StateSession), messages posted by a block are buffered and
+    sent with async_flush_output, and blocks calling components run in a worker thread.
+    """
+
+    def __init__(self, registry, **kwargs):
+        super().__init__(registry, **kwargs)
+        self.loop = None
+        self.outbox = None
+
+    @abc.abstractmethod
+    async def on_standard_input(self, input, output):
+        pass
+
+    @abc.abstractmethod
+    async def on_post_message(self, statement):
+        pass
+
+    @abc.abstractmethod
+    async def on_load_state(self):
+        pass
+
+    @abc.abstractmethod
+    async def on_save_state(self, state_json):
+        pass
+
+    async def on_save_state_delta(self, state, delta):
+        if delta:
+            await self.on_save_state(state.serialize())
+
+    @abc.abstractmethod
+    async def on_get_skill(self, package):
+        pass
+
+    @abc.abstractmethod
+    async def on_cancel_intent(self, statement):
+        pass
+
+    @abc.abstractmethod
+    async def on_skill_intent(self, statement):
+        pass
+
+    def load_state(self):
+        if not self.session:
+            raise RuntimeError("AsyncBinder.load_state must be called within async_state_session")
+        return self.session.load()
+
+    def load_skill(self, state):
+        # the skill was cached by async_load_skill before the blocks run
+        return SKILL_CACHE.resolve(state.skill)
+
+    async def async_load_skill(self, state):
+        skill = SKILL_CACHE.resolve(state.skill)
+        if skill is None and state.skill is not None:
+            loaded = await self.on_get_skill(state.skill.get("package"))
+            skill = SKILL_CACHE.resolve(state.skill, lambda package: loaded)
+        follow_skill_version(state, skill)
+        return skill
+
+    def post_message(self, statement):
+        if self.output is None:
+            raise RuntimeError("AsyncBinder.post_message must be called within async_output_buffer")
+        self.output.post(statement)
+        if self.output.immediate:
+            # blocking blocks post from a worker thread, the sender task runs on the loop
+            for statement in self.output.take():
+                self.loop.call_soon_threadsafe(self.outbox.put_nowait, statement)
+
+    async def _send_output(self):
+        while True:
+            statement = await self.outbox.get()
+            if statement is None:
+                return
+            await self.on_post_message(statement)
+
+    async def async_flush_output(self):
+        """Same as flush_output, sends the messages of the last block when streaming."""
+        if self.output is not None:
+            for statement in self.output.checkpoint():
+                await self.on_post_message(statement)
+
+    @asynccontextmanager
+    async def async_output_buffer(self):
+        """Same as output_buffer, the messages are sent on exit.
+
+        With Constant.OUTPUT_NODES a task sends the messages while the blocks keep running.
+        """
+        if self.output is not None:
+            yield self.output
+            return
+
+        self.output = OutputBuffer(self.output_mode)
+        sender = None
+        if self.output.immediate:
+            self.loop = asyncio.get_running_loop()
+            self.outbox = asyncio.Queue()
+            sender = asyncio.create_task(self._send_output())
+        try:
+            yield self.output
+            pending = self.output.take()
+        finally:
+            self.output = None
+            if sender is not None:
+                self.outbox.put_nowait(None)
+                await sender
+        for statement in pending:
+            await self.on_post_message(statement)
+
+    @asynccontextmanager
+    async def async_state_session(self):
+        """Same as state_session, the state is loaded on entry and written on exit."""
+        if self.session:
+            yield self.session
+            return
+
+        self.session = StateSession(self)
+        try:
+            await self.session.async_load()
+            yield self.session
+            await self.session.async_flush()
+        finally:
+            self.last_session = self.session
+            self.session = None
+
+    async def search_query(self, query=None):
+        async with self.async_state_session():
+            state = self.load_state()
+            if state.is_active():
+                user_id = state.user_id
+                client = get_block_by_id(self, await self.async_load_skill(state), state.block_id)
+                return await asyncio.to_thread(client.on_search, self, user_id, query)
+        return []
+
+    async def notify_request(self, authorization_response, **kwargs):
+        state = state_from_response(authorization_response, **kwargs)
+        user_id = user_id_from_state(state)
+        if user_id:
+            input_input = authorization_response
+            input_flag = Flag.FLAG_STANDARD_INPUT
+            input = InputStatement(user_id, input=input_input, flag=input_flag)
+            await self.select_processor(input)
+
+    async def select_processor(self, input):
+        if input.text:
+            Log.message("Message", input.text, True)
+        async with self.async_output_buffer(), self.async_state_session():
+            # get flag from input
+            flag_manager = FlagManager()
+            statement, flag = await flag_manager.async_load(self, input)
+            Log.debug("Flag Detection", flag)
+            Log.debug("Statement", statement)
+
+            # based on flag select processor
+            if flag == Flag.FLAG_START_SKILL:
+                await AsyncStartSkill().on_process(self, statement)
+            elif flag == Flag.FLAG_SKILL_PROCESSOR:
+                await AsyncSkillProcessor().on_process(self, statement)
+            elif flag == Flag.FLAG_CANCEL_SKILL:
+                cancel_skill(self)
+            else:
+                await async_standard_input(self, statement)
+
+
+class SyncBinderAdapter(AsyncBinder):
+    """Runs an existing synchronous Binder on the asyncio engine.
+
+    The blocking hooks of the wrapped binder run in a worker thread, the others are called
+    directly.
+    """
+
+    def __init__(self, binder):
+        super().__init__(binder.get_registry())
+        self.binder = binder
+        self.oauth_redirect_url = binder.oauth_redirect_url
+        self.payment_redirect_url = binder.payment_redirect_url
+        self.html_render_url = binder.html_render_url
+        self.max_steps_per_turn = binder.max_steps_per_turn
+        self.max_time_per_turn = binder.max_time_per_turn
+        self.output_mode = binder.output_mode
+        self.intent_prefilter = binder.intent_prefilter
+
+    def on_load_oauth_token(self, component, user_id):
+        return self.binder.on_load_oauth_token(component, user_id)
+
+    def on_save_oauth_token(self, component, user_id, token):
+        return self.binder.on_save_oauth_token(component, user_id, token)
+
+    def on_context(self):
+        return self.binder.on_context()
+
+    def on_get_component_config(self, component):
+        return self.binder.on_get_component_config(component)
+
+    async def on_standard_input(self, input, output):
+        return await asyncio.to_thread(self.binder.on_standard_input, input, output)
+
+    async def on_post_message(self, statement):
+        return await asyncio.to_thread(self.binder.on_post_message, statement)
+
+    async def on_load_state(self):
+        return await asyncio.to_thread(self.binder.on_load_state)
+
+    async def on_save_state(self, state_json):
+        return await asyncio.to_thread(self.binder.on_save_state, state_json)
+
+    async def on_save_state_delta(self, state, delta):
+        return await asyncio.to_thread(self.binder.on_save_state_delta, state, delta)
+
+    async def on_get_skill(self, package):
+        return await asyncio.to_thread(self.binder.on_get_skill, package)
+
+    async def on_cancel_intent(self, statement):
+        return await asyncio.to_thread(self.binder.on_cancel_intent, statement)
+
+    async def on_skill_intent(self, statement):
+        return await asyncio.to_thread(self.binder.on_skill_intent, statement)
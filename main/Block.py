@@ -1,13 +1,18 @@
 from abc import ABC, abstractmethod
+from concurrent.futures import Future
+import copy
 import datetime
 import random
 import re
-import spacy
+import threading
+import time
 from typing import List, Tuple, Union
 from durations import Duration
 from jinja2 import Template
+import numpy as np
 
-from . import Log
+from . import Constant, Log
+from .Nlp import get_nlp, selection_vectors
 from .Node import (
     BinaryNode,
     DateNode,
@@ -55,16 +60,10 @@ def load_blocks_from_json(block_json):
     return blocks
 
 def get_block_by_id(binder, skill, block_id):
-    block_data = next((item for item in skill["blocks"] if item["id"] == block_id), None)
-    if block_data is None:
-        raise BlockNotFoundException(f"Block not found for id: {block_id}")
-    component = block_data["component"]
-    blocks = [b for b in binder.get_registry().blocks if f"{b.__module__}.{b.__name__}" == component]
-    if not blocks:
-        raise ComponentNotFoundException(f"Component not found for id: {block_id}")
-    block = blocks[0]
-    connections = block_data.get("connections")
-    return block(binder.on_context(), block_data["id"], block_data["properties"], connections)
+    from .Skill import compile_skill
+
+    compiled = compile_skill(skill, binder.get_registry())
+    return compiled.get_block(binder.on_context(), block_id)
 
 
 def get_block_by_property(binder, skill, key_name, key_value):
@@ -77,7 +76,23 @@ def get_block_by_property(binder, skill, key_name, key_value):
     return block_obj
 
 
+def index_properties(properties):
+    """Return a dict mapping property names to values, the first property wins on duplicates."""
+    if not properties:
+        return {}
+    return {prop["name"]: prop["value"] for prop in reversed(properties)}
+
+
+def index_connections(connections):
+    """Return a dict mapping connection codes to target block ids."""
+    if not connections:
+        return {}
+    return {item[0]: item[1] for item in reversed(connections)}
+
+
 class BlockResult:
+    __slots__ = ("block", "code", "connection")
+
     def __init__(self, block, code, connection):
         self.block = block
         self.code = code
@@ -92,21 +107,71 @@ class BlockResult:
 
     def post_skill(self):
         if isinstance(self.block, TerminalBlock):
-            return self.block.post_skill()
+            return self.block.post_skill
 
 
 class BaseBlock(ABC):
+    """Base class of all blocks.
+
+    Blocks are constructed on every turn, so they use __slots__ (subclasses must declare their
+    own __slots__ too) and index their properties and connections once at construction. The
+    indexes can be passed in as values and targets to share them between instances, see
+    main.Skill.CompiledSkill.
+    """
+
+    __slots__ = (
+        "context",
+        "id",
+        "properties",
+        "connections",
+        "_values",
+        "_targets",
+        "_template_properties",
+    )
+
+    # blocks calling components (I/O) or the NLP (CPU) would stall the event loop,
+    # main.Binder.AsyncBinder runs them in a thread
+    blocking = False
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.component = f"{cls.__module__}.{cls.__name__}"
+
     def __init__(self, **kwargs):
-        self.component = f"{self.__class__.__module__}.{self.__class__.__name__}"
         self.context = kwargs.get('context')
         self.id = kwargs.get('id')
         self.properties = kwargs.get('properties')
         self.connections = kwargs.get('connections')
-        self.template_properties = []
-        self.load_template()
-        # should call after load template
+        values = kwargs.get('values')
+        if values is None:
+            values = index_properties(self.properties)
+        self._values = values
+        targets = kwargs.get('targets')
+        if targets is None:
+            targets = index_connections(self.connections)
+        self._targets = targets
         self.on_init()
 
+    @classmethod
+    def get_template(cls):
+        """Return the template properties of the block class.
+
+        The template is only needed by the skill builder, so it's built on first use by running
+        load_template on a bare instance and cached on the class. Don't modify the returned list.
+        """
+        template = cls.__dict__.get("_template")
+        if template is None:
+            builder = cls.__new__(cls)
+            builder._template_properties = []
+            builder.load_template()
+            template = builder._template_properties
+            cls._template = template
+        return template
+
+    @property
+    def template_properties(self):
+        return self.get_template()
+
     # use this method as constructor
     def on_init(self):
         """Initialize the block with default values"""
@@ -126,13 +191,10 @@ class BaseBlock(ABC):
 
     def property_value(self, key: str):
         """Return the value of the property with the given key"""
-        return next((prop["value"] for prop in self.properties if prop["name"] == key), None)
+        return self._values.get(key)
 
     def find_connection(self, code):
-        if self.connections:
-            for item in self.connections:
-                if item[0] == code:
-                    return item[1]
+        return self._targets.get(code)
 
     def move(self):
         return BlockResult.status(self, BLOCK_MOVE, self.find_connection(BLOCK_MOVE))
@@ -160,11 +222,14 @@ class BaseBlock(ABC):
     def on_descriptor(self):
         pass
 
+    # these methods should only be called from load_template
     def append_template_properties(self, properties):
-        self.template_properties.extend(properties)
+        self._template_properties.extend(properties)
 
     def remove_template_properties(self, name):
-        self.template_properties[:] = [item for item in self.template_properties if item["name"] != name]
+        self._template_properties[:] = [
+            item for item in self._template_properties if item["name"] != name
+        ]
 
     def get_connections(self, properties):
         return []
@@ -179,6 +244,8 @@ class BaseBlock(ABC):
 
 
 class InputBlock(BaseBlock):
+    __slots__ = ()
+
     @abstractmethod
     def on_process(self, binder, user_id, statement):
         return self.reject()
@@ -244,6 +311,8 @@ class InputBlock(BaseBlock):
         return super().on_search(binder, user_id, query, **kwargs)
 
 class DecisionBlock(InputBlock):
+    __slots__ = ()
+
     def on_descriptor(self):
         return {
             "name": "Decision Block",
@@ -302,6 +371,8 @@ class DecisionBlock(InputBlock):
 
 
 class GoToBlock(InputBlock):
+    __slots__ = ()
+
     def before_process(self, binder, operator_id):
         pass
 
@@ -347,6 +418,8 @@ class GoToBlock(InputBlock):
         )
 
 class InputDate(InputBlock):
+    __slots__ = ()
+
     def on_descriptor(self):
         return {"name": "Date Input", "summary": "No description available", "category": "input"}
 
@@ -362,6 +435,8 @@ class InputDate(InputBlock):
 
 
 class InputDateTime(InputBlock):
+    __slots__ = ()
+
     def on_descriptor(self):
         return {
             "name": "Date time Input",
@@ -381,6 +456,8 @@ class InputDateTime(InputBlock):
 
 
 class InputDuration(InputBlock):
+    __slots__ = ()
+
     def on_descriptor(self):
         return {
             "name": "Duration Input",
@@ -402,6 +479,8 @@ class InputDuration(InputBlock):
 
 
 class InputEmail(InputBlock):
+    __slots__ = ()
+
     def on_descriptor(self):
         return {
             "name": "Email Input",
@@ -417,6 +496,8 @@ class InputEmail(InputBlock):
         return super().on_process(binder, user_id, statement)
 
 class InputFile(InputBlock):
+    __slots__ = ()
+
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         # self.accept = InputProperty("accept", "string", required=True, description="Valid file extensions")
@@ -461,6 +542,8 @@ class InputFile(InputBlock):
 
 
 class InputNumber(InputBlock):
+    __slots__ = ()
+
     def on_descriptor(self):
         return {"name": "Number Input", "summary": "No description available", "category": "input"}
 
@@ -472,6 +555,9 @@ class InputNumber(InputBlock):
         return super().on_process(binder, user_id, statement)
 
 class InputOAuth(InputBlock):
+    __slots__ = ()
+    blocking = True
+
     def on_descriptor(self):
         return {
             "name": "OAuth Input",
@@ -513,9 +599,8 @@ class InputOAuth(InputBlock):
 
 
 class InputPayment(InputBlock):
-    def on_init(self):
-        super().on_init()
-        self.remove_template_properties("required")
+    __slots__ = ()
+    blocking = True
 
     def on_descriptor(self):
         return {"name": "Payment Input", "summary": "No description available", "category": "input"}
@@ -548,12 +633,16 @@ class InputPayment(InputBlock):
                 }
             ]
         )
+        self.remove_template_properties("required")
 
     def get_connections(self, properties):
         return [[BLOCK_MOVE, "Next"], [BLOCK_REJECT, "Reject"]]
 
 
 class InputSearchable(InputBlock):
+    __slots__ = ()
+    blocking = True
+
     def on_descriptor(self):
         return {
             "name": "Searchable Input",
@@ -564,7 +653,7 @@ class InputSearchable(InputBlock):
     def on_process(self, binder, user_id, input):
         component_name = self.property_value("component")
         component_object = binder.get_registry().get_component(binder, component_name)
-        state = binder.on_load_state()
+        state = binder.load_state()
         package = state.skill["package"]
 
         real_user_id = state.user_id
@@ -573,13 +662,13 @@ class InputSearchable(InputBlock):
         if isinstance(item, str):
             query = item
             item = component_object.on_query_search(
-                binder, real_user_id, package, self, query, skill=state.skill
+                binder, real_user_id, package, self, query, skill=binder.load_skill(state)
             )
         if not item:
             return super().on_process(binder, user_id, input)
 
         valid = component_object.on_verify_input(
-            binder, real_user_id, package, self, item, skill=state.skill
+            binder, real_user_id, package, self, item, skill=binder.load_skill(state)
         )
         if not valid:
             return super().on_process(binder, user_id, input)
@@ -614,11 +703,11 @@ class InputSearchable(InputBlock):
     def on_search(self, binder, user_id, query, **kwargs):
         component_name = self.property_value("component")
         component_object = binder.get_registry().get_component(binder, component_name)
-        state = binder.on_load_state()
+        state = binder.load_state()
         package = state.skill["package"]
 
         result = component_object.on_search(
-            binder, state.user_id, package, self, query, skill=state.skill
+            binder, state.user_id, package, self, query, skill=binder.load_skill(state)
         )
 
         resources = super().on_search(binder, user_id, query, **kwargs)
@@ -626,17 +715,25 @@ class InputSearchable(InputBlock):
         return resources
 
 
-import spacy
-
 class InputSelection(InputBlock):
+    __slots__ = ("_nlp",)
+
+    # matching the answer to the options parses it with spaCy
+    blocking = True
+
     def __init__(self, nlp=None, **kwargs):
         super().__init__(**kwargs)
-        if nlp is None:
+        self._nlp = nlp
+
+    @property
+    def nlp(self):
+        # the model is shared by the process and only loaded when a selection needs it
+        if self._nlp is None:
             try:
-                nlp = spacy.load("en_core_web_sm")
+                self._nlp = get_nlp()
             except IOError as e:
                 Log.error("Exception", e)
-        self.nlp = nlp
+        return self._nlp
 
     def on_descriptor(self):
         return {
@@ -674,7 +771,11 @@ class InputSelection(InputBlock):
         fuzzy_item = self._fuzzy_item(value)
         if fuzzy_item is not None:
             return fuzzy_item
-        augmented_results = self._augment_results(value)
+        # the text of the message is parsed once per turn, see InputStatement.analysis
+        doc = None
+        if value == statement.text and statement.analysis.nlp is self.nlp:
+            doc = statement.analysis.doc
+        augmented_results = self._augment_results(value, doc)
         if augmented_results:
             return augmented_results[0]
         return None
@@ -688,21 +789,19 @@ class InputSelection(InputBlock):
                 return item[0]
         return None
 
-    def _augment_results(self, value):
-        doc = self.nlp(value)
-        tokens = [token for token in doc if not token.is_stop]
-        results = []
-        for index, item in enumerate(self.property_value("selections")):
-            txt, val = item[1], item[0]
-            item_doc = self.nlp(txt)
-            item_tokens = [token for token in item_doc if not token.is_stop]
-            score = doc.similarity(item_doc)
-            for token in tokens:
-                token_score = max(token.similarity(item_token) for item_token in item_tokens)
-                score += token_score
-            score /= len(tokens) + len(item_tokens)
-            results.append((score, val))
-        results.sort(reverse=True)
+    def _vectors(self):
+        # the labels are static, their vectors are computed once per list of labels
+        return selection_vectors(self.nlp, [item[1] for item in self.property_value("selections")])
+
+    def _augment_results(self, value, doc=None):
+        if doc is None:
+            doc = self.nlp(value)
+        vectors = self._vectors()
+        token_scores, count = vectors.token_scores(doc)
+        scores = vectors.doc_scores(doc) + token_scores
+        scores /= np.maximum(count + vectors.token_counts, 1)
+        values = [item[0] for item in self.property_value("selections")]
+        results = sorted(zip(scores.tolist(), values), reverse=True)
         return [result[1] for result in results]
 
     def on_search(self, binder, user_id, query, **kwargs):
@@ -716,18 +815,15 @@ class InputSelection(InputBlock):
         resources.extend(result + fuzzy_results)
         return resources
 
-    def _similarity(self, text1, text2):
-        doc1 = self.nlp(text1)
-        doc2 = self.nlp(text2)
-        return doc1.similarity(doc2)
-
     def _fuzzy_search(self, query):
         results = []
         for index, item in enumerate(self.property_value("selections")):
             txt, val = item[1], item[0]
             if query.lower() in txt.lower():
                 results.append((0, val))
-        results.extend([(self._similarity(query, item[1]), item[0]) for item in self.property_value("selections")])
+        scores = self._vectors().doc_scores(self.nlp(query))
+        values = [item[0] for item in self.property_value("selections")]
+        results.extend(zip(scores.tolist(), values))
         results.sort(reverse=True)
         return [SearchNode.wrap_text(item[1], item[0]) for item in results]
 
@@ -735,6 +831,9 @@ class InputSelection(InputBlock):
 class InputSkill(InputBlock):
     """An input block that passes user input to a skill"""
 
+    __slots__ = ()
+    blocking = True
+
     def on_descriptor(self):
         """Returns a dictionary containing metadata about this input block"""
         return {
@@ -747,7 +846,7 @@ class InputSkill(InputBlock):
         """Processes the user's input statement"""
         component_name = self.property_value("component")
         component_object = binder.get_registry().get_component(binder, component_name)
-        state = binder.on_load_state()
+        state = binder.load_state()
         package = state.skill["package"]
 
         result = component_object.on_execute(
@@ -757,7 +856,7 @@ class InputSkill(InputBlock):
             state.data,
             statement,
             properties=self.properties,
-            skill=state.skill,
+            skill=binder.load_skill(state),
         )
 
         if result:
@@ -787,7 +886,7 @@ class InputSkill(InputBlock):
         """Searches for the user's query"""
         component_name = self.property_value("component")
         component_object = binder.get_registry().get_component(binder, component_name)
-        state = binder.on_load_state()
+        state = binder.load_state()
         package = state.skill["package"]
 
         try:
@@ -798,7 +897,7 @@ class InputSkill(InputBlock):
                 state.data,
                 query,
                 properties=self.properties,
-                skill=state.skill,
+                skill=binder.load_skill(state),
             )
         except Exception as e:
             Log.error("Exception", e)
@@ -823,6 +922,8 @@ class InputSkill(InputBlock):
 
 
 class InputText(InputBlock):
+    __slots__ = ()
+
     def on_descriptor(self):
         return {
             "name": "Text Input",
@@ -844,6 +945,9 @@ class InputText(InputBlock):
 # ----------------------------------------------------------------------
 
 class InterpreterBlock(BaseBlock):
+    __slots__ = ()
+    blocking = True
+
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
 
@@ -872,6 +976,8 @@ class InterpreterBlock(BaseBlock):
 
 
 class DataExchange(InterpreterBlock):
+    __slots__ = ()
+
     def on_descriptor(self):
         return {
             "category": "exchange",
@@ -882,7 +988,7 @@ class DataExchange(InterpreterBlock):
     def on_process(self, binder, operator_id):
         component_name = self.property_value("component")
         component_object = binder.get_registry().get_data_exchange(binder, component_name)
-        state = binder.on_load_state()
+        state = binder.load_state()
         data = state.data
         package = state.skill["package"]
 
@@ -905,8 +1011,8 @@ class DataExchange(InterpreterBlock):
             for key in result:
                 data[key] = result[key]
 
-        state.data = data
-        binder.on_save_state(state.serialize())
+        # data is state.data, changed in place so only the keys written are saved
+        binder.save_state(state)
 
         return self.move()
 
@@ -935,6 +1041,8 @@ class DataExchange(InterpreterBlock):
 
 
 class InterpreterSkill(InterpreterBlock):
+    __slots__ = ()
+
     def on_descriptor(self):
         return {
             "name": "Skill Interpreter",
@@ -945,11 +1053,16 @@ class InterpreterSkill(InterpreterBlock):
     def on_process(self, binder, user_id):
         component_name = self.property_value("component")
         component_object = binder.get_registry().get_component(binder, component_name)
-        state = binder.on_load_state()
+        state = binder.load_state()
         package = state.skill["package"]
 
         result = component_object.on_execute(
-            binder, user_id, package, state.data, properties=self.properties, skill=state.skill
+            binder,
+            user_id,
+            package,
+            state.data,
+            properties=self.properties,
+            skill=binder.load_skill(state),
         )
         if result:
             self.context["result"] = result
@@ -963,23 +1076,203 @@ class InterpreterSkill(InterpreterBlock):
                         template = Template(item["content"])
                         html = template.render(self.context)
                         output.append_text(html)
-                        binder.post_message(output)
                     elif item["node"] == "big.bot.core.iframe":
                         template = Template(item["content"])
                         html = template.render(self.context)
                         output.append_node(IFrameNode(html))
-                        binder.post_message(output)
                     pass
+                if output.contents:
+                    binder.post_message(output)
             return self.move()
         return super().on_process(binder, user_id)
 
 
+class _BranchBinder:
+    """Binder seen by a branch of a ParallelBlock.
+
+    The branch works on its own copy of the state and its messages are kept until the branches
+    are joined, everything else is delegated to the conversation's binder.
+    """
+
+    def __init__(self, binder, state):
+        self.binder = binder
+        self.state = copy.copy(state)
+        self.state.data = copy.deepcopy(state.data)
+        self.state.extra = copy.deepcopy(state.extra)
+        self.messages = []
+
+    def __getattr__(self, name):
+        return getattr(self.binder, name)
+
+    def load_state(self):
+        return self.state
+
+    def save_state(self, state):
+        self.state = state
+
+    def post_message(self, statement):
+        self.messages.append(statement)
+
+
+def _changes(before, after):
+    """Return the keys set and deleted between two versions of a dict."""
+    updated = {
+        key: value for key, value in after.items() if key not in before or before[key] != value
+    }
+    deleted = [key for key in before if key not in after]
+    return updated, deleted
+
+
+_slots = None
+_slots_lock = threading.Lock()
+
+
+def _get_slots():
+    global _slots
+    with _slots_lock:
+        if _slots is None:
+            _slots = threading.BoundedSemaphore(Constant.PARALLEL_BLOCK_WORKERS)
+        return _slots
+
+
+class _Branch:
+    """Runs a branch of a ParallelBlock on its own thread, holding one of the shared slots.
+
+    The slot is given back when the branch ends, or as soon as it's abandoned: a timed out branch
+    can't be stopped, but it no longer takes the place of the branches of other conversations.
+    """
+
+    def __init__(self, function, *args):
+        self.future = Future()
+        self._held = True
+        self._lock = threading.Lock()
+        thread = threading.Thread(
+            target=self._run, args=(function, args), name="ParallelBlock", daemon=True
+        )
+        thread.start()
+
+    def _run(self, function, args):
+        try:
+            self.future.set_result(function(*args))
+        except BaseException as e:
+            self.future.set_exception(e)
+        finally:
+            self.release()
+
+    def release(self):
+        with self._lock:
+            held, self._held = self._held, False
+        if held:
+            _get_slots().release()
+
+
+class ParallelBlock(BaseBlock):
+    """Runs independent interpreter blocks (DataExchange, InterpreterSkill) concurrently.
+
+    Each branch runs on a thread of its own with a copy of the state, at most
+    PARALLEL_BLOCK_WORKERS branches of the process at once; timed out branches are abandoned and
+    no longer count. Once every branch finished or timed out, the changes made by the finished
+    branches to state.data and state.extra are merged in the order of the branches (later
+    branches win on conflicting keys) and their messages are posted in the same order. The
+    connections of the branch blocks are ignored; the block moves to "Next" if every branch moved,
+    to "Reject" otherwise.
+    """
+
+    __slots__ = ()
+    blocking = True
+
+    def on_descriptor(self):
+        return {
+            "name": "Parallel",
+            "summary": "Runs interpreter blocks at the same time.",
+            "category": "interpreter",
+        }
+
+    def get_connections(self, properties):
+        return [[BLOCK_MOVE, "Next"], [BLOCK_REJECT, "Reject"]]
+
+    def load_template(self):
+        self.append_template_properties([
+            {
+                "text": "Branches",
+                "name": "branches",
+                "format": "array",
+                "input_type": "text",
+                "required": True,
+                "description": "Ids of the interpreter blocks to run",
+                "value": [],
+            },
+            {
+                "text": "Timeout",
+                "name": "timeout",
+                "format": "float",
+                "input_type": "number",
+                "required": False,
+                "description": "Seconds given to each branch",
+                "value": Constant.PARALLEL_BLOCK_TIMEOUT,
+            },
+        ])
+
+    def on_process(self, binder, operator_id):
+        from .Skill import compile_skill
+
+        state = binder.load_state()
+        skill = compile_skill(binder.load_skill(state), binder.get_registry())
+        timeout = self.property_value("timeout") or Constant.PARALLEL_BLOCK_TIMEOUT
+        deadline = time.monotonic() + timeout
+        snapshot = {"data": copy.deepcopy(state.data), "extra": copy.deepcopy(state.extra)}
+
+        blocks = []
+        for block_id in self.property_value("branches") or []:
+            if not issubclass(skill.get_block_class(block_id), InterpreterBlock):
+                raise BlockNotFoundException(f"Block {block_id} can't run in a parallel block")
+            blocks.append((block_id, skill.get_block(dict(self.context or {}), block_id)))
+
+        moved = True
+        branches = []
+        for block_id, block_object in blocks:
+            if not _get_slots().acquire(timeout=max(0.0, deadline - time.monotonic())):
+                Log.error("ParallelBlock", f"branch {block_id} failed: no worker available")
+                moved = False
+                continue
+            branch = _BranchBinder(binder, state)
+            branches.append((block_id, branch, _Branch(block_object.process, branch, operator_id)))
+
+        for block_id, branch, running in branches:
+            try:
+                result = running.future.result(timeout=max(0.0, deadline - time.monotonic()))
+            except Exception as e:
+                # a timed out branch keeps running on its own copy of the state, it's discarded
+                running.release()
+                Log.error("ParallelBlock", f"branch {block_id} failed: {e!r}")
+                moved = False
+                continue
+
+            moved = moved and result.code == BLOCK_MOVE
+            for key in ("data", "extra"):
+                updated, deleted = _changes(snapshot[key], getattr(branch.state, key))
+                target = getattr(state, key)
+                target.update(updated)
+                for item in deleted:
+                    target.pop(item, None)
+            for statement in branch.messages:
+                binder.post_message(statement)
+
+        binder.save_state(state)
+        return self.move() if moved else self.reject()
+
+    def process(self, binder, operator_id):
+        return self.on_process(binder, operator_id)
+
+
 # ----------------------------------------------------------------------
 # Prompt Blocks
 # ----------------------------------------------------------------------
 
 
 class PromptBlock(BaseBlock):
+    __slots__ = ()
+
     def get_connections(self, properties):
         return [[BLOCK_MOVE, "Next"]]
 
@@ -1007,6 +1300,8 @@ class PromptBlock(BaseBlock):
 
 
 class PromptBinary(PromptBlock):
+    __slots__ = ()
+
     def on_descriptor(self):
         return {
             "name": "Binary",
@@ -1039,6 +1334,8 @@ class PromptBinary(PromptBlock):
 
 
 class PromptChatPlatform(PromptBlock):
+    __slots__ = ()
+
     def on_descriptor(self):
         return {
             "name": "Chat Platforms",
@@ -1047,7 +1344,7 @@ class PromptChatPlatform(PromptBlock):
         }
 
     def on_process(self, binder, user_id):
-        real_user_id = binder.on_load_state().user_id
+        real_user_id = binder.load_state().user_id
         b64_bytes = base64.b64encode(str(real_user_id).encode("utf-8"))
         payload = b64_bytes.decode("utf-8")
         data = {
@@ -1068,6 +1365,8 @@ class PromptChatPlatform(PromptBlock):
 
 
 class PromptTimeBlock(PromptBlock):
+    __slots__ = ()
+
     def get_output_node(self):
         return None
 
@@ -1101,6 +1400,8 @@ class PromptTimeBlock(PromptBlock):
         )
 
 class PromptDate(PromptTimeBlock):
+    __slots__ = ()
+
     def get_output_node(self):
         return DateNode(None)
 
@@ -1111,6 +1412,8 @@ class PromptDate(PromptTimeBlock):
         pass
 
 class PromptDateTime(PromptTimeBlock):
+    __slots__ = ()
+
     def get_output_node(self):
         return DateTimeNode(None)
 
@@ -1121,6 +1424,8 @@ class PromptDateTime(PromptTimeBlock):
         pass
 
 class PromptDuration(PromptTimeBlock):
+    __slots__ = ()
+
     def get_output_node(self):
         return DurationNode(None)
 
@@ -1132,9 +1437,7 @@ class PromptDuration(PromptTimeBlock):
 
 
 class PromptImage(PromptBlock):
-    def __init__(self, **kwargs):
-        super().__init__(**kwargs)
-        self.descriptor = {"name": "Image", "summary": "No description available", "category": "prompt"}
+    __slots__ = ()
 
     def on_process(self, binder, user_id):
         image = self.property_value("image")
@@ -1162,15 +1465,18 @@ class PromptImage(PromptBlock):
         )
     
     def on_descriptor(self):
-        pass
+        return {"name": "Image", "summary": "No description available", "category": "prompt"}
 
 
 class PromptPayment(PromptBlock):
+    __slots__ = ()
+    blocking = True
+
     def on_descriptor(self):
         return {"name": "Payment", "summary": "No description available", "category": "prompt"}
 
     def on_process(self, binder, user_id):
-        real_user_id = binder.on_load_state().user_id
+        real_user_id = binder.load_state().user_id
         amount = self.property_value("amount")
         currency_code = "USD"
 
@@ -1229,6 +1535,8 @@ class PromptPayment(PromptBlock):
 
 
 class PromptPreview(PromptBlock):
+    __slots__ = ()
+
     def on_descriptor(self):
         return {
             "category": "prompt",
@@ -1259,6 +1567,8 @@ class PromptPreview(PromptBlock):
 
 
 class PromptText(PromptBlock):
+    __slots__ = ()
+
     def on_descriptor(self):
         return {
             "name": "Text",
@@ -1301,6 +1611,8 @@ class PromptText(PromptBlock):
 
 
 class TerminalBlock(BaseBlock):
+    __slots__ = ()
+
     def on_descriptor(self):
         return {
             "name": "Terminate",
@@ -1311,6 +1623,9 @@ class TerminalBlock(BaseBlock):
     def on_process(self, binder, user_id):
         return self.move()
 
+    def process(self, binder, user_id):
+        return self.on_process(binder, user_id)
+
     def load_template(self):
         self.append_template_properties(
             [
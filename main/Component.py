@@ -135,7 +135,7 @@ class OAuthProvider(BaseComponent):
         return oauth
 
     def get_authorization_url(self, binder, user_id, **kwargs):
-        state = binder.on_load_state()
+        state = binder.load_state()
         trim_state = {
             "component_name": self.get_name(),
             "channel_id": state.channel_id,
@@ -239,7 +239,7 @@ class PaymentProvider(BaseComponent):
 
     def get_payment_url(self, binder, user_id, amount, currency, **kwargs):
         """Returns the URL for payment processing."""
-        state = binder.on_load_state()
+        state = binder.load_state()
         trim_state = {
             "component_name": self.get_name(),
             "channel_id": state.channel_id,
@@ -309,8 +309,9 @@ class SkillProvider(BaseComponent):
         return True
 
     def oauth(self, binder, user_id, component, **kwargs):
-        real_user_id = binder.on_load_state().user_id
-        skill = binder.on_load_state().skill
+        state = binder.load_state()
+        real_user_id = state.user_id
+        skill = binder.load_skill(state)
         block = get_block_by_property(
             binder, skill, "component", component.__module__ + "." + component.__name__
         )
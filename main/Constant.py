@@ -12,3 +12,44 @@ INPUT_BLOCK_SELF_CODE = -1
 FLAG_START_SKILL = 1
 FLAG_CANCEL_SKILL = 2
 FLAG_SWITCH_CHANNEL = 3
+
+# skill processor budget per turn
+MAX_STEPS_PER_TURN = 100
+MAX_TIME_PER_TURN = 10.0
+
+# output of a turn, see Binder.output_buffer
+OUTPUT_COALESCE = "coalesce"
+OUTPUT_STREAM = "stream"
+OUTPUT_NODES = "nodes"
+
+# parallel block, branches of every conversation share one thread pool
+PARALLEL_BLOCK_WORKERS = 8
+PARALLEL_BLOCK_TIMEOUT = 5.0
+
+# spaCy models, see main.Nlp.ModelManager
+NLP_MODEL = "en_core_web_sm"
+NLP_MAX_MODELS = 2
+NLP_MEMORY_BUDGET = 0
+NLP_BATCH_SIZE = 64
+NLP_BATCH_WAIT = 0.005
+NLP_DOC_CACHE_SIZE = 4096
+NLP_DOC_CACHE_MEMORY = 64 * 2**20
+NLP_SIMILARITY_CACHE_SIZE = 65536
+
+# intent model trained by the train_intent_model command, see main.IntentModel
+INTENT_MODEL_PATH = "models/intent"
+INTENT_MODEL_EPOCHS = 200
+
+# utterance scoring, see main.Utterance.UtteranceIndex
+UTTERANCE_NGRAM = 3
+UTTERANCE_BATCH = 512
+
+# skill routing index, see main.SkillIndex
+SKILL_INDEX_PATH = "models/skills"
+SKILL_INDEX_BLOCK = 4096
+SKILL_INDEX_REFRESH = 5.0
+SKILL_ROUTE_THRESHOLD = 0.6
+
+# channel state stores, see main.State.StateStore
+STATE_CACHE_SIZE = 4096
+STATE_KEY_PREFIX = "bigbot:state"
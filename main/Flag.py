@@ -3,7 +3,9 @@
 import json
 
 from .Node import BaseNode, CancelNode, SearchNode, SkipNode
+from .Processor import async_drive, drive
 from .Statement import InputStatement
+from .matcher import get_intent_prefilter
 
 
 FLAG_STANDARD_INPUT = "FLAG_STANDARD_INPUT"
@@ -12,45 +14,81 @@ FLAG_CANCEL_SKILL = "FLAG_CANCEL_SKILL"
 FLAG_SKILL_PROCESSOR = "FLAG_SKILL_PROCESSOR"
 
 
+def may_cancel(binder, statement):
+    """Return False when the text rules out every intent, on_cancel_intent is then skipped.
+
+    Only used when the binder enables INTENT_PREFILTER, see main.matcher.IntentPrefilter. Its
+    keywords are those of the intent patterns, not the trigger phrases of the skills, so
+    on_skill_intent is always called.
+    """
+    if not binder.intent_prefilter or not statement.text:
+        return True
+    return get_intent_prefilter().may_match(statement.text)
+
+
 class FlagManager:
     def __init__(self):
         pass
 
     def load(self, binder, statement):
+        return drive(self.decide(binder, statement))
+
+    async def async_load(self, binder, statement):
+        """Same as load for a main.Binder.AsyncBinder, whose hooks are awaitable."""
+        return await async_drive(self.decide(binder, statement))
+
+    def decide(self, binder, statement):
+        """Return the statement to process and its flag, yielding the calls to the binder's intent
+        and skill hooks for main.Processor.drive or async_drive to make."""
         node = statement.get_node()
-        state = binder.on_load_state()
+        state = binder.load_state()
         if state.is_active():
             if statement.flag == FLAG_CANCEL_SKILL:
                 return statement, FLAG_CANCEL_SKILL
-            elif binder.on_cancel_intent(statement):
+            elif may_cancel(binder, statement) and (
+                yield (binder.on_cancel_intent, statement)
+            ):
                 return statement, FLAG_CANCEL_SKILL
             elif isinstance(node, SearchNode):
                 child_node = node.get_node()
                 if isinstance(child_node, CancelNode):
                     return statement, FLAG_CANCEL_SKILL
                 elif isinstance(node, SkipNode):
-                    extra_stm = InputStatement(statement.user_id, text=statement.text)
+                    extra_stm = InputStatement(
+                        statement.user_id, text=statement.text, analysis=statement.analysis
+                    )
                     return extra_stm, FLAG_SKILL_PROCESSOR
                 else:
                     extra_stm = InputStatement(
-                        statement.user_id, input=node.data, text=statement.text
+                        statement.user_id,
+                        input=node.data,
+                        text=statement.text,
+                        analysis=statement.analysis,
                     )
                     return extra_stm, FLAG_SKILL_PROCESSOR
             return statement, FLAG_SKILL_PROCESSOR
         else:
             if statement.flag == FLAG_START_SKILL:
                 package = statement.input
-                skill = binder.on_get_skill(package)
+                skill = yield (binder.on_get_skill, package)
                 if skill:
-                    extra_stm = InputStatement(statement.user_id, input=skill, text=statement.text)
+                    extra_stm = InputStatement(
+                        statement.user_id,
+                        input=skill,
+                        text=statement.text,
+                        analysis=statement.analysis,
+                    )
                     return extra_stm, FLAG_START_SKILL
             else:
-                package = binder.on_skill_intent(statement)
+                package = yield (binder.on_skill_intent, statement)
                 if package:
-                    skill = binder.on_get_skill(package)
+                    skill = yield (binder.on_get_skill, package)
                     if skill:
                         extra_stm = InputStatement(
-                            statement.user_id, input=skill, text=statement.text
+                            statement.user_id,
+                            input=skill,
+                            text=statement.text,
+                            analysis=statement.analysis,
                         )
                         return extra_stm, FLAG_START_SKILL
             return statement, FLAG_STANDARD_INPUT
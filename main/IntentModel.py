@@ -0,0 +1,273 @@
+"""Intent classifier trained offline and loaded once per process.
+
+Training happens at build time with the train_intent_model management command:
+
+    python manage.py train_intent_model --data path/to/nlu.md --output models/intent
+
+The examples are read from a Rasa markdown NLU file (or a JSON object of intent -> examples),
+turned into TF-IDF vectors of words and character trigrams and fitted with a softmax
+regression. The artifact is a directory:
+
+    meta.json    format version, intents, vocabulary and training summary
+    idf.npy      inverse document frequency of every feature, float32
+    weights.npy  features x intents matrix, float32
+    bias.npy     bias of every intent, float32
+
+The arrays are memory-mapped when the model is loaded, so the workers of a host share their
+pages. A query only reads the rows of its own features. Artifacts written with an older format
+are upgraded when they are loaded; newer ones are refused.
+
+Workers load the model when they boot, see core.apps.CoreConfig, and UtteranceDistance gets it
+from get_intent_model.
+"""
+
+from collections import Counter
+import datetime
+import json
+import os
+import re
+import threading
+
+import numpy as np
+
+from . import Constant
+
+
+FORMAT_VERSION = 1
+
+# cells of the largest texts x vocabulary matrix built to train a model, 64 MB of float32
+DENSE_TRAINING_SIZE = 2**24
+
+INTENT_HEADER = re.compile(r"^##\s*intent:\s*(\S+)")
+ENTITY_ANNOTATION = re.compile(r"\[([^\]]+)\]\([^)]*\)")
+WORD = re.compile(r"\w+")
+
+
+def load_training_data(path):
+    """Return the examples of a Rasa markdown or JSON file as a dict of intent -> texts."""
+    with open(path, encoding="utf-8") as file:
+        if path.endswith(".json"):
+            return {intent: list(texts) for intent, texts in json.load(file).items()}
+        lines = file.read().splitlines()
+
+    examples = {}
+    intent = None
+    for line in lines:
+        line = line.strip()
+        header = INTENT_HEADER.match(line)
+        if header:
+            intent = header.group(1)
+            examples.setdefault(intent, [])
+        elif line.startswith("##"):
+            intent = None
+        elif intent and line.startswith(("-", "*")):
+            text = ENTITY_ANNOTATION.sub(r"\1", line[1:].strip())
+            if text:
+                examples[intent].append(text)
+    return {intent: texts for intent, texts in examples.items() if texts}
+
+
+def features(text):
+    """Return the words and character trigrams of a text."""
+    result = []
+    for word in WORD.findall(text.lower()):
+        result.append(word)
+        padded = f"#{word}#"
+        result.extend(padded[i : i + 3] for i in range(len(padded) - 2))
+    return result
+
+
+class IntentModel:
+    """Ranks the intents of a text, inference only.
+
+    Train a model with IntentModel.train, write it with save and read it with load.
+    """
+
+    def __init__(self, intents, vocabulary, idf, weights, bias, meta=None):
+        self.intents = list(intents)
+        self.vocabulary = {feature: index for index, feature in enumerate(vocabulary)}
+        self.idf = idf
+        self.weights = weights
+        self.bias = bias
+        self.meta = meta or {}
+
+    @classmethod
+    def train(
+        cls,
+        examples,
+        epochs=Constant.INTENT_MODEL_EPOCHS,
+        rate=5.0,
+        l2=1e-4,
+        dense_limit=DENSE_TRAINING_SIZE,
+    ):
+        """Fit a model on a dict of intent -> example texts.
+
+        The texts x vocabulary matrix of the examples is only built when it has at most
+        dense_limit cells, larger ones are trained on their non-zero cells.
+        """
+        intents = sorted(examples)
+        if len(intents) < 2:
+            raise ValueError("Training an intent model requires at least two intents")
+        texts = [text for intent in intents for text in examples[intent]]
+        labels = np.array([n for n, intent in enumerate(intents) for _ in examples[intent]])
+
+        counts = [Counter(features(text)) for text in texts]
+        vocabulary = sorted(set().union(*counts))
+        columns = {feature: index for index, feature in enumerate(vocabulary)}
+        frequency = np.zeros(len(vocabulary), dtype=np.float32)
+        for count in counts:
+            frequency[[columns[feature] for feature in count]] += 1
+        idf = (np.log((1 + len(texts)) / (1 + frequency)) + 1).astype(np.float32)
+
+        rows = np.repeat(np.arange(len(texts)), [len(count) for count in counts])
+        indices = np.fromiter(
+            (columns[feature] for count in counts for feature in count), dtype=np.intp
+        )
+        values = np.fromiter(
+            (value for count in counts for value in count.values()), dtype=np.float32
+        )
+        values *= idf[indices]
+        norms = np.sqrt(np.bincount(rows, weights=values**2, minlength=len(texts)))
+        values /= np.maximum(norms, 1e-12).astype(np.float32)[rows]
+        shape = (len(texts), len(vocabulary))
+        if shape[0] * shape[1] <= dense_limit:
+            project, accumulate = _dense_products(rows, indices, values, shape)
+        else:
+            project, accumulate = _sparse_products(rows, indices, values, shape)
+
+        targets = np.eye(len(intents), dtype=np.float32)[labels]
+        weights = np.zeros((len(vocabulary), len(intents)), dtype=np.float32)
+        bias = np.zeros(len(intents), dtype=np.float32)
+        for _ in range(epochs):
+            error = (_softmax(project(weights) + bias) - targets) / len(texts)
+            weights -= rate * (accumulate(error) + l2 * weights)
+            bias -= rate * error.sum(axis=0)
+
+        meta = {
+            "trained": datetime.datetime.utcnow().isoformat(timespec="seconds"),
+            "examples": len(texts),
+            "epochs": epochs,
+        }
+        return cls(intents, vocabulary, idf, weights, bias, meta)
+
+    def vector(self, text):
+        """Return the feature columns of a text and their normalized TF-IDF values."""
+        count = Counter(feature for feature in features(text) if feature in self.vocabulary)
+        columns = np.fromiter((self.vocabulary[feature] for feature in count), dtype=np.intp)
+        values = np.fromiter(count.values(), dtype=np.float32) * self.idf[columns]
+        norm = np.linalg.norm(values)
+        return columns, values / norm if norm else values
+
+    def rank(self, text):
+        """Return the intents of a text as dicts of name and confidence, most likely first."""
+        columns, values = self.vector(text)
+        scores = values @ self.weights[columns] + self.bias
+        confidences = _softmax(scores)
+        return [
+            {"name": self.intents[index], "confidence": float(confidences[index])}
+            for index in np.argsort(-confidences, kind="stable")
+        ]
+
+    def save(self, path):
+        """Write the model to the directory path."""
+        os.makedirs(path, exist_ok=True)
+        vocabulary = sorted(self.vocabulary, key=self.vocabulary.get)
+        meta = dict(self.meta, format=FORMAT_VERSION, intents=self.intents, vocabulary=vocabulary)
+        for name in ("idf", "weights", "bias"):
+            np.save(os.path.join(path, f"{name}.npy"), np.asarray(getattr(self, name), np.float32))
+        # the header goes last, a directory without it is not a model
+        with open(os.path.join(path, "meta.json"), "w", encoding="utf-8") as file:
+            json.dump(meta, file)
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """Read a model written by save, memory-mapping its arrays unless mmap is False."""
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as file:
+            meta = json.load(file)
+        version = meta.get("format")
+        if not isinstance(version, int) or version > FORMAT_VERSION:
+            raise ValueError(f"Unsupported intent model format {version!r} in {path}")
+        meta = upgrade(meta)
+
+        mode = "r" if mmap else None
+        arrays = [
+            np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mode)
+            for name in ("idf", "weights", "bias")
+        ]
+        intents = meta.pop("intents")
+        vocabulary = meta.pop("vocabulary")
+        return cls(intents, vocabulary, *arrays, meta=meta)
+
+
+def upgrade(meta):
+    """Bring the header of an artifact written by an older format up to FORMAT_VERSION."""
+    # format 1 is the first one, upgrades of later formats go here, oldest first
+    return meta
+
+
+def _dense_products(rows, indices, values, shape):
+    """Return the functions computing matrix @ weights and matrix.T @ error, for the matrix
+    whose non-zero cells are given."""
+    matrix = np.zeros(shape, dtype=np.float32)
+    matrix[rows, indices] = values
+    return (lambda weights: matrix @ weights), (lambda error: matrix.T @ error)
+
+
+def _sparse_products(rows, indices, values, shape):
+    """Same as _dense_products, summing the products of the non-zero cells without the matrix.
+
+    The cells are given in the order of their rows, and every column has one.
+    """
+    values = values[:, None]
+    sizes = np.bincount(rows, minlength=shape[0])
+    filled = sizes > 0
+    row_starts = (np.cumsum(sizes) - sizes)[filled]
+    by_column = np.argsort(indices, kind="stable")
+    column_starts = np.searchsorted(indices[by_column], np.arange(shape[1]))
+    column_rows, column_values = rows[by_column], values[by_column]
+
+    def project(weights):
+        scores = np.zeros((shape[0], weights.shape[1]), dtype=np.float32)
+        scores[filled] = np.add.reduceat(values * weights[indices], row_starts)
+        return scores
+
+    def accumulate(error):
+        return np.add.reduceat(column_values * error[column_rows], column_starts)
+
+    return project, accumulate
+
+
+def _softmax(scores):
+    scores = scores - scores.max(axis=-1, keepdims=True)
+    exp = np.exp(scores)
+    return exp / exp.sum(axis=-1, keepdims=True)
+
+
+_models = {}
+_models_lock = threading.Lock()
+_default_path = Constant.INTENT_MODEL_PATH
+
+
+def get_intent_model(path=None):
+    """Return the model stored at path, loading it once per process."""
+    path = os.path.abspath(path or _default_path)
+    model = _models.get(path)
+    if model is None:
+        with _models_lock:
+            model = _models.get(path)
+            if model is None:
+                model = _models[path] = IntentModel.load(path)
+    return model
+
+
+def warm_up(path):
+    """Load the model at path and make it the default one of get_intent_model."""
+    global _default_path
+    _default_path = path
+    return get_intent_model(path)
+
+
+def clear():
+    """Forget the loaded models, the next get_intent_model loads them again."""
+    with _models_lock:
+        _models.clear()
@@ -1,3 +1,6 @@
+from .Nlp import DOC_CACHE, get_nlp
+
+
 class EmailMatcher:
     def __init__(self, input_text):
         self.doc = input_text
@@ -126,21 +129,18 @@ class SetDeadlineIntentMatcher(IntentMatcher):
 
 
 class TokenSimilarity:
-    def __init__(self, nlp):
-        self.nlp = nlp
+    def __init__(self, nlp=None, cache=DOC_CACHE):
+        self.nlp = nlp or get_nlp()
+        self.cache = cache
 
     def get_similarity(self, token1, token2):
-        token1 = self.nlp(token1)
-        token2 = self.nlp(token2)
-        return token1.similarity(token2)
+        return self.cache.similarity(self.nlp, token1, token2)
 
 
 class SentenceSimilarity:
-    def __init__(self, nlp):
-        self.nlp = nlp
+    def __init__(self, nlp=None, cache=DOC_CACHE):
+        self.nlp = nlp or get_nlp()
+        self.cache = cache
 
     def get_similarity(self, sentence1, sentence2):
-        doc1 = self.nlp(sentence1)
-        doc2 = self.nlp(sentence2)
-        similarity = doc1.similarity(doc2)
-        return similarity
+        return self.cache.similarity(self.nlp, sentence1, sentence2)
@@ -0,0 +1,611 @@
+"""spaCy models shared by every NLP consumer of the process.
+
+Loading a model takes seconds and hundreds of megabytes, so blocks, matchers and intents never
+call spacy.load themselves, they get the model from MODELS:
+
+    from .Nlp import get_nlp
+    doc = get_nlp()("book a table")
+
+Models are loaded on first use, once per process. Several language models can be configured,
+the least recently used ones are dropped once there are more than max_models of them or their
+parameters take more than memory_budget bytes.
+
+Under load, enable_batching() makes get_nlp return an NlpBatcher, which parses the texts of
+concurrent turns together with nlp.pipe.
+
+The vectors of static texts, like the labels of a selection, are computed once and kept in
+NumPy matrices, see SelectionVectors. The text of a message is parsed once per turn, see
+Analysis. Reference phrases compared over and over are parsed once, see DocCache.
+"""
+
+from collections import OrderedDict
+from concurrent.futures import Future
+import queue
+import re
+import threading
+import time
+import weakref
+
+import numpy as np
+import spacy
+
+from . import Constant, Log
+
+
+def model_size(nlp):
+    """Return the number of bytes taken by the vectors and the parameters of a model."""
+    size = nlp.vocab.vectors.data.nbytes
+    seen = set()
+    for _, pipe in nlp.pipeline:
+        model = getattr(pipe, "model", None)
+        if model is None or not hasattr(model, "walk"):
+            continue
+        for node in model.walk():
+            # pipes listening to a shared tok2vec walk the same nodes
+            if id(node) in seen:
+                continue
+            seen.add(id(node))
+            for name in node.param_names:
+                if node.has_param(name):
+                    size += node.get_param(name).nbytes
+    return size
+
+
+class ModelManager:
+    """Lazy, thread-safe registry of spaCy models keyed by name.
+
+    Attributes:
+        max_models (int): Number of models kept loaded.
+        memory_budget (int): Bytes the loaded models may take, 0 for no limit.
+        loads (int): Number of models loaded so far.
+    """
+
+    def __init__(
+        self,
+        max_models=Constant.NLP_MAX_MODELS,
+        memory_budget=Constant.NLP_MEMORY_BUDGET,
+        loader=spacy.load,
+    ):
+        self.max_models = max_models
+        self.memory_budget = memory_budget
+        self.loader = loader
+        self.loads = 0
+        self._models = OrderedDict()
+        self._sizes = {}
+        self._lock = threading.Lock()
+        self._loading = {}
+        self._listeners = []
+
+    def __contains__(self, name):
+        return name in self._models
+
+    def __len__(self):
+        return len(self._models)
+
+    def get(self, name=Constant.NLP_MODEL):
+        """Return the model, loading it if needed. Concurrent callers wait for the same load."""
+        with self._lock:
+            nlp = self._models.get(name)
+            if nlp is not None:
+                self._models.move_to_end(name)
+                return nlp
+            loading = self._loading.setdefault(name, threading.Lock())
+
+        # other models stay available while this one loads
+        with loading:
+            with self._lock:
+                nlp = self._models.get(name)
+                if nlp is not None:
+                    self._models.move_to_end(name)
+                    return nlp
+
+            nlp = self.loader(name)
+            size = model_size(nlp)
+            with self._lock:
+                self._models[name] = nlp
+                self._sizes[name] = size
+                self.loads += 1
+                evicted = self._evict()
+                self._loading.pop(name, None)
+            Log.debug("ModelManager", f"loaded {name} ({size} bytes)")
+            self._notify(evicted)
+            return nlp
+
+    def warm_up(self, names=(Constant.NLP_MODEL,)):
+        """Load the models and run them once, e.g. when a worker boots."""
+        for name in names:
+            try:
+                self.get(name)("warm up")
+            except OSError as e:
+                Log.error("ModelManager", f"can't load {name}: {e}")
+
+    def memory(self):
+        """Return the bytes taken by each loaded model."""
+        with self._lock:
+            return {name: self._sizes[name] for name in self._models}
+
+    def total_memory(self):
+        return sum(self.memory().values())
+
+    def on_evict(self, callback):
+        """Call callback(name, nlp) whenever a model is dropped, to release what refers to it."""
+        self._listeners.append(callback)
+
+    def evict(self, name):
+        with self._lock:
+            nlp = self._models.pop(name, None)
+            self._sizes.pop(name, None)
+        self._notify([(name, nlp)] if nlp is not None else [])
+
+    def clear(self):
+        with self._lock:
+            evicted = list(self._models.items())
+            self._models.clear()
+            self._sizes.clear()
+        self._notify(evicted)
+
+    def _evict(self):
+        # the most recently used model is always kept, even if it's over budget on its own
+        evicted = []
+        while len(self._models) > 1 and (
+            len(self._models) > self.max_models
+            or (self.memory_budget and sum(self._sizes.values()) > self.memory_budget)
+        ):
+            name, nlp = self._models.popitem(last=False)
+            del self._sizes[name]
+            evicted.append((name, nlp))
+            Log.debug("ModelManager", f"evicted {name}")
+        return evicted
+
+    def _notify(self, evicted):
+        for name, nlp in evicted:
+            for callback in self._listeners:
+                callback(name, nlp)
+
+
+MODELS = ModelManager()
+
+
+class NlpBatcher:
+    """Parses the texts of concurrent callers in batches.
+
+    A caller's text waits at most max_wait seconds for other texts, then the batch (up to
+    max_batch texts) runs through nlp.pipe in a worker thread and every caller gets its Doc.
+    Calling the batcher works like calling the model, other attributes are the model's.
+
+    Attributes:
+        batches (int): Number of batches parsed.
+        texts (int): Number of texts parsed.
+    """
+
+    def __init__(
+        self,
+        nlp,
+        max_batch=Constant.NLP_BATCH_SIZE,
+        max_wait=Constant.NLP_BATCH_WAIT,
+    ):
+        self.nlp = nlp
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.batches = 0
+        self.texts = 0
+        self._queue = queue.Queue()
+        self._worker = threading.Thread(target=self._run, name="NlpBatcher", daemon=True)
+        self._worker.start()
+
+    def __getattr__(self, name):
+        return getattr(self.nlp, name)
+
+    def __call__(self, text):
+        return self.submit(text).result()
+
+    def submit(self, text):
+        """Queue a text, the returned Future resolves to its Doc."""
+        future = Future()
+        self._queue.put((text, future))
+        return future
+
+    def pipe(self, texts, **kwargs):
+        """Parse texts along with the other callers, the docs are returned in order."""
+        futures = [self.submit(text) for text in texts]
+        return [future.result() for future in futures]
+
+    def close(self):
+        """Stop the worker once the queued texts are parsed."""
+        self._queue.put(None)
+        self._worker.join()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            batch = [item]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch:
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._queue.put(None)
+                    break
+                batch.append(item)
+            self._parse(batch)
+
+    def _parse(self, batch):
+        texts = [text for text, _ in batch]
+        try:
+            # in this process: a micro-batch is parsed long before nlp.pipe(n_process=...) would
+            # have started its worker processes
+            docs = list(self.nlp.pipe(texts, batch_size=len(texts)))
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        self.batches += 1
+        self.texts += len(texts)
+        for (_, future), doc in zip(batch, docs):
+            future.set_result(doc)
+
+
+_batching = None
+_batchers = {}
+_batchers_lock = threading.Lock()
+
+
+def enable_batching(max_batch=Constant.NLP_BATCH_SIZE, max_wait=Constant.NLP_BATCH_WAIT):
+    """Make get_nlp return an NlpBatcher of the model."""
+    global _batching
+    _batching = {"max_batch": max_batch, "max_wait": max_wait}
+
+
+def disable_batching():
+    global _batching
+    _batching = None
+    with _batchers_lock:
+        batchers = list(_batchers.values())
+        _batchers.clear()
+    for batcher in batchers:
+        batcher.close()
+
+
+def _drop_batcher(name, nlp):
+    # the worker of the batcher would keep the evicted model
+    with _batchers_lock:
+        batcher = _batchers.get(name)
+        if batcher is not None and batcher.nlp is nlp:
+            del _batchers[name]
+            batcher._queue.put(None)
+
+
+MODELS.on_evict(_drop_batcher)
+
+
+def get_nlp(name=Constant.NLP_MODEL):
+    """Return a model from the process wide ModelManager, batched if batching is enabled."""
+    nlp = MODELS.get(name)
+    if _batching is None:
+        return nlp
+    with _batchers_lock:
+        batcher = _batchers.get(name)
+        # the model was evicted and loaded again since the batcher was made
+        if batcher is None or batcher.nlp is not nlp:
+            if batcher is not None:
+                batcher._queue.put(None)
+            batcher = _batchers[name] = NlpBatcher(nlp, **_batching)
+    return batcher
+
+
+# rough size of a parsed token (TokenC struct, lexeme pointer and Python wrapper)
+DOC_TOKEN_BYTES = 160
+
+
+def doc_size(doc):
+    """Return an estimate of the bytes taken by a parsed doc."""
+    return DOC_TOKEN_BYTES * len(doc) + doc.tensor.nbytes + len(doc.text)
+
+
+class DocCache:
+    """Bounded LRU cache of parsed docs keyed by model and text, and of their similarities.
+
+    The cache refers to the models weakly, but the docs hold the vocab (and vectors) of their
+    model: purge drops them when the model is no longer used, DOC_CACHE is purged of the models
+    the ModelManager evicts.
+
+    Reference phrases are compared with many texts, caching their docs saves parsing them again
+    and caching the similarity of a pair saves comparing them again. The least recently used
+    docs are dropped once there are more than max_docs of them or they take more than
+    memory_budget bytes (0 for no limit), similarities once there are more than
+    max_similarities. Cached docs are shared, don't modify them.
+
+    Attributes:
+        hits, misses (int): Lookups of docs found and not found in the cache.
+        similarity_hits, similarity_misses (int): Same for similarities.
+        memory (int): Estimated bytes taken by the cached docs, see doc_size.
+    """
+
+    def __init__(
+        self,
+        max_docs=Constant.NLP_DOC_CACHE_SIZE,
+        memory_budget=Constant.NLP_DOC_CACHE_MEMORY,
+        max_similarities=Constant.NLP_SIMILARITY_CACHE_SIZE,
+    ):
+        self.max_docs = max_docs
+        self.memory_budget = memory_budget
+        self.max_similarities = max_similarities
+        self.hits = self.misses = 0
+        self.similarity_hits = self.similarity_misses = 0
+        self.memory = 0
+        self._docs = OrderedDict()
+        self._similarities = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._docs)
+
+    def doc(self, nlp, text):
+        """Return nlp(text), parsed once while it stays in the cache."""
+        # keyed by model instance, a model loaded again doesn't get the docs of the previous one
+        key = (id(nlp), text)
+        with self._lock:
+            entry = self._docs.get(key)
+            if entry is not None and entry[0]() is nlp:
+                self._docs.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        doc = nlp(text)
+        size = doc_size(doc)
+        with self._lock:
+            previous = self._docs.pop(key, None)
+            if previous is not None:
+                self.memory -= previous[2]
+            self._docs[key] = (weakref.ref(nlp), doc, size)
+            self.memory += size
+            while len(self._docs) > 1 and (
+                len(self._docs) > self.max_docs
+                or (self.memory_budget and self.memory > self.memory_budget)
+            ):
+                self.memory -= self._docs.popitem(last=False)[1][2]
+        return doc
+
+    def similarity(self, nlp, text1, text2):
+        """Return Doc.similarity of the two texts, computed once while it stays in the cache."""
+        key = (id(nlp), text1, text2)
+        with self._lock:
+            entry = self._similarities.get(key)
+            if entry is not None and entry[0]() is nlp:
+                self._similarities.move_to_end(key)
+                self.similarity_hits += 1
+                return entry[1]
+            self.similarity_misses += 1
+
+        similarity = self.doc(nlp, text1).similarity(self.doc(nlp, text2))
+        with self._lock:
+            self._similarities[key] = (weakref.ref(nlp), similarity)
+            while len(self._similarities) > self.max_similarities:
+                self._similarities.popitem(last=False)
+        return similarity
+
+    def hit_rate(self):
+        """Return the share of doc lookups found in the cache."""
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def similarity_hit_rate(self):
+        lookups = self.similarity_hits + self.similarity_misses
+        return self.similarity_hits / lookups if lookups else 0.0
+
+    def stats(self):
+        """Return the size and hit rates of the cache, e.g. for monitoring."""
+        return {
+            "docs": len(self._docs),
+            "memory": self.memory,
+            "similarities": len(self._similarities),
+            "hit_rate": self.hit_rate(),
+            "similarity_hit_rate": self.similarity_hit_rate(),
+        }
+
+    def purge(self, nlp):
+        """Drop the docs and similarities of a model, and those of models no longer used."""
+        vocab = nlp.vocab
+        with self._lock:
+            for key, (model, doc, size) in list(self._docs.items()):
+                if doc.vocab is vocab or model() is None:
+                    del self._docs[key]
+                    self.memory -= size
+            for key, (model, _) in list(self._similarities.items()):
+                model = model()
+                if model is None or model.vocab is vocab:
+                    del self._similarities[key]
+
+    def clear(self):
+        with self._lock:
+            self._docs.clear()
+            self._similarities.clear()
+            self.memory = 0
+            self.hits = self.misses = 0
+            self.similarity_hits = self.similarity_misses = 0
+
+
+DOC_CACHE = DocCache()
+MODELS.on_evict(lambda name, nlp: DOC_CACHE.purge(nlp))
+
+
+PHONE_PATTERN = re.compile(r"\+?\d[\d\s().-]{5,}\d")
+
+
+class Analysis:
+    """Analysis of the text of a message, shared by everything handling the message.
+
+    The text is parsed on first use only, with the model from get_nlp unless one is given. Use
+    InputStatement.analysis rather than parsing statement.text.
+
+    Attributes:
+        text (str): The analysed text.
+        parses (int): Number of times the text was parsed, at most 1.
+    """
+
+    def __init__(self, text, nlp=None):
+        self.text = text or ""
+        self.parses = 0
+        self._nlp = nlp
+        self._doc = None
+
+    @property
+    def nlp(self):
+        if self._nlp is None:
+            self._nlp = get_nlp()
+        return self._nlp
+
+    @property
+    def doc(self):
+        if self._doc is None:
+            self._doc = self.nlp(self.text)
+            self.parses += 1
+        return self._doc
+
+    @property
+    def tokens(self):
+        return [token.text for token in self.doc]
+
+    @property
+    def words(self):
+        """Tokens that aren't stop words."""
+        return [token for token in self.doc if not token.is_stop]
+
+    @property
+    def lemmas(self):
+        return [token.lemma_ for token in self.doc]
+
+    @property
+    def entities(self):
+        """List of (text, label) of the named entities."""
+        return [(ent.text, ent.label_) for ent in self.doc.ents]
+
+    @property
+    def vector(self):
+        return self.doc.vector
+
+    @property
+    def emails(self):
+        return [token.text for token in self.doc if token.like_email]
+
+    @property
+    def urls(self):
+        return [token.text for token in self.doc if token.like_url]
+
+    @property
+    def phones(self):
+        return [match.group().strip() for match in PHONE_PATTERN.finditer(self.text)]
+
+
+SELECTION_CACHE_SIZE = 256
+
+
+def _normalize(matrix):
+    """Return the rows of matrix scaled to unit length, zero rows stay zero."""
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return np.divide(matrix, norms, out=np.zeros_like(matrix), where=norms > 0)
+
+
+def _matrix(vectors, width):
+    return np.array(vectors, dtype=np.float32).reshape(-1, width)
+
+
+class SelectionVectors:
+    """Vectors of a list of labels, to compare a query with every label at once.
+
+    The scores are the ones of Doc.similarity and Token.similarity: the cosine of the vectors,
+    1.0 when both sides have the same words.
+
+    Attributes:
+        labels (tuple): The labels.
+        doc_vectors (numpy.ndarray): Unit vector of each label, one row per label.
+        token_vectors (numpy.ndarray): Unit vector of the tokens of the labels that aren't stop
+            words, the tokens of a label are contiguous rows.
+        token_counts (numpy.ndarray): Number of tokens of each label in token_vectors.
+    """
+
+    def __init__(self, nlp, labels):
+        self.nlp = nlp
+        self.labels = tuple(labels)
+        docs = list(nlp.pipe(self.labels))
+        width = len(docs[0].vector) if docs else 0
+
+        self.doc_vectors = _normalize(_matrix([doc.vector for doc in docs], width))
+        self.doc_orths = {}
+        tokens = []
+        counts = []
+        for index, doc in enumerate(docs):
+            self.doc_orths.setdefault(tuple(token.orth for token in doc), []).append(index)
+            words = [token for token in doc if not token.is_stop]
+            tokens.extend(words)
+            counts.append(len(words))
+
+        self.token_vectors = _normalize(_matrix([token.vector for token in tokens], width))
+        self.token_orths = np.array([token.orth for token in tokens], dtype=np.uint64)
+        self.token_counts = np.array(counts, dtype=np.int64)
+        # first row of each label having tokens, for np.maximum.reduceat
+        self._has_tokens = self.token_counts > 0
+        self._starts = (np.cumsum(self.token_counts) - self.token_counts)[self._has_tokens]
+
+    def __len__(self):
+        return len(self.labels)
+
+    def doc_scores(self, doc):
+        """Return doc.similarity(label) for every label."""
+        if not self.labels:
+            return np.zeros(0)
+        query = _normalize(_matrix([doc.vector], self.doc_vectors.shape[1]))[0]
+        scores = (self.doc_vectors @ query).astype(np.float64)
+        scores[self.doc_orths.get(tuple(token.orth for token in doc), [])] = 1.0
+        return scores
+
+    def token_scores(self, doc):
+        """Return, for every label, the sum over the query tokens that aren't stop words of their
+        best similarity with a token of the label, and the number of query tokens."""
+        scores = np.zeros(len(self.labels))
+        tokens = [token for token in doc if not token.is_stop]
+        if tokens and len(self.token_orths):
+            width = self.token_vectors.shape[1]
+            query = _normalize(_matrix([token.vector for token in tokens], width))
+            similarity = query @ self.token_vectors.T
+            orths = np.array([token.orth for token in tokens], dtype=np.uint64)
+            similarity[orths[:, None] == self.token_orths[None, :]] = 1.0
+            best = np.maximum.reduceat(similarity, self._starts, axis=1)
+            scores[self._has_tokens] = best.sum(axis=0, dtype=np.float64)
+        return scores, len(tokens)
+
+
+_selections = OrderedDict()
+_selections_lock = threading.Lock()
+
+
+def selection_vectors(nlp, labels):
+    """Return the SelectionVectors of labels, computed once per model and list of labels."""
+    key = (id(nlp), tuple(labels))
+    with _selections_lock:
+        vectors = _selections.get(key)
+        if vectors is not None and vectors.nlp is nlp:
+            _selections.move_to_end(key)
+            return vectors
+
+    vectors = SelectionVectors(nlp, labels)
+    with _selections_lock:
+        _selections[key] = vectors
+        while len(_selections) > SELECTION_CACHE_SIZE:
+            _selections.popitem(last=False)
+    return vectors
+
+
+def _purge_selections(name, nlp):
+    # the vectors keep their model, an evicted model would stay loaded
+    with _selections_lock:
+        for key in [key for key, vectors in _selections.items() if vectors.nlp is nlp]:
+            del _selections[key]
+
+
+MODELS.on_evict(_purge_selections)
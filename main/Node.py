@@ -1,23 +1,42 @@
 """This module must be a perfect copy of the equivalent module in the the customer repo."""
+import copy
 import json
+
 from jinja2 import Template
 
+
+# Node class of every NODE_TYPE, filled as the subclasses of BaseNode are defined
+NODE_CLASSES = {}
+
+_catalog = None
+
+
 # Define a function to return serialized data for all node types
 def all():
-    serialized_data = []
-    for node_type in NODE_TYPES:
-        node = node_type(None, None)
-        serialized_data.append(node.serialize())
-    return serialized_data
+    """Return the serialized node of every type in NODE_TYPES, built once per process."""
+    global _catalog
+    if _catalog is None:
+        # PreviewNode fetches a (missing) web preview, the catalog never changes
+        _catalog = [node_type(None, None).serialize() for node_type in NODE_TYPES]
+    return copy.deepcopy(_catalog)
 
 
 # Define the base class for all nodes
 class BaseNode:
+    # nodes are kept in every output statement, subclasses declare empty __slots__ to stay compact
+    __slots__ = ("node", "data", "meta")
+
     def __init__(self, node, data, meta):
         self.node = node
         self.data = data
         self.meta = meta
 
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # subclasses with their own NODE_TYPE are the ones deserialize makes
+        if "NODE_TYPE" in cls.__dict__:
+            NODE_CLASSES[cls.NODE_TYPE] = cls
+
     def get_data(self):
         return self.data
 
@@ -35,72 +54,58 @@ class BaseNode:
     def deserialize(object):
         if isinstance(object, dict):
             node = object.get("node")
-            data = object.get("data")
-            meta = object.get("meta")
-            if node == "big.bot.core.audio":
-                return AudioNode(data, meta)
-            elif node == "big.bot.core.binary":
-                return BinaryNode(data, meta)
-            elif node == "big.bot.core.cancel":
-                return CancelNode(data, meta)
-            elif node == "big.bot.core.delegates":
-                return DelegatesNode(data, meta)
-            elif node == "big.bot.core.iframe":
-                return IFrameNode(data, meta)
-            elif node == "big.bot.core.image":
-                return ImageNode(data, meta)
-            elif node == "big.bot.core.notification":
-                return NotificationNode(data, meta)
-            elif node == "big.bot.core.oauth":
-                return OAuthNode(data, node)
-            elif node == "big.bot.core.payment":
-                return PaymentNode(data, meta)
-            elif node == "big.bot.core.picker.date":
-                return DateNode(data, meta)
-            elif node == "big.bot.core.picker.datetime":
-                return DateTimeNode(data, meta)
-            elif node == "big.bot.core.picker.duration":
-                return DurationNode(data, meta)
-            elif node == "big.bot.core.picker.file":
-                return InputBinaryNode(data, meta)
-            elif node == "big.bot.core.preview":
-                return PreviewNode(data, meta)
-            elif node == "big.bot.core.search":
-                return SearchNode(data, meta)
-            elif node == "big.bot.core.skip":
-                return SkipNode(data, meta)
-            elif node == "big.bot.core.text":
-                return TextNode(data, meta)
-            else:
+            node_class = NODE_CLASSES.get(node)
+            if node_class is None:
                 raise ValueError(f"Invalid node type: {node}")
+            return node_class(object.get("data"), object.get("meta"))
 
 
 # Define a subclass of BaseNode for the "Audio" node type
 class AudioNode(BaseNode):
+    NODE_TYPE = "big.bot.core.audio"
+
+    __slots__ = ()
+
     def __init__(self, data, meta=None):
-        super().__init__("big.bot.core.audio", data, meta)
+        super().__init__(AudioNode.NODE_TYPE, data, meta)
 
 
 # Define a subclass of BaseNode for the "Binary" node type
 class BinaryNode(BaseNode):
+    NODE_TYPE = "big.bot.core.binary"
+
+    __slots__ = ()
+
     def __init__(self, data, meta=None):
-        super().__init__("big.bot.core.binary", data, meta)
+        super().__init__(BinaryNode.NODE_TYPE, data, meta)
 
 
 
 class CancelNode(BaseNode):
+    NODE_TYPE = "big.bot.core.cancel"
+
+    __slots__ = ()
+
     def __init__(self, data=None, meta=None):
-        super().__init__("big.bot.core.cancel", data, meta)
+        super().__init__(CancelNode.NODE_TYPE, data, meta)
 
 
 class DateNode(BaseNode):
+    NODE_TYPE = "big.bot.core.picker.date"
+
+    __slots__ = ()
+
     def __init__(self, data=None, meta=None):
-        super().__init__("big.bot.core.picker.date", data, meta)
+        super().__init__(DateNode.NODE_TYPE, data, meta)
 
 
 class DateTimeNode(BaseNode):
+    NODE_TYPE = "big.bot.core.picker.datetime"
+
+    __slots__ = ()
+
     def __init__(self, data=None, meta=None):
-        super().__init__("big.bot.core.picker.datetime", data, meta)
+        super().__init__(DateTimeNode.NODE_TYPE, data, meta)
 
 
     """The DelegatesNode has the following structure:
@@ -132,23 +137,39 @@ class DateTimeNode(BaseNode):
       delegate's id, the second integers is the skill's id.
     """
 class DelegatesNode(BaseNode):
+    NODE_TYPE = "big.bot.core.delegates"
+
+    __slots__ = ()
+
     def __init__(self, data=None, meta=None):
-        super().__init__("big.bot.core.delegates", data, meta)
+        super().__init__(DelegatesNode.NODE_TYPE, data, meta)
 
 
 class DurationNode(BaseNode):
+    NODE_TYPE = "big.bot.core.picker.duration"
+
+    __slots__ = ()
+
     def __init__(self, data=None, meta=None):
-        super().__init__("big.bot.core.picker.duration", data, meta)
+        super().__init__(DurationNode.NODE_TYPE, data, meta)
 
 
 class IFrameNode(BaseNode):
+    NODE_TYPE = "big.bot.core.iframe"
+
+    __slots__ = ()
+
     def __init__(self, data, meta=None):
-        super().__init__("big.bot.core.iframe", data, meta)
+        super().__init__(IFrameNode.NODE_TYPE, data, meta)
 
 
 class ImageNode(BaseNode):
+    NODE_TYPE = "big.bot.core.image"
+
+    __slots__ = ()
+
     def __init__(self, data, meta=None):
-        super().__init__("big.bot.core.image", data, meta)
+        super().__init__(ImageNode.NODE_TYPE, data, meta)
 
 
     """The InputFileNode should have the following structure:
@@ -166,18 +187,30 @@ class ImageNode(BaseNode):
         + size: Maximun size of the file in bytes.
     """
 class InputFileNode(BaseNode):
+    NODE_TYPE = "big.bot.core.picker.file"
+
+    __slots__ = ()
+
     def __init__(self, data, meta=None):
-        super().__init__("big.bot.core.picker.file", data, meta)
+        super().__init__(InputFileNode.NODE_TYPE, data, meta)
 
 
 class NotificationNode(BaseNode):
+    NODE_TYPE = "big.bot.core.notification"
+
+    __slots__ = ()
+
     def __init__(self, data, meta=None):
-        super().__init__("big.bot.core.notification", data, meta)
+        super().__init__(NotificationNode.NODE_TYPE, data, meta)
 
 
 class OAuthNode(BaseNode):
+    NODE_TYPE = "big.bot.core.oauth"
+
+    __slots__ = ()
+
     def __init__(self, data, meta=None):
-        super().__init__("big.bot.core.oauth", data, meta)
+        super().__init__(OAuthNode.NODE_TYPE, data, meta)
 
 
     """Node to PreviewNode provides webpage previews for a given a URL, it has the following structure
@@ -191,6 +224,10 @@ class OAuthNode(BaseNode):
     }
     """
 class PreviewNode(BaseNode):
+    NODE_TYPE = "big.bot.core.preview"
+
+    __slots__ = ()
+
     def __init__(self, data, meta=None):
         try:
             from contrib.utils import web_preview
@@ -206,10 +243,14 @@ class PreviewNode(BaseNode):
             "title": meta.get("title", title),
         })
 
-        super().__init__("big.bot.core.preview", data, meta)
+        super().__init__(PreviewNode.NODE_TYPE, data, meta)
 
 
 class PaymentNode(BaseNode):
+    NODE_TYPE = "big.bot.core.payment"
+
+    __slots__ = ()
+
     def __init__(self, data, meta=None):
         meta = meta or {}
         meta.update({
@@ -236,13 +277,15 @@ class PaymentNode(BaseNode):
             ]),
         })
 
-        super().__init__("big.bot.core.payment", data, meta)
+        super().__init__(PaymentNode.NODE_TYPE, data, meta)
 
 
 
 class SearchNode(BaseNode):
     NODE_TYPE = "big.bot.core.search"
 
+    __slots__ = ()
+
     def __init__(self, data, meta=None):
         super().__init__(SearchNode.NODE_TYPE, data, meta)
 
@@ -275,6 +318,8 @@ class SearchNode(BaseNode):
 class SkipNode(BaseNode):
     NODE_TYPE = "big.bot.core.skip"
 
+    __slots__ = ()
+
     def __init__(self, data=None, meta=None):
         super().__init__(SkipNode.NODE_TYPE, data, meta)
 
@@ -282,6 +327,8 @@ class SkipNode(BaseNode):
 class TextNode(BaseNode):
     NODE_TYPE = "big.bot.core.text"
 
+    __slots__ = ()
+
     def __init__(self, data, meta=None):
         super().__init__(TextNode.NODE_TYPE, data, meta)
 
@@ -289,6 +336,8 @@ class TextNode(BaseNode):
 class TTSNode(BaseNode):
     NODE_TYPE = "big.bot.core.tts"
 
+    __slots__ = ()
+
     def __init__(self, data, meta=None):
         super().__init__(TTSNode.NODE_TYPE, data, meta)
 
@@ -1,11 +1,14 @@
+import asyncio
+import inspect
 import json
 import time
 
 from . import Log
 from . import Block
-from .Block import get_block_by_id, InputBlock, PromptBlock
+from .Block import InputBlock, PromptBlock
+from .Skill import SKILL_CACHE, compile_skill
 from .Statement import OutputStatement, InputStatement
-# from bigbot.runtime import RustTokioRuntime
+
 
 class BaseProcessor:
     def __init__(self):
@@ -17,86 +20,244 @@ class BaseProcessor:
     def get_context(self):
         return {"user": {"first_name": "Bob"}}
 
-async def cancel_skill(binder):
+
+def cancel_skill(binder):
     try:
-        state = await binder.on_load_state()
+        state = binder.load_state()
         state.skill = None
         state.block_id = None
         state.data = {}
         state.extra = {}
-        await binder.on_save_state(state.serialize())
+        binder.save_state(state)
 
-        output = OutputStatement(await binder.on_load_state().operator_id)
+        output = OutputStatement(state.operator_id)
         output.append_text("Your request has been cancelled.")
-        await binder.post_message(output)
+        binder.post_message(output)
     except Exception as e:
         Log.error("cancel_skill", str(e))
 
+
+def drive(steps):
+    """Run a generator of hook calls, see SkillProcessor.steps, and return its value.
+
+    The generator yields (function, *args) and gets the result of function(*args) back. The
+    sync and async engines share the generator, only the driver differs.
+    """
+    result = None
+    try:
+        while True:
+            function, *args = steps.send(result)
+            result = function(*args)
+    except StopIteration as stop:
+        return stop.value
+
+
+async def async_drive(steps):
+    """Same as drive, awaiting the results of the hooks that are awaitable."""
+    result = None
+    try:
+        while True:
+            function, *args = steps.send(result)
+            result = function(*args)
+            if inspect.isawaitable(result):
+                result = await result
+    except StopIteration as stop:
+        return stop.value
+
+
 class SkillProcessor(BaseProcessor):
-    async def on_process(self, binder, input, is_start=False):
-        runtime = RustTokioRuntime()
+    """Runs the blocks of the active skill for one turn.
+
+    The processor starts at the block stored in the state and keeps walking through the
+    connections until it reaches an input block (which waits for the next message), the end of
+    the skill, or the per turn budget. The budget (max_steps blocks, max_time seconds spent in the
+    blocks) defaults to the binder's max_steps_per_turn and max_time_per_turn; when it's exhausted
+    the turn stops and the next turn resumes at the pending block, then gives its message to the
+    first input block it reaches. The budget is checked between blocks, a single long block isn't
+    interrupted. The state is saved once, at the end.
+    """
+
+    def __init__(self, max_steps=None, max_time=None):
+        super().__init__()
+        self.max_steps = max_steps
+        self.max_time = max_time
+
+    def on_process(self, binder, input, is_start=False):
         try:
-            state = await binder.on_load_state()
-            skill = state.skill
-            block_id = state.block_id
+            state = binder.load_state()
+            skill, block_id = self.run(binder, state, input, is_start)
+            self.save(binder, skill, block_id)
+        except Exception as e:
+            Log.error("SkillProcessor", str(e))
 
-            block_object = await runtime.block_on(get_block_by_id(binder, skill, block_id))
+    def run(self, binder, state, input, is_start=False):
+        """Process blocks and return the skill reference and block id to resume from."""
+        return drive(self.steps(binder, state, binder.load_skill(state), input, is_start))
 
-            if isinstance(block_object, InputBlock):
-                block_result = await runtime.block_on(block_object.process(binder, state.operator_id, input))
-            else:
-                block_result = await runtime.block_on(block_object.process(binder, state.operator_id))
+    def steps(self, binder, state, skill, input, is_start=False):
+        """Walk the blocks of the turn, yielding the calls to process_block, flush and
+        binder.on_get_skill for a driver to make. Returns the skill reference and block id to
+        resume from.
+
+        A turn that doesn't start the skill and resumes at a block other than an input block (the
+        previous turn ran out of budget) runs the pending blocks up to the next input block, and
+        that block reads the message of the turn."""
+        max_steps = self.max_steps or binder.max_steps_per_turn
+        max_time = self.max_time or binder.max_time_per_turn
+        operator_id = state.operator_id
+        reference = state.skill
+        skill = compile_skill(skill, binder.get_registry())
+        block_id = state.block_id
+        # the message of the turn still has to be read by an input block
+        pending = not is_start and not issubclass(skill.get_block_class(block_id), InputBlock)
+        steps = 0
+        spent = 0.0
+
+        while True:
+            block_object = skill.get_block(binder.on_context(), block_id)
+            begin = time.monotonic()
+            block_result = yield (self.process_block, binder, block_object, operator_id, input)
+            spent += time.monotonic() - begin
+            yield (self.flush, binder)
+            steps += 1
 
             if block_result.connection is None:
-                state.skill = None
-                state.block_id = None
-                state.data = {}
-                state.extra = {}
-                await binder.on_save_state(state.serialize())
                 Log.debug("SkillProcessor", "skill completed!")
                 post_skill_package = block_result.post_skill()
-                post_skill = await runtime.block_on(binder.on_get_skill(post_skill_package))
-                if post_skill:
-                    # start new chain skill
-                    post_skill_input = InputStatement(state.user_id)
-                    post_skill_input.input = post_skill
-                    await StartSkill().on_process(binder, post_skill_input)
+                post_skill = None
+                if post_skill_package:
+                    post_skill = yield (binder.on_get_skill, post_skill_package)
+                if not post_skill:
+                    return None, None
+                # start new chain skill, its blocks read the skill from the saved state
+                input = InputStatement(state.user_id)
+                input.input = post_skill
+                pending = False
+                reference = SKILL_CACHE.reference(post_skill)
+                skill = compile_skill(SKILL_CACHE.resolve(reference), binder.get_registry())
+                block_id = skill.start
+                self.save(binder, reference, block_id, reset=True)
             else:
-                state.block_id = block_result.connection
-                await binder.on_save_state(state.serialize())
-                next_block = await runtime.block_on(get_block_by_id(binder, skill, block_result.connection))
-                if not isinstance(next_block, InputBlock):
-                    await self.on_process(binder, input)
-        except Exception as e:
-            Log.error("SkillProcessor", str(e))
-        finally:
-            del runtime
+                block_id = block_result.connection
+                if issubclass(skill.get_block_class(block_id), InputBlock):
+                    if not pending:
+                        return reference, block_id
+                    # past the budget too, or the message would be lost
+                    pending = False
+                    continue
 
-async def standard_input(binder, input):
-    runtime = RustTokioRuntime()
+            if steps >= max_steps or spent >= max_time:
+                Log.warning(
+                    "SkillProcessor",
+                    f"turn budget exhausted after {steps} blocks, resuming at {block_id}",
+                )
+                return reference, block_id
+
+    def process_block(self, binder, block_object, operator_id, input):
+        if isinstance(block_object, InputBlock):
+            return block_object.process(binder, operator_id, input)
+        return block_object.process(binder, operator_id)
+
+    def flush(self, binder):
+        binder.flush_output()
+
+    def save(self, binder, skill, block_id, reset=False):
+        # blocks may have saved data during the turn, so update the latest state
+        state = binder.load_state()
+        state.skill = skill
+        state.block_id = block_id
+        if skill is None or reset:
+            state.data = {}
+            state.extra = {}
+        binder.save_state(state)
+
+
+def standard_input(binder, input):
     try:
-        output = OutputStatement(await binder.on_load_state().operator_id)
-        final_output = await runtime.block_on(binder.on_standard_input(input, output))
+        output = OutputStatement(binder.load_state().operator_id)
+        final_output = binder.on_standard_input(input, output)
         if final_output:
-            await binder.post_message(final_output)
+            binder.post_message(final_output)
     except Exception as e:
         Log.error("standard_input", str(e))
-    finally:
-        del runtime
+
 
 class StartSkill(BaseProcessor):
+    def on_process(self, binder, input):
+        try:
+            skill = input.input
+
+            state = binder.load_state()
+            state.skill = SKILL_CACHE.reference(skill)
+            state.block_id = skill["start"]
+            binder.save_state(state)
+
+            SkillProcessor().on_process(binder, input, True)
+        except Exception as e:
+            Log.error("StartSkill", str(e))
+
+
+# ----------------------------------------------------------------------
+# Async processors, used by main.Binder.AsyncBinder
+# ----------------------------------------------------------------------
+
+
+async def async_standard_input(binder, input):
+    try:
+        output = OutputStatement(binder.load_state().operator_id)
+        final_output = await binder.on_standard_input(input, output)
+        if final_output:
+            binder.post_message(final_output)
+    except Exception as e:
+        Log.error("standard_input", str(e))
+
+
+class AsyncSkillProcessor(SkillProcessor):
+    """SkillProcessor running on an event loop.
+
+    Messages posted by a block are buffered by the binder, and blocks flagged as blocking
+    (the ones calling components) run in a worker thread so they don't stall other conversations.
+    The time budget only counts the time spent in the blocks of the turn, not the time spent
+    waiting for other conversations sharing the event loop. Like the budget, the worker thread
+    doesn't bound a single long block: it frees the event loop, not the turn.
+    """
+
+    async def on_process(self, binder, input, is_start=False):
+        try:
+            state = binder.load_state()
+            skill, block_id = await self.run(binder, state, input, is_start)
+            self.save(binder, skill, block_id)
+        except Exception as e:
+            Log.error("SkillProcessor", str(e))
+
+    async def run(self, binder, state, input, is_start=False):
+        """Process blocks and return the skill reference and block id to resume from."""
+        skill = await binder.async_load_skill(state)
+        return await async_drive(self.steps(binder, state, skill, input, is_start))
+
+    async def process_block(self, binder, block_object, operator_id, input):
+        if isinstance(block_object, InputBlock):
+            args = (binder, operator_id, input)
+        else:
+            args = (binder, operator_id)
+        if block_object.blocking:
+            return await asyncio.to_thread(block_object.process, *args)
+        return block_object.process(*args)
+
+    async def flush(self, binder):
+        await binder.async_flush_output()
+
+
+class AsyncStartSkill(StartSkill):
     async def on_process(self, binder, input):
-        runtime = RustTokioRuntime()
         try:
             skill = input.input
 
-            state = await binder.on_load_state()
-            state.skill = skill
+            state = binder.load_state()
+            state.skill = SKILL_CACHE.reference(skill)
             state.block_id = skill["start"]
-            await binder.on_save_state(state.serialize())
+            binder.save_state(state)
 
-            await SkillProcessor().on_process(binder, input, True)
+            await AsyncSkillProcessor().on_process(binder, input, True)
         except Exception as e:
             Log.error("StartSkill", str(e))
-        finally:
-            del runtime
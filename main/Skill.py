@@ -0,0 +1,284 @@
+"""Skill definitions shared by every conversation of the process.
+
+A skill definition is a plain dict with a list of blocks. Looking a block up in that list (and its
+component in the registry) is a linear scan, which gets expensive for large skills because it
+happens on every turn. CompiledSkill indexes a definition once so every lookup is a dict access.
+
+Conversations don't carry the definition in their state, they only keep a reference
+{"package": ..., "version": ...} which is resolved against SKILL_CACHE, a read-only, versioned
+and size bounded cache of definitions.
+"""
+
+from collections import OrderedDict
+import hashlib
+import json
+import threading
+
+from . import Log
+from .Block import (
+    BlockNotFoundException,
+    ComponentNotFoundException,
+    index_connections,
+    index_properties,
+)
+
+
+COMPILED_CACHE_SIZE = 256
+SKILL_CACHE_SIZE = 512
+
+
+class CompiledSkill:
+    """Read-only index over a skill definition.
+
+    Attributes:
+        skill (dict): The source skill definition.
+        package (str): Skill's identifier, e.g. "com.bits.wordpress".
+        version: Skill's version, None when the definition has no version.
+        start (str): Id of the starting block.
+        blocks (dict): Block id -> block record, as found in skill["blocks"].
+        components (dict): Block id -> block class, None when the component isn't registered.
+        connections (dict): Block id -> {connection code: target block id}.
+        values (dict): Block id -> {property name: property value}.
+    """
+
+    def __init__(self, skill, registry):
+        self.skill = skill
+        self.package = skill.get("package")
+        self.version = skill.get("version")
+        self.start = skill.get("start")
+        self.blocks = {}
+        self.components = {}
+        self.connections = {}
+        self.values = {}
+
+        for record in skill["blocks"]:
+            block_id = record["id"]
+            self.blocks[block_id] = record
+            self.components[block_id] = registry.get_block_class(record["component"])
+            self.connections[block_id] = index_connections(record.get("connections"))
+            self.values[block_id] = index_properties(record["properties"])
+
+    def __len__(self):
+        return len(self.blocks)
+
+    def __contains__(self, block_id):
+        return block_id in self.blocks
+
+    def get_record(self, block_id):
+        """Return the block record for the given id."""
+        try:
+            return self.blocks[block_id]
+        except KeyError:
+            raise BlockNotFoundException(f"Block not found for id: {block_id}")
+
+    def get_block_class(self, block_id):
+        """Return the block class registered for the component of the given block."""
+        block_class = self.components.get(block_id)
+        if block_class is None:
+            if block_id not in self.blocks:
+                raise BlockNotFoundException(f"Block not found for id: {block_id}")
+            raise ComponentNotFoundException(f"Component not found for id: {block_id}")
+        return block_class
+
+    def get_block(self, context, block_id):
+        """Return a new block object for the given id, sharing the indexes of the definition."""
+        block_class = self.get_block_class(block_id)
+        record = self.blocks[block_id]
+        return block_class(
+            context=context,
+            id=block_id,
+            properties=record["properties"],
+            connections=record.get("connections"),
+            values=self.values[block_id],
+            targets=self.connections[block_id],
+        )
+
+    def get_connection(self, block_id, code):
+        """Return the target block id of a connection, None if the block has no such connection."""
+        return self.connections.get(block_id, {}).get(code)
+
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def compile_skill(skill, registry):
+    """Return the CompiledSkill of a skill definition.
+
+    Compiled skills are cached per registered blocks, package and version, so registries made
+    per request share them. Definitions without a version are only reused while the very same
+    dict object is passed in, so an edited skill is never served from a stale index.
+    """
+    if isinstance(skill, CompiledSkill):
+        return skill
+
+    key = (registry.block_key(), skill.get("package"), skill.get("version"))
+    with _cache_lock:
+        compiled = _cache.get(key)
+        if compiled is not None and (compiled.version is not None or compiled.skill is skill):
+            _cache.move_to_end(key)
+            return compiled
+
+    compiled = CompiledSkill(skill, registry)
+    with _cache_lock:
+        _cache[key] = compiled
+        _cache.move_to_end(key)
+        while len(_cache) > COMPILED_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return compiled
+
+
+def clear_cache():
+    """Drop every compiled skill, e.g. after the registry changed."""
+    with _cache_lock:
+        _cache.clear()
+
+
+class FrozenDict(dict):
+    """A dict that can't be modified. It's still a dict, so it can be serialized as usual."""
+
+    def _readonly(self, *args, **kwargs):
+        raise TypeError("Skill definitions are read-only")
+
+    __setitem__ = _readonly
+    __delitem__ = _readonly
+    clear = _readonly
+    pop = _readonly
+    popitem = _readonly
+    setdefault = _readonly
+    update = _readonly
+    __ior__ = _readonly
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __reduce__(self):
+        return (FrozenDict, (dict(self),))
+
+
+def freeze(value):
+    """Return a read-only deep copy of a JSON like value, lists are turned into tuples."""
+    if isinstance(value, FrozenDict):
+        return value
+    if isinstance(value, dict):
+        return FrozenDict((key, freeze(item)) for key, item in value.items())
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(item) for item in value)
+    return value
+
+
+def skill_version(skill):
+    """Return the version of a skill definition.
+
+    Definitions without a "version" field are versioned by a fingerprint of their content.
+    """
+    version = skill.get("version")
+    if version is None:
+        content = json.dumps(skill, sort_keys=True, default=str).encode()
+        version = hashlib.sha1(content).hexdigest()
+    return version
+
+
+def is_reference(skill):
+    """Return True if skill is a reference instead of a full definition."""
+    return isinstance(skill, dict) and "blocks" not in skill
+
+
+class SkillCache:
+    """Process wide cache of read-only skill definitions keyed by (package, version).
+
+    The least recently used definitions are dropped once the cache holds more than max_size
+    definitions; they are loaded again on demand through a loader, usually Binder.on_get_skill.
+    A version replaced by the one the loader returned (the skill was published again) is
+    remembered, later requests of the old version get the new one without loading it again.
+    """
+
+    def __init__(self, max_size=SKILL_CACHE_SIZE):
+        self.max_size = max_size
+        self._skills = OrderedDict()
+        self._replaced = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._skills)
+
+    def put(self, skill):
+        """Store a definition and return its read-only copy."""
+        if isinstance(skill, FrozenDict) and skill.get("version") is not None:
+            frozen = skill
+        else:
+            frozen = freeze({**skill, "version": skill_version(skill)})
+
+        key = (frozen.get("package"), frozen["version"])
+        with self._lock:
+            cached = self._skills.get(key)
+            if cached is not None:
+                self._skills.move_to_end(key)
+                return cached
+            self._skills[key] = frozen
+            while len(self._skills) > self.max_size:
+                self._skills.popitem(last=False)
+        return frozen
+
+    def get(self, package, version=None, loader=None):
+        """Return a definition, loading it with loader(package) when it isn't cached.
+
+        Returns None if the definition isn't cached and can't be loaded. When the loader returns
+        a different version than the requested one, the loaded version is returned.
+        """
+        with self._lock:
+            key = (package, self._replaced.get((package, version), version))
+            skill = self._skills.get(key)
+            if skill is not None:
+                self._skills.move_to_end(key)
+                return skill
+
+        if loader is None:
+            return None
+        loaded = loader(package)
+        if not loaded:
+            return None
+        skill = self.put(loaded)
+        if version is not None and skill["version"] != version:
+            Log.warning("SkillCache", f"{package} version {version} replaced by {skill['version']}")
+            with self._lock:
+                self._replaced[(package, version)] = skill["version"]
+                while len(self._replaced) > self.max_size:
+                    self._replaced.popitem(last=False)
+        return skill
+
+    def reference(self, skill):
+        """Store a definition and return the reference kept in the conversation state."""
+        skill = self.put(skill)
+        return {"package": skill.get("package"), "version": skill["version"]}
+
+    def resolve(self, skill, loader=None):
+        """Return the definition for a reference, full definitions are cached and returned."""
+        if skill is None:
+            return None
+        if is_reference(skill):
+            return self.get(skill.get("package"), skill.get("version"), loader)
+        return self.put(skill)
+
+    def invalidate(self, package):
+        """Drop every cached version of a package and its compiled skills, e.g. after it was
+        published again, maybe under the same version."""
+        with self._lock:
+            for key in [key for key in self._skills if key[0] == package]:
+                del self._skills[key]
+            for key in [key for key in self._replaced if key[0] == package]:
+                del self._replaced[key]
+        with _cache_lock:
+            for key in [key for key in _cache if key[1] == package]:
+                del _cache[key]
+
+    def clear(self):
+        with self._lock:
+            self._skills.clear()
+            self._replaced.clear()
+
+
+SKILL_CACHE = SkillCache()
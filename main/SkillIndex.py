@@ -0,0 +1,297 @@
+"""Routing index of the utterances of every installed skill.
+
+on_skill_intent picks the skill starting for a message that no active skill handles. SkillIndex
+embeds the utterances of every skill once, into one contiguous matrix of unit vectors (float32,
+or float16 for half the memory) where the rows of a skill are adjacent, so routing a message is
+a single matrix product followed by a max per skill:
+
+    def on_skill_intent(self, statement):
+        return get_skill_index().route(statement.analysis.vector)
+
+Skills published to the SkillStore are added to the index of the process and removed ones are
+dropped, see core.signals, the rebuild_skill_index command indexes every published skill at once.
+The index is saved as a directory:
+
+    meta.json          format version, dtype, packages and utterance count of each package
+    vectors-<id>.npy   one unit vector per utterance, rows of a package are contiguous
+    .lock              locked by update_skill_index while it reads, updates and saves the index
+
+meta.json is replaced atomically and names the vectors file, a new file is written on every
+save so readers never see a partial index. Workers memory-map the vectors when they load the
+index, so the workers of a host share their pages, and get_skill_index reloads it when another
+process saved a newer one. Adding to or removing from a mapped index copies it to the memory of
+the process.
+"""
+
+from contextlib import contextmanager
+import fcntl
+import json
+import os
+import threading
+import time
+import uuid
+
+import numpy as np
+
+from . import Constant
+from .Nlp import get_nlp
+
+
+FORMAT_VERSION = 1
+
+
+def embed_texts(texts):
+    """Return the vectors of texts from the shared spaCy model, one row per text."""
+    return np.array([doc.vector for doc in get_nlp().pipe(texts)], dtype=np.float32)
+
+
+def _normalize(matrix):
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return np.divide(matrix, norms, out=np.zeros_like(matrix), where=norms > 0)
+
+
+class SkillIndex:
+    """Utterance vectors of the installed skills.
+
+    Attributes:
+        packages (list): Package of every skill, in the order of their rows.
+        counts (numpy.ndarray): Number of utterances of every package.
+        vectors (numpy.ndarray): Unit vector of every utterance, float32 or float16.
+    """
+
+    def __init__(self, width=0, dtype=np.float32, embed=None):
+        self.packages = []
+        self.counts = np.zeros(0, np.int64)
+        self.vectors = np.zeros((0, width), dtype)
+        self.embed = embed
+
+    def __len__(self):
+        return len(self.packages)
+
+    def __contains__(self, package):
+        return package in self.packages
+
+    def copy(self):
+        """Return an index sharing the vectors of this one, to update without disturbing readers."""
+        index = SkillIndex(self.vectors.shape[1], self.vectors.dtype, self.embed)
+        index.packages = list(self.packages)
+        index.counts = self.counts
+        index.vectors = self.vectors
+        return index
+
+    def add(self, package, utterances, vectors=None):
+        """Add or replace the utterances of a package, vectors defaults to embed(utterances), the
+        embed function of the index or embed_texts."""
+        self.remove(package)
+        if vectors is None and utterances:
+            vectors = (self.embed or embed_texts)(list(utterances))
+        if vectors is None or not len(vectors):
+            return
+        vectors = _normalize(np.asarray(vectors, np.float32))
+        if not len(self.vectors):
+            self.vectors = np.zeros((0, vectors.shape[1]), self.vectors.dtype)
+        self.vectors = np.concatenate([self.vectors, vectors.astype(self.vectors.dtype)])
+        self.counts = np.append(self.counts, len(vectors))
+        self.packages.append(package)
+
+    def remove(self, package):
+        """Drop the utterances of a package, if it has any."""
+        if package not in self.packages:
+            return
+        position = self.packages.index(package)
+        start = int(self.counts[:position].sum())
+        stop = start + int(self.counts[position])
+        self.vectors = np.concatenate([self.vectors[:start], self.vectors[stop:]])
+        self.counts = np.delete(self.counts, position)
+        del self.packages[position]
+
+    def scores(self, queries):
+        """Return the best cosine of every query vector with the utterances of every package."""
+        queries = _normalize(np.atleast_2d(np.asarray(queries, np.float32)))
+        if not self.packages:
+            return np.zeros((len(queries), 0), np.float32)
+        if self.vectors.dtype == np.float32:
+            similarity = queries @ self.vectors.T
+        else:
+            # float16 products don't go through BLAS, cast blocks of rows instead
+            similarity = np.empty((len(queries), len(self.vectors)), np.float32)
+            for start in range(0, len(self.vectors), Constant.SKILL_INDEX_BLOCK):
+                block = self.vectors[start : start + Constant.SKILL_INDEX_BLOCK]
+                similarity[:, start : start + len(block)] = queries @ block.astype(np.float32).T
+        starts = np.cumsum(self.counts) - self.counts
+        return np.maximum.reduceat(similarity, starts, axis=1)
+
+    def search(self, query, k=5):
+        """Return (package, score) of the k packages nearest to a query vector, best first.
+
+        A matrix of query vectors returns one list per query."""
+        scores = self.scores(query)
+        k = min(k, len(self.packages))
+        results = []
+        for row in scores:
+            best = np.argpartition(-row, k - 1)[:k] if 0 < k < len(row) else np.arange(k)
+            best = best[np.lexsort((best, -row[best]))]
+            results.append([(self.packages[i], float(row[i])) for i in best])
+        return results if np.ndim(query) == 2 else results[0]
+
+    def route(self, query, threshold=Constant.SKILL_ROUTE_THRESHOLD):
+        """Return the package nearest to a query vector, None below threshold."""
+        best = self.search(query, 1)
+        if best and best[0][1] >= threshold:
+            return best[0][0]
+        return None
+
+    def save(self, path):
+        """Write the index to the directory path."""
+        os.makedirs(path, exist_ok=True)
+        meta_path = os.path.join(path, "meta.json")
+        previous = _read_meta(path) if os.path.exists(meta_path) else {}
+
+        vectors = f"vectors-{uuid.uuid4().hex}.npy"
+        np.save(os.path.join(path, vectors), np.ascontiguousarray(self.vectors))
+        meta = {
+            "format": FORMAT_VERSION,
+            "dtype": self.vectors.dtype.name,
+            "width": self.vectors.shape[1],
+            "packages": self.packages,
+            "counts": self.counts.tolist(),
+            "vectors": vectors,
+        }
+        with open(meta_path + ".tmp", "w", encoding="utf-8") as file:
+            json.dump(meta, file)
+        os.replace(meta_path + ".tmp", meta_path)
+        # mapped copies of the previous file stay readable until their workers reload
+        if previous.get("vectors"):
+            os.remove(os.path.join(path, previous["vectors"]))
+
+    @classmethod
+    def load(cls, path, mmap=True, embed=None):
+        """Read an index written by save, memory-mapping the vectors unless mmap is False."""
+        for attempt in range(3):
+            meta = _read_meta(path)
+            version = meta.get("format")
+            if not isinstance(version, int) or version > FORMAT_VERSION:
+                raise ValueError(f"Unsupported skill index format {version!r} in {path}")
+            try:
+                vectors = np.load(
+                    os.path.join(path, meta["vectors"]), mmap_mode="r" if mmap else None
+                )
+                break
+            except FileNotFoundError:
+                # saved again between reading meta.json and opening its vectors
+                if attempt == 2:
+                    raise
+
+        index = cls(meta["width"], np.dtype(meta["dtype"]), embed)
+        index.packages = list(meta["packages"])
+        index.counts = np.array(meta["counts"], np.int64)
+        index.vectors = vectors
+        return index
+
+
+def _read_meta(path):
+    with open(os.path.join(path, "meta.json"), encoding="utf-8") as file:
+        return json.load(file)
+
+
+class _SharedIndex:
+    def __init__(self, path):
+        self.path = path
+        self.index = None
+        self.mtime = None
+        self.checked = 0.0
+
+
+_shared = {}
+_shared_lock = threading.Lock()
+_default_path = Constant.SKILL_INDEX_PATH
+
+
+def get_skill_index(path=None):
+    """Return the index stored at path, loaded once per process and reloaded when it changes.
+
+    An index is made empty when path has none yet."""
+    path = os.path.abspath(path or _default_path)
+    now = time.monotonic()
+    shared = _shared.get(path)
+    if shared is not None and now - shared.checked < Constant.SKILL_INDEX_REFRESH:
+        return shared.index
+    with _shared_lock:
+        shared = _shared.setdefault(path, _SharedIndex(path))
+        shared.checked = now
+        try:
+            mtime = os.stat(os.path.join(path, "meta.json")).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        if shared.index is None or (mtime is not None and mtime != shared.mtime):
+            shared.index = SkillIndex.load(path) if mtime is not None else SkillIndex()
+            shared.mtime = mtime
+        return shared.index
+
+
+@contextmanager
+def _index_lock(path):
+    """Hold the lock file of the index directory, shared by every process saving the index."""
+    os.makedirs(path, exist_ok=True)
+    with open(os.path.join(path, ".lock"), "a") as file:
+        fcntl.flock(file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(file, fcntl.LOCK_UN)
+
+
+def update_skill_index(package, utterances, path=None):
+    """Add or replace (remove when utterances is empty) a package and save the index.
+
+    The index is read, updated and saved under the lock file of its directory, so concurrent
+    updates of several processes all land. Readers keep the index they got, the updated one
+    replaces it."""
+    path = os.path.abspath(path or _default_path)
+    meta_path = os.path.join(path, "meta.json")
+    # embedded before taking the locks, the other updates don't wait for the NLP
+    vectors = embed_texts(list(utterances)) if utterances else None
+    with _shared_lock, _index_lock(path):
+        shared = _shared.setdefault(path, _SharedIndex(path))
+        mtime = os.stat(meta_path).st_mtime_ns if os.path.exists(meta_path) else None
+        if mtime is not None and (shared.index is None or mtime != shared.mtime):
+            index = SkillIndex.load(path, mmap=False)
+        else:
+            index = shared.index.copy() if shared.index is not None else SkillIndex()
+        index.add(package, utterances, vectors)
+        index.save(path)
+        shared.index = index
+        shared.mtime = os.stat(meta_path).st_mtime_ns
+        shared.checked = time.monotonic()
+        return index
+
+
+def rebuild_skill_index(skills, path=None):
+    """Replace the index with one of the (package, utterances) pairs of skills and save it.
+
+    A package listed twice keeps its last utterances. Updates saved while the utterances are
+    embedded are replaced too."""
+    path = os.path.abspath(path or _default_path)
+    index = SkillIndex()
+    for package, utterances in skills:
+        index.add(package, utterances)
+    with _shared_lock, _index_lock(path):
+        index.save(path)
+        shared = _shared.setdefault(path, _SharedIndex(path))
+        shared.index = index
+        shared.mtime = os.stat(os.path.join(path, "meta.json")).st_mtime_ns
+        shared.checked = time.monotonic()
+    return index
+
+
+def warm_up(path):
+    """Load the index at path and make it the default one of get_skill_index."""
+    global _default_path
+    _default_path = path
+    return get_skill_index(path)
+
+
+def clear():
+    """Forget the loaded indexes, the next get_skill_index loads them again."""
+    with _shared_lock:
+        _shared.clear()
@@ -1,16 +1,229 @@
+from collections import OrderedDict
+import abc
+import copy
 import json
-from typing import Any, Dict, Optional
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from . import Constant, StateCodec
+from .Skill import SKILL_CACHE, is_reference
+
+
+def migrate_state_dict(state_dict: Dict[str, Any]) -> Dict[str, Any]:
+    """Return a state dictionary where the skill is a reference to the shared skill cache.
+
+    States saved before the skill cache existed carry the whole skill definition, the definition
+    is moved to the cache and replaced by its reference. Use this function to migrate stored rows.
+    """
+    skill = state_dict.get("skill")
+    if skill is not None and not is_reference(skill):
+        state_dict = {**state_dict, "skill": SKILL_CACHE.reference(skill)}
+    return state_dict
+
+
+class TrackedDict(dict):
+    """dict recording the keys set and deleted since the last reset, see ChannelState.delta.
+
+    Values changed in place (e.g. a list appended to) aren't recorded, ChannelState compares
+    the list and dict values with their saved fingerprint instead.
+    """
+
+    __slots__ = ("changed", "deleted")
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        # dicts used as ordered sets, the operations come out in the order they were made
+        self.changed: Dict[Any, None] = {}
+        self.deleted: Dict[Any, None] = {}
+
+    def reset(self) -> None:
+        self.changed.clear()
+        self.deleted.clear()
+
+    def _set(self, key: Any) -> None:
+        self.changed[key] = None
+        self.deleted.pop(key, None)
+
+    def _delete(self, key: Any) -> None:
+        self.deleted[key] = None
+        self.changed.pop(key, None)
+
+    def __setitem__(self, key: Any, value: Any) -> None:
+        super().__setitem__(key, value)
+        self._set(key)
+
+    def __delitem__(self, key: Any) -> None:
+        super().__delitem__(key)
+        self._delete(key)
+
+    def pop(self, key: Any, *default: Any) -> Any:
+        if key in self:
+            self._delete(key)
+        return super().pop(key, *default)
+
+    def popitem(self) -> Tuple[Any, Any]:
+        key, value = super().popitem()
+        self._delete(key)
+        return key, value
+
+    def setdefault(self, key: Any, default: Any = None) -> Any:
+        if key not in self:
+            self._set(key)
+        return super().setdefault(key, default)
+
+    def update(self, *args: Any, **kwargs: Any) -> None:
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def __ior__(self, other: Any) -> "TrackedDict":
+        self.update(other)
+        return self
+
+    def clear(self) -> None:
+        for key in list(self):
+            self._delete(key)
+        super().clear()
+
+    def __reduce__(self):
+        # unpickling calls __setitem__ before __init__, restore the keys and trackers at once
+        return (_tracked_dict, (dict(self), list(self.changed), list(self.deleted)))
+
+
+def _tracked_dict(values: Dict[Any, Any], changed: list, deleted: list) -> TrackedDict:
+    tracked = TrackedDict(values)
+    tracked.changed.update(dict.fromkeys(changed))
+    tracked.deleted.update(dict.fromkeys(deleted))
+    return tracked
+
+
+class StateDelta:
+    """Changes made to a ChannelState since it was loaded or last saved.
+
+    ops is a list of JSON serializable operations, applied in order:
+
+        ["field", name, value]        set skill or block_id (the block moved)
+        ["set", name, key, value]     set a key of data or extra
+        ["delete", name, key]         delete a key of data or extra
+        ["replace", name, values]     replace data or extra as a whole
+
+    When the changes can't be told (the state wasn't loaded from a dictionary or its kwargs
+    changed), snapshot holds the whole serialized state instead.
+    """
+
+    __slots__ = ("ops", "snapshot")
+
+    def __init__(self, ops: Optional[list] = None, snapshot: Optional[Dict[str, Any]] = None):
+        self.ops = ops or []
+        self.snapshot = snapshot
+
+    def __bool__(self) -> bool:
+        return self.snapshot is not None or bool(self.ops)
+
+    def __repr__(self) -> str:
+        if self.snapshot is not None:
+            return "StateDelta(snapshot)"
+        return f"StateDelta({self.ops!r})"
+
+    def apply(self, state_dict: Dict[str, Any]) -> Dict[str, Any]:
+        """Return a new state dictionary with the changes applied to state_dict."""
+        if self.snapshot is not None:
+            return dict(self.snapshot)
+        result = dict(state_dict)
+        for name in ("data", "extra"):
+            result[name] = dict(result.get(name) or {})
+        for op in self.ops:
+            if op[0] == "field":
+                result[op[1]] = op[2]
+            elif op[0] == "set":
+                result[op[1]][op[2]] = op[3]
+            elif op[0] == "delete":
+                result[op[1]].pop(op[2], None)
+            elif op[0] == "replace":
+                result[op[1]] = dict(op[2])
+        return result
+
+    def to_dict(self) -> Dict[str, Any]:
+        if self.snapshot is not None:
+            return {"snapshot": self.snapshot}
+        return {"ops": self.ops}
+
+    @classmethod
+    def from_dict(cls, delta_dict: Dict[str, Any]) -> "StateDelta":
+        return cls(delta_dict.get("ops"), delta_dict.get("snapshot"))
+
+
+class _Copy:
+    """Fingerprint of a value JSON can't encode (dates, mixed keys, ...): a deep copy of it."""
+
+    __slots__ = ("value",)
+
+    def __init__(self, value: Any) -> None:
+        self.value = value
+
+
+# the value couldn't be copied either, it's taken as changed
+_UNKNOWN = object()
+
+
+def _fingerprint(value: Any) -> Any:
+    """Return what tells if value changes in place, its JSON encoding or else a deep copy."""
+    try:
+        return json.dumps(value, sort_keys=True)
+    except (TypeError, ValueError):
+        pass
+    try:
+        return _Copy(copy.deepcopy(value))
+    except Exception:
+        return _Copy(_UNKNOWN)
+
+
+def _changed(value: Any, fingerprint: Any) -> bool:
+    """Return True if value differs from the value fingerprint was taken of."""
+    if isinstance(fingerprint, str):
+        try:
+            return json.dumps(value, sort_keys=True) != fingerprint
+        except (TypeError, ValueError):
+            return True
+    if fingerprint.value is _UNKNOWN:
+        return True
+    try:
+        return bool(value != fingerprint.value)
+    except Exception:
+        return True
 
 
 class ChannelState:
-    """Represents the state of a conversation channel."""
+    """Represents the state of a conversation channel.
+
+    The skill attribute is a reference {"package": ..., "version": ...} to the skill definition,
+    use Binder.load_skill to get the definition itself.
+
+    A state made by from_dict tracks its changes, delta() returns them as a StateDelta so a
+    backend can apply a partial update instead of writing the whole state again.
+    """
+
+    # tens of thousands of states stay alive in the workers and their caches
+    __slots__ = (
+        "user_id",
+        "operator_id",
+        "channel_id",
+        "kwargs",
+        "_skill",
+        "_block_id",
+        "_data",
+        "_extra",
+        "_fields",
+        "_replaced",
+        "_baseline",
+    )
 
     def __init__(
         self,
         user_id: str,
         operator_id: str,
         channel_id: str,
-        skill: Optional[Any] = None,
+        skill: Optional[Dict[str, Any]] = None,
         block_id: Optional[str] = None,
         data: Optional[Dict[str, Any]] = None,
         extra: Optional[Dict[str, Any]] = None,
@@ -20,16 +233,72 @@ class ChannelState:
         self.user_id = user_id
         self.operator_id = operator_id
         self.channel_id = channel_id
+        self._fields: Dict[str, None] = {}
+        self._replaced: Dict[str, None] = {}
+        self._baseline: Optional[Dict[str, Any]] = None
         self.skill = skill
         self.block_id = block_id
         self.data = data or {}
         self.extra = extra or {}
         self.kwargs = kwargs
 
+    @property
+    def skill(self) -> Optional[Dict[str, Any]]:
+        return self._skill
+
+    @skill.setter
+    def skill(self, value: Optional[Dict[str, Any]]) -> None:
+        self._skill = value
+        self._fields["skill"] = None
+
+    @property
+    def block_id(self) -> Optional[str]:
+        return self._block_id
+
+    @block_id.setter
+    def block_id(self, value: Optional[str]) -> None:
+        self._block_id = value
+        self._fields["block_id"] = None
+
+    @property
+    def data(self) -> Dict[str, Any]:
+        return self._data
+
+    @data.setter
+    def data(self, value: Dict[str, Any]) -> None:
+        # assigning the dict back (state.data = state.data) keeps its tracked changes
+        if value is getattr(self, "_data", None):
+            return
+        self._data = TrackedDict(value)
+        self._replaced["data"] = None
+
+    @property
+    def extra(self) -> Dict[str, Any]:
+        return self._extra
+
+    @extra.setter
+    def extra(self, value: Dict[str, Any]) -> None:
+        if value is getattr(self, "_extra", None):
+            return
+        self._extra = TrackedDict(value)
+        self._replaced["extra"] = None
+
+    def __copy__(self) -> "ChannelState":
+        state = self.__class__.__new__(self.__class__)
+        for name in ChannelState.__slots__:
+            setattr(state, name, getattr(self, name))
+        state._fields = dict(self._fields)
+        state._replaced = dict(self._replaced)
+        return state
+
     def has_skill(self) -> bool:
         """Return True if this ChannelState object has a skill associated with it."""
         return self.skill is not None
 
+    def is_active(self) -> bool:
+        """Return True if a skill is running, i.e. the state has a skill and a current block."""
+        return self.skill is not None and self.block_id is not None
+
     def update_data(self, key: str, value: Any) -> None:
         """Update the data attribute with a new key-value pair."""
         self.data[key] = value
@@ -38,6 +307,50 @@ class ChannelState:
         """Update the extra attribute with a new key-value pair."""
         self.extra[key] = value
 
+    def mark_saved(self) -> None:
+        """Start tracking changes from the current values, e.g. once they are written."""
+        self._fields.clear()
+        self._replaced.clear()
+        self._data.reset()
+        self._extra.reset()
+        # list and dict values can change in place, their fingerprint tells if they did
+        containers = {}
+        for name in ("data", "extra"):
+            for key, value in getattr(self, name).items():
+                if isinstance(value, (dict, list)):
+                    containers[name, key] = _fingerprint(value)
+        self._baseline = {
+            "skill": _fingerprint(self.skill),
+            "block_id": self.block_id,
+            "kwargs": _fingerprint(self.kwargs),
+            "containers": containers,
+        }
+
+    def delta(self) -> StateDelta:
+        """Return the changes made since the state was loaded or mark_saved was called."""
+        baseline = self._baseline
+        if baseline is None or _changed(self.kwargs, baseline["kwargs"]):
+            return StateDelta(snapshot=self.serialize())
+
+        ops = []
+        if "skill" in self._fields and _changed(self.skill, baseline["skill"]):
+            ops.append(["field", "skill", self.skill])
+        if "block_id" in self._fields and self.block_id != baseline["block_id"]:
+            ops.append(["field", "block_id", self.block_id])
+        for name in ("data", "extra"):
+            values = getattr(self, name)
+            if name in self._replaced:
+                ops.append(["replace", name, dict(values)])
+                continue
+            changed = dict(values.changed)
+            for (container, key), fingerprint in baseline["containers"].items():
+                if container == name and key in values and key not in changed:
+                    if _changed(values[key], fingerprint):
+                        changed[key] = None
+            ops.extend(["delete", name, key] for key in values.deleted)
+            ops.extend(["set", name, key, values[key]] for key in changed)
+        return StateDelta(ops)
+
     def serialize(self) -> Dict[str, Any]:
         """Return a dictionary representation of this ChannelState object."""
         return {
@@ -53,15 +366,305 @@ class ChannelState:
 
     @classmethod
     def from_dict(cls, state_dict: Dict[str, Any]) -> "ChannelState":
-        """Create a new ChannelState object from a dictionary."""
-        return cls(**state_dict)
+        """Create a new ChannelState object from a dictionary, tracking changes from there on."""
+        state = cls(**migrate_state_dict(state_dict))
+        state.mark_saved()
+        return state
 
     def to_json(self) -> str:
-        """Return a JSON representation of this ChannelState object."""
-        return json.dumps(self.serialize())
+        """Return a JSON representation of this ChannelState object, see main.StateCodec."""
+        return StateCodec.encode_json(self.serialize())
 
     @classmethod
     def from_json(cls, json_str: str) -> "ChannelState":
-        """Create a new ChannelState object from a JSON string."""
-        state_dict = json.loads(json_str)
-        return cls(**state_dict)
+        """Create a new ChannelState object from a JSON string, of any schema version."""
+        return cls.from_dict(StateCodec.decode(json_str))
+
+    def to_bytes(self) -> bytes:
+        """Return the compact binary representation of this ChannelState object."""
+        return StateCodec.encode(self.serialize())
+
+    @classmethod
+    def from_bytes(cls, encoded: bytes) -> "ChannelState":
+        """Create a new ChannelState object from to_bytes or to_json output."""
+        return cls.from_dict(StateCodec.decode(encoded))
+
+
+class StateSession:
+    """Unit of work for the state of a conversation during one turn.
+
+    The state is loaded from the binder at most once, every block gets the same ChannelState
+    object and saving only marks the session dirty. flush() writes the state back at most once.
+
+    Attributes:
+        loads (int): Number of Binder.on_load_state calls.
+        saves (int): Number of Binder.on_save_state_delta calls.
+    """
+
+    def __init__(self, binder):
+        self.binder = binder
+        self.state = None
+        self.dirty = False
+        self.loads = 0
+        self.saves = 0
+
+    @property
+    def backend_calls(self) -> int:
+        """Return the number of calls made to the binder's state hooks."""
+        return self.loads + self.saves
+
+    def load(self) -> ChannelState:
+        """Return the state of the turn, loading it on first use."""
+        if self.state is None:
+            self.state = self.binder.on_load_state()
+            self.loads += 1
+        return self.state
+
+    def save(self, state: ChannelState) -> None:
+        """Mark the state as modified, it's written when the session is flushed."""
+        self.state = state
+        self.dirty = True
+
+    def flush(self) -> None:
+        """Write the changes of the state if it was modified."""
+        if self.dirty:
+            self.binder.on_save_state_delta(self.state, self.state.delta())
+            self.state.mark_saved()
+            self.saves += 1
+            self.dirty = False
+
+    async def async_load(self) -> ChannelState:
+        """Load the state through an awaitable Binder.on_load_state, see main.Binder.AsyncBinder."""
+        if self.state is None:
+            self.state = await self.binder.on_load_state()
+            self.loads += 1
+        return self.state
+
+    async def async_flush(self) -> None:
+        """Write the changes through an awaitable Binder.on_save_state_delta if it was modified."""
+        if self.dirty:
+            await self.binder.on_save_state_delta(self.state, self.state.delta())
+            self.state.mark_saved()
+            self.saves += 1
+            self.dirty = False
+
+
+StateKey = Tuple[str, str, str]
+
+
+class StateStore(abc.ABC):
+    """Persists the states of the channels, serialized by ChannelState.serialize.
+
+    States are keyed by (user_id, operator_id, channel_id). Binders get a store through
+    StateStoreMixin instead of implementing on_load_state/on_save_state themselves.
+    """
+
+    @abc.abstractmethod
+    def load(self, key: StateKey) -> Optional[Dict[str, Any]]:
+        """Return the state dictionary of a channel, None if it has none."""
+
+    @abc.abstractmethod
+    def save(self, key: StateKey, state_dict: Dict[str, Any]) -> None:
+        """Write the state dictionary of a channel."""
+
+    @abc.abstractmethod
+    def delete(self, key: StateKey) -> None:
+        """Forget the state of a channel."""
+
+    def save_delta(self, key: StateKey, delta: StateDelta) -> bool:
+        """Apply the changes of a state, see ChannelState.delta.
+
+        Return False when the store has no state to apply them to, the caller then saves the
+        whole state. The default loads the state, applies the changes and saves it again.
+        """
+        if delta.snapshot is not None:
+            self.save(key, delta.snapshot)
+            return True
+        if not delta:
+            return True
+        state_dict = self.load(key)
+        if state_dict is None:
+            return False
+        self.save(key, delta.apply(state_dict))
+        return True
+
+
+class LruStateStore(StateStore):
+    """Bounded in-process cache in front of another store, writes go through to it.
+
+    Loads of recently used channels don't reach the backend. The cache only knows about the
+    writes of its own process, use it when the turns of a channel are handled by one process.
+
+    Attributes:
+        hits (int): Loads answered by the cache.
+        misses (int): Loads sent to the backend.
+    """
+
+    def __init__(self, backend: StateStore, max_size: int = Constant.STATE_CACHE_SIZE) -> None:
+        self.backend = backend
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        # states are kept encoded, every load gets its own copy
+        self._states: "OrderedDict[StateKey, bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._states)
+
+    def load(self, key: StateKey) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            encoded = self._states.get(key)
+            if encoded is not None:
+                self._states.move_to_end(key)
+                self.hits += 1
+                return StateCodec.decode(encoded)
+            self.misses += 1
+
+        state_dict = self.backend.load(key)
+        if state_dict is not None:
+            self._put(key, StateCodec.encode(state_dict))
+        return state_dict
+
+    def save(self, key: StateKey, state_dict: Dict[str, Any]) -> None:
+        encoded = StateCodec.encode(state_dict)
+        try:
+            self.backend.save(key, state_dict)
+        except Exception:
+            with self._lock:
+                self._states.pop(key, None)
+            raise
+        self._put(key, encoded)
+
+    def save_delta(self, key: StateKey, delta: StateDelta) -> bool:
+        with self._lock:
+            encoded = self._states.pop(key, None)
+        # the entry is dropped until the backend took the changes
+        saved = self.backend.save_delta(key, delta)
+        if saved and encoded is not None:
+            self._put(key, StateCodec.encode(delta.apply(StateCodec.decode(encoded))))
+        return saved
+
+    def delete(self, key: StateKey) -> None:
+        with self._lock:
+            self._states.pop(key, None)
+        self.backend.delete(key)
+
+    def clear(self) -> None:
+        """Empty the cache, the backend keeps the states."""
+        with self._lock:
+            self._states.clear()
+
+    def _put(self, key: StateKey, encoded: bytes) -> None:
+        with self._lock:
+            self._states[key] = encoded
+            self._states.move_to_end(key)
+            while len(self._states) > self.max_size:
+                self._states.popitem(last=False)
+
+
+class LocalKeyValue:
+    """In-process stand-in for a key-value server, with the get/set/delete calls of redis.Redis.
+
+    Use it in tests and single process deployments, KeyValueStateStore works the same with a
+    Redis client.
+    """
+
+    def __init__(self) -> None:
+        self._values: Dict[str, Tuple[bytes, Optional[float]]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, name: str) -> Optional[bytes]:
+        with self._lock:
+            item = self._values.get(name)
+            if item is None:
+                return None
+            if item[1] is not None and item[1] <= time.monotonic():
+                del self._values[name]
+                return None
+            return item[0]
+
+    def set(self, name: str, value, ex: Optional[float] = None) -> bool:
+        if isinstance(value, str):
+            value = value.encode()
+        with self._lock:
+            self._values[name] = (value, time.monotonic() + ex if ex else None)
+        return True
+
+    def delete(self, *names: str) -> int:
+        with self._lock:
+            return sum(self._values.pop(name, None) is not None for name in names)
+
+
+class KeyValueStateStore(StateStore):
+    """Keeps every state as one value of a key-value store, encoded by main.StateCodec.
+
+    client needs get(name), set(name, value, ex=None) and delete(name), e.g. redis.Redis or
+    LocalKeyValue. States expire after ttl seconds without a save when ttl is set. The store
+    has no partial update, save_delta leaves the changes to a save of the whole state.
+    """
+
+    def __init__(
+        self,
+        client=None,
+        prefix: str = Constant.STATE_KEY_PREFIX,
+        ttl: Optional[float] = None,
+    ) -> None:
+        self.client = client if client is not None else LocalKeyValue()
+        self.prefix = prefix
+        self.ttl = ttl
+
+    def name(self, key: StateKey) -> str:
+        """Return the name of the value holding the state of a channel."""
+        return ":".join([self.prefix, *map(str, key)])
+
+    def load(self, key: StateKey) -> Optional[Dict[str, Any]]:
+        value = self.client.get(self.name(key))
+        return StateCodec.decode(value) if value is not None else None
+
+    def save(self, key: StateKey, state_dict: Dict[str, Any]) -> None:
+        self.client.set(self.name(key), StateCodec.encode(state_dict), ex=self.ttl)
+
+    def save_delta(self, key: StateKey, delta: StateDelta) -> bool:
+        # a value is written as a whole, reading it to apply the changes would cost a GET more
+        # than the caller saving the state it has
+        if delta.snapshot is not None:
+            self.save(key, delta.snapshot)
+            return True
+        return not delta
+
+    def delete(self, key: StateKey) -> None:
+        self.client.delete(self.name(key))
+
+
+class StateStoreMixin(abc.ABC):
+    """Implements Binder.on_load_state and Binder.on_save_state with a StateStore.
+
+        class ChannelBinder(StateStoreMixin, Binder):
+            state_store = LruStateStore(DjangoStateStore())
+
+            def state_key(self):
+                return (self.user_id, self.operator_id, self.channel_id)
+
+    A channel without a saved state starts with an empty ChannelState.
+    """
+
+    state_store: Optional[StateStore] = None
+
+    @abc.abstractmethod
+    def state_key(self) -> StateKey:
+        """Return (user_id, operator_id, channel_id) of the conversation of the binder."""
+
+    def on_load_state(self) -> ChannelState:
+        key = self.state_key()
+        state_dict = self.state_store.load(key)
+        if state_dict is None:
+            return ChannelState(*key)
+        return ChannelState.from_dict(state_dict)
+
+    def on_save_state(self, state_json: Dict[str, Any]) -> None:
+        self.state_store.save(self.state_key(), state_json)
+
+    def on_save_state_delta(self, state: ChannelState, delta: StateDelta) -> None:
+        if delta and not self.state_store.save_delta(self.state_key(), delta):
+            self.state_store.save(self.state_key(), state.serialize())
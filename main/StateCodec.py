@@ -0,0 +1,113 @@
+"""Versioned encodings of ChannelState dictionaries.
+
+A state is stored in one of two encodings of the same document:
+
+    binary   msgpack array [version, user_id, operator_id, channel_id, skill, block_id, data,
+             extra, kwargs], the compact one used by the state stores
+    JSON     {"version": ..., "user_id": ..., ..., "kwargs": {...}}, readable, for debugging
+             and ChannelState.to_json; written with orjson when it's installed
+
+decode tells them apart by their first byte and returns the dictionary of
+ChannelState.serialize, the additional kwargs at the top level. Documents written with an older
+schema are upgraded on read, newer ones are refused, as are fields the schema doesn't know.
+
+Schema versions:
+
+    1  the ChannelState.serialize dictionary, without a version. Additional kwargs are mixed
+       with the fields and the skill may be a whole definition instead of a reference.
+    2  the kwargs are kept apart, the skill is a reference to the skill cache.
+"""
+
+import json
+from typing import Any, Callable, Dict, List, Union
+
+import msgpack
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+SCHEMA_VERSION = 2
+
+FIELDS = ("user_id", "operator_id", "channel_id", "skill", "block_id", "data", "extra", "kwargs")
+
+
+def _upgrade_1(document: Dict[str, Any]) -> Dict[str, Any]:
+    from .State import migrate_state_dict
+
+    return _document(migrate_state_dict(document), version=2)
+
+
+def _document(state_dict: Dict[str, Any], version: int = SCHEMA_VERSION) -> Dict[str, Any]:
+    document = {"version": version, "kwargs": {}}
+    for key, value in state_dict.items():
+        if key in FIELDS and key != "kwargs":
+            document[key] = value
+        else:
+            document["kwargs"][key] = value
+    return document
+
+
+# fields of the binary array of every version, after the version itself
+BINARY_FIELDS = {2: FIELDS}
+
+# UPGRADES[n] turns a document of version n into one of version n + 1
+UPGRADES: Dict[int, Callable[[Dict[str, Any]], Dict[str, Any]]] = {1: _upgrade_1}
+
+
+def upgrade(document: Dict[str, Any]) -> Dict[str, Any]:
+    """Bring a document written by an older schema up to SCHEMA_VERSION."""
+    version = document.get("version", 1)
+    if not isinstance(version, int) or version > SCHEMA_VERSION:
+        raise ValueError(f"Unsupported state schema version {version!r}")
+    while version < SCHEMA_VERSION:
+        document = UPGRADES[version](document)
+        version = document["version"]
+
+    unknown = set(document) - set(FIELDS) - {"version"}
+    if unknown:
+        raise ValueError(f"Unknown state fields {sorted(unknown)}")
+    return document
+
+
+def _state_dict(document: Dict[str, Any]) -> Dict[str, Any]:
+    state_dict = {field: document.get(field) for field in FIELDS[:-1]}
+    state_dict["data"] = state_dict["data"] or {}
+    state_dict["extra"] = state_dict["extra"] or {}
+    state_dict.update(document.get("kwargs") or {})
+    return state_dict
+
+
+def encode(state_dict: Dict[str, Any]) -> bytes:
+    """Return the binary encoding of a ChannelState.serialize dictionary."""
+    document = _document(state_dict)
+    values = [document.get(field) for field in BINARY_FIELDS[SCHEMA_VERSION]]
+    return msgpack.packb([SCHEMA_VERSION, *values])
+
+
+def encode_json(state_dict: Dict[str, Any]) -> str:
+    """Return the JSON encoding of a ChannelState.serialize dictionary."""
+    document = _document(state_dict)
+    if orjson is not None:
+        try:
+            return orjson.dumps(document, option=orjson.OPT_NON_STR_KEYS).decode()
+        except TypeError:
+            # e.g. integers beyond 64 bits, the json module writes them
+            pass
+    return json.dumps(document, separators=(",", ":"))
+
+
+def decode(encoded: Union[bytes, str]) -> Dict[str, Any]:
+    """Return the ChannelState.serialize dictionary of a binary or JSON encoded state."""
+    if isinstance(encoded, str):
+        encoded = encoded.encode()
+    if encoded[:1] == b"{":
+        document = orjson.loads(encoded) if orjson is not None else json.loads(encoded)
+    else:
+        values: List[Any] = msgpack.unpackb(encoded, strict_map_key=False)
+        if values[0] not in BINARY_FIELDS:
+            raise ValueError(f"Unsupported state schema version {values[0]!r}")
+        document = dict(zip(("version", *BINARY_FIELDS[values[0]]), values))
+    return _state_dict(upgrade(document))
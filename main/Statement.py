@@ -1,19 +1,34 @@
 import json
 
+from . import Constant
+from .Nlp import Analysis
 from .Node import BaseNode, TextNode, PaymentNode
 
 
 class InputStatement:
-    def __init__(self, user_id, text=None, input=None, flag=None):
+    __slots__ = ("user_id", "text", "input", "flag", "_analysis")
+
+    def __init__(self, user_id, text=None, input=None, flag=None, analysis=None):
         self.user_id = user_id
         self.text = text
         self.input = input
         self.flag = flag
+        self._analysis = analysis
 
     def __str__(self):
         return self.text if self.text else super().__str__()
 
+    @property
+    def analysis(self):
+        """Return the Analysis of the text, statements derived from this one share it."""
+        if self._analysis is None or self._analysis.text != (self.text or ""):
+            self._analysis = Analysis(self.text)
+        return self._analysis
+
     def get_node(self):
+        # plain text and other values that aren't nodes, i.e. most messages
+        if not isinstance(self.input, dict) or "node" not in self.input:
+            return None
         try:
             return BaseNode.deserialize(self.input)
         except Exception as e:
@@ -26,6 +41,8 @@ class InputStatement:
 class OutputStatement:
     """A statement represents a single spoken entity, sentence or phrase that someone can say."""
 
+    __slots__ = ("user_id", "confidence", "contents")
+
     def __init__(self, user_id, confidence=None):
         self.user_id = user_id
         self.confidence = confidence
@@ -87,3 +104,49 @@ class OutputStatement:
                 }
             contents.append(node_dict)
         return {"user_id": self.user_id, "confidence": self.confidence, "contents": contents}
+
+
+class OutputBuffer:
+    """Collects the statements posted during a turn, see Binder.output_buffer.
+
+    A statement posted several times (e.g. re-posted after appending a node) is kept once. With
+    the Constant.OUTPUT_COALESCE mode the pending statements are merged into a single
+    OutputStatement when taken. With Constant.OUTPUT_NODES every post makes a statement holding
+    the nodes that weren't sent yet, to be sent right away.
+    """
+
+    def __init__(self, mode=Constant.OUTPUT_COALESCE):
+        self.mode = mode
+        self.pending = []
+        # id of the statements posted in nodes mode -> (statement, number of nodes sent)
+        self.sent = {}
+
+    @property
+    def immediate(self):
+        """True when posted statements must be sent right away."""
+        return self.mode == Constant.OUTPUT_NODES
+
+    def post(self, statement):
+        if self.immediate:
+            _, count = self.sent.get(id(statement), (statement, 0))
+            if len(statement.contents) > count:
+                delta = OutputStatement(statement.user_id, statement.confidence)
+                delta.contents = statement.contents[count:]
+                self.pending.append(delta)
+                self.sent[id(statement)] = (statement, len(statement.contents))
+        elif not any(item is statement for item in self.pending):
+            self.pending.append(statement)
+
+    def checkpoint(self):
+        """Return the statements to send now, nothing unless the output is streamed."""
+        return [] if self.mode == Constant.OUTPUT_COALESCE else self.take()
+
+    def take(self):
+        """Return the pending statements and empty the buffer."""
+        pending, self.pending = self.pending, []
+        if self.mode != Constant.OUTPUT_COALESCE or len(pending) < 2:
+            return pending
+        statement = OutputStatement(pending[0].user_id, pending[0].confidence)
+        for item in pending:
+            statement.contents.extend(item.contents)
+        return [statement]
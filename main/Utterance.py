@@ -1,19 +1,206 @@
-import json
+from collections import Counter, defaultdict
+
+import numpy as np
 import textdistance
-import spacy
-import rasa.nlu.training_data as training_data
-import rasa.nlu.config as config
-import rasa.nlu.model as model
-import rasa.utils.io as io_utils
-import plotly.express as px
+
+from . import Constant
+from .IntentModel import get_intent_model
+
+
+# Character n-grams of a text, overlapping, without padding
+def ngrams(text, n=Constant.UTTERANCE_NGRAM):
+    return [text[i : i + n] for i in range(len(text) - n + 1)]
+
+
+# Levenshtein distance with Myers' bit-parallel algorithm, one Python int bit per query character
+def edit_distance(query, text):
+    m = len(query)
+    if not m:
+        return len(text)
+    peq = defaultdict(int)
+    for i, char in enumerate(query):
+        peq[char] |= 1 << i
+    mask = (1 << m) - 1
+    high = 1 << (m - 1)
+    pv, mv, score = mask, 0, m
+    for char in text:
+        eq = peq.get(char, 0)
+        xv = eq | mv
+        xh = (((eq & pv) + pv) ^ pv) | eq
+        ph = mv | ~(xh | pv)
+        mh = pv & xh
+        if ph & high:
+            score += 1
+        elif mh & high:
+            score -= 1
+        ph = ((ph << 1) | 1) & mask
+        mh = (mh << 1) & mask
+        pv = (mh | ~(xv | ph)) & mask
+        mv = ph & xv
+    return score
+
+
+class UtteranceIndex:
+    """Scores a query against a fixed list of utterances.
+
+    scores returns textdistance.levenshtein.normalized_similarity of the query and every
+    utterance, computed with Myers' bit-parallel algorithm over all the utterances at once (one
+    uint64 lane per utterance, queries of up to 64 characters, longer ones use edit_distance).
+
+    top returns the k most similar utterances. An inverted index of character n-grams gives an
+    upper bound of the similarity of every utterance (q-gram lemma: d edits destroy at most d * n
+    n-grams of the longest text), candidates are scored by decreasing bound and scoring stops once
+    the bound falls below the k-th score, so the result is exact. Batches of candidates double in
+    size, pruning pays off when the best utterances are close to the query (k-th score above
+    1 - 1 / n); for a query far from every utterance most of them get scored.
+    """
+
+    def __init__(self, utterances, n=Constant.UTTERANCE_NGRAM, batch=Constant.UTTERANCE_BATCH):
+        self.utterances = list(utterances)
+        self.n = n
+        self.batch = batch
+        self.lengths = np.fromiter(map(len, self.utterances), np.int64, len(self.utterances))
+        self.offsets = np.zeros(len(self.utterances), np.int64)
+        np.cumsum(self.lengths[:-1], out=self.offsets[1:])
+        text = "".join(self.utterances)
+        self.codes = np.frombuffer(text.encode("utf-32-le"), np.uint32)
+        self._postings = None
+
+    def __len__(self):
+        return len(self.utterances)
+
+    # n-gram -> ids of the utterances containing it and number of occurrences, built on first use
+    @property
+    def postings(self):
+        if self._postings is None:
+            postings = defaultdict(lambda: ([], []))
+            for i, text in enumerate(self.utterances):
+                for gram, count in Counter(ngrams(text, self.n)).items():
+                    ids, counts = postings[gram]
+                    ids.append(i)
+                    counts.append(count)
+            self._postings = {
+                gram: (np.array(ids, np.intp), np.array(counts, np.int64))
+                for gram, (ids, counts) in postings.items()
+            }
+        return self._postings
+
+    def scores(self, query, ids=None):
+        """Return the normalized similarity of the query and the utterances ids (default all)."""
+        ids = np.arange(len(self)) if ids is None else np.asarray(ids, np.intp)
+        m = len(query)
+        lengths = self.lengths[ids]
+        if m == 0:
+            distances = lengths
+        elif m > 64:
+            distances = np.array([edit_distance(query, self.utterances[i]) for i in ids], np.int64)
+        else:
+            distances = self._distances(query, ids)
+        return _similarity(distances, np.maximum(lengths, m))
+
+    def bounds(self, query):
+        """Return an upper bound of the normalized similarity of the query and every utterance."""
+        shared = np.zeros(len(self), np.int64)
+        postings = self.postings
+        for gram, count in Counter(ngrams(query, self.n)).items():
+            if gram in postings:
+                ids, counts = postings[gram]
+                shared[ids] += np.minimum(counts, count)
+        m = len(query)
+        longest = np.maximum(self.lengths, m)
+        lower = -((shared - longest + self.n - 1) // self.n)
+        lower = np.maximum(lower, np.abs(self.lengths - m))
+        return _similarity(lower, longest)
+
+    def top(self, query, k=10):
+        """Return (index, score) of the k utterances most similar to the query, best first."""
+        if k <= 0 or not len(self):
+            return []
+        bounds = self.bounds(query)
+        order = np.argsort(-bounds, kind="stable")
+        best_ids = np.empty(0, np.intp)
+        best_scores = np.empty(0, np.float64)
+        start, batch = 0, self.batch
+        while start < len(order):
+            ids = order[start : start + batch]
+            start, batch = start + batch, batch * 2
+            if len(best_ids) == k:
+                ids = ids[bounds[ids] >= best_scores[-1]]
+                if not len(ids):
+                    break
+            best_ids = np.concatenate([best_ids, ids])
+            best_scores = np.concatenate([best_scores, self.scores(query, ids)])
+            keep = np.lexsort((best_ids, -best_scores))[:k]
+            best_ids, best_scores = best_ids[keep], best_scores[keep]
+        return [(int(i), float(score)) for i, score in zip(best_ids, best_scores)]
+
+    # Myers' algorithm over a batch of utterances, longest first so that the utterances still
+    # being read are always a prefix of the batch
+    def _distances(self, query, ids):
+        m = len(query)
+        alphabet = np.unique(np.frombuffer(query.encode("utf-32-le"), np.uint32))
+        peq = np.zeros(len(alphabet) + 1, np.uint64)
+        for i, char in enumerate(query):
+            peq[np.searchsorted(alphabet, ord(char))] |= np.uint64(1 << i)
+
+        order = np.argsort(-self.lengths[ids], kind="stable")
+        lengths = self.lengths[ids][order]
+        starts = self.offsets[ids][order]
+        one = np.uint64(1)
+        mask = np.uint64((1 << m) - 1)
+        high = np.uint64(1 << (m - 1))
+        pv = np.full(len(ids), mask, np.uint64)
+        mv = np.zeros(len(ids), np.uint64)
+        score = np.full(len(ids), m, np.int64)
+        active = len(ids)
+        for j in range(int(lengths[0]) if len(ids) else 0):
+            while lengths[active - 1] <= j:
+                active -= 1
+            codes = self.codes[starts[:active] + j]
+            slot = np.searchsorted(alphabet, codes)
+            slot[alphabet[np.minimum(slot, len(alphabet) - 1)] != codes] = len(alphabet)
+            eq = peq[slot]
+            p, v = pv[:active], mv[:active]
+            xv = eq | v
+            xh = (((eq & p) + p) ^ p) | eq
+            ph = v | ~(xh | p)
+            mh = p & xh
+            score[:active] += (ph & high).astype(bool)
+            score[:active] -= (mh & high).astype(bool)
+            ph = ((ph << one) | one) & mask
+            mh = (mh << one) & mask
+            pv[:active] = (mh | ~(xv | ph)) & mask
+            mv[:active] = ph & xv
+
+        distances = np.empty(len(ids), np.int64)
+        distances[order] = score
+        return distances
+
+
+# 1 - distance / maximum, as textdistance computes it, 1 for two empty texts
+def _similarity(distances, maximum):
+    return np.where(maximum > 0, 1 - distances / np.maximum(maximum, 1), 1.0)
+
 
 class UtteranceDistance:
-    # Initializing the class with given parameters
-    def __init__(self, utterances: list, query: str, algorithm: str = 'levenshtein'):
+    # Initializing the class with given parameters, model defaults to the intent model
+    # loaded at worker start (see main.IntentModel), utterance_index to an UtteranceIndex of
+    # the utterances
+    def __init__(
+        self,
+        utterances: list,
+        query: str,
+        algorithm: str = 'levenshtein',
+        model=None,
+        utterance_index=None,
+    ):
         self.algorithm = algorithm
         self.utterances = utterances
         self.query = query
-        self.similarity = []
+        self.model = model
+        self.utterance_index = utterance_index
+        self.results = []
+        self.distance = None
         self.index = None
         self.text = None
 
@@ -21,39 +208,31 @@ class UtteranceDistance:
         if self.query:
             self._compute()
 
-    # Private method to compute the results
+    # Private method to compute the results, inference only
     def _compute(self):
 
-        # Loading spacy model
-        nlp = spacy.load("en_core_web_sm")
-        doc = nlp(self.query)
-
-        # Getting lemmatized verbs, nouns and adjectives from the query
-        verbs = [token.lemma_ for token in doc if token.pos_ == "VERB"]
-        nouns = [token.lemma_ for token in doc if token.pos_ == "NOUN"]
-        adjectives = [token.lemma_ for token in doc if token.pos_ == "ADJ"]
-
-        # Loading training data and creating an interpreter
-        nlu_data = training_data.load_data('data/nlu.md')
-        trainer = model.Trainer(config.load('config.yml'))
-        interpreter = trainer.train(nlu_data)
-        model_directory = trainer.persist('models/')
-
-        # Parsing the query and getting intent ranking
-        results = interpreter.parse(self.query)['intent_ranking']
-
-        # Comparing each utterance with query and calculating distance
-        for i, utterance in enumerate(self.utterances):
-            match_distance = textdistance.levenshtein.normalized_similarity(self.query, utterance)
-            intent = results[i]['name']
-            confidence = results[i]['confidence']
-            distance = match_distance * (1 - confidence)
-
-            # Updating the distance, text and index if current utterance has less distance
-            if distance < self.distance or not self.distance:
-                self.distance = distance
-                self.text = utterance
-                self.index = i
+        # Intent ranking of the query from the offline trained model
+        model = self.model or get_intent_model()
+        self.results = results = model.rank(self.query)
+        if not self.utterances:
+            return
+
+        # Comparing each utterance with query, all at once for levenshtein
+        if self.algorithm == 'levenshtein':
+            index = self.utterance_index or UtteranceIndex(self.utterances)
+            match_distances = index.scores(self.query)
+        else:
+            similarity = getattr(textdistance, self.algorithm).normalized_similarity
+            match_distances = np.array([similarity(self.query, text) for text in self.utterances])
+
+        # Calculating distances, the first utterance with the least distance wins
+        confidences = np.zeros(len(self.utterances))
+        ranked = results[: len(self.utterances)]
+        confidences[: len(ranked)] = [result['confidence'] for result in ranked]
+        distances = match_distances * (1 - confidences)
+        self.index = int(np.argmin(distances))
+        self.distance = float(distances[self.index])
+        self.text = self.utterances[self.index]
 
     # String representation of the class
     def __str__(self):
@@ -77,6 +256,9 @@ class UtteranceDistance:
 
 
     def show_confidence_graph(self):
+        from plotly import graph_objects as go
+        from plotly.subplots import make_subplots
+
         intents = [result['name'] for result in self.results]
         confidences = [result['confidence'] for result in self.results]
 
@@ -91,6 +273,8 @@ class UtteranceDistance:
         fig.show()
 
     def show_confidence_heatmap(self):
+        from plotly import graph_objects as go
+
         intents = [result['name'] for result in self.results]
         confidences = [result['confidence'] for result in self.results]
 
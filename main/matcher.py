@@ -1,19 +1,293 @@
+"""Text processing helpers built on spaCy.
+
+Intents are matched against an IntentIndex, a single Matcher holding the patterns of every
+intent (main/pattern.json by default). The index is built once per vocabulary and patterns can be
+added or removed without rebuilding it.
+
+Before any parsing, IntentPrefilter tells from the raw text whether an intent is possible at all:
+every intent pattern requires some keyword, so a message without any of them can't match.
+"""
+
+from collections import deque
 import json
-import spacy
+import os
+import threading
+
+from spacy.matcher import Matcher
 from spacy.tokens import Span
-from intents import (
-    AddTaskIntent, BookIntent, CheckIntent, ContactIntent, CreateIntent,
-    DeleteIntent, DeliveryIntent, DesireIntent, GreetIntent, Intent,
-    LinkTaskIntent, MatchEmail, MatchEmailUsingPattern, MatchPhoneNumber,
-    NewsIntent, OrderIntent, PurchaseIntent, RateIntent, RemindIntent,
-    RentIntent, SearchIntent, SentenceSimilarity, SetDeadlineIntent, SetIntent,
-    TokenSimilarity, UpdateIntent
-)
+
+from . import Intents
+from .Nlp import MODELS, get_nlp
+from .Statement import InputStatement
+
+
+PATTERN_FILE = os.path.join(os.path.dirname(__file__), "pattern.json")
+
+
+def load_intent_patterns(path=PATTERN_FILE):
+    """Return {intent name: patterns} for the intents of a pattern file."""
+    with open(path) as file:
+        patterns = json.load(file)
+    return {name: value for name, value in patterns.items() if name.endswith("Intent")}
+
+
+class IntentIndex:
+    """Matcher holding the patterns of every intent.
+
+    When several intents match a doc, the one added first wins, like trying the intents one by
+    one in order.
+    """
+
+    def __init__(self, vocab, patterns=None):
+        self.vocab = vocab
+        self.matcher = Matcher(vocab)
+        self.intents = {}
+        self._priorities = {}
+        self._lock = threading.Lock()
+        for name, value in (patterns or {}).items():
+            self.add(name, value)
+
+    def __contains__(self, name):
+        return name in self.intents
+
+    def __len__(self):
+        return len(self.intents)
+
+    def add(self, name, patterns, intent=None):
+        """Add or replace the patterns of an intent.
+
+        intent is returned by match, it defaults to the Intents.<name>Matcher of the patterns,
+        or to the name when there's no such class.
+        """
+        if intent is None:
+            intent_class = getattr(Intents, f"{name}Matcher", None)
+            intent = intent_class(patterns) if intent_class else name
+        with self._lock:
+            if name in self.intents:
+                self.matcher.remove(name)
+            else:
+                self._priorities[self.vocab.strings.add(name)] = len(self._priorities)
+            self.matcher.add(name, patterns)
+            self.intents[name] = intent
+
+    def remove(self, name):
+        with self._lock:
+            if name in self.intents:
+                self.matcher.remove(name)
+                del self.intents[name]
+
+    def match(self, doc):
+        """Return the intent of the doc, None if no intent matches."""
+        matches = self.matcher(doc)
+        if not matches:
+            return None
+        match_id = min((match[0] for match in matches), key=self._priorities.__getitem__)
+        return self.intents[self.vocab.strings[match_id]]
+
+
+# id(vocab) -> IntentIndex, Vocab can't be weakly referenced
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_intent_index(vocab):
+    """Return the IntentIndex of the default patterns for a vocabulary, built on first use.
+
+    The indexes of the models evicted from MODELS are dropped with them."""
+    with _indexes_lock:
+        index = _indexes.get(id(vocab))
+        if index is None or index.vocab is not vocab:
+            index = _indexes[id(vocab)] = IntentIndex(vocab, load_intent_patterns())
+        return index
+
+
+def _drop_intent_index(name, nlp):
+    # the index keeps the vocabulary, and with it the strings and vectors of the evicted model
+    with _indexes_lock:
+        index = _indexes.get(id(nlp.vocab))
+        if index is not None and index.vocab is nlp.vocab:
+            del _indexes[id(nlp.vocab)]
+
+
+MODELS.on_evict(_drop_intent_index)
+
+
+# inflections a prefix can't catch, for the lemmas used by the intent patterns
+IRREGULAR_FORMS = {
+    "be": ["is", "are", "was", "were", "am", "been"],
+    "build": ["built"],
+    "buy": ["bought"],
+    "do": ["does", "did", "done"],
+    "find": ["found"],
+    "make": ["made"],
+}
+
+LEXICAL_ATTRS = ("LEMMA", "LOWER", "ORTH", "TEXT")
+
+CANCEL_PHRASES = ["cancel", "stop", "quit", "exit", "abort", "never mind", "nevermind", "forget it"]
+
+
+class KeywordAutomaton:
+    """Aho-Corasick automaton finding keywords in a text in a single pass.
+
+    Keywords are matched case-insensitively and must start at a word boundary. Whole word
+    keywords must also end at one, the others match any word starting with them.
+    """
+
+    def __init__(self, keywords=()):
+        # state -> {char: state}, state 0 is the root
+        self._goto = [{}]
+        self._fail = [0]
+        # state -> [(keyword, whole word)]
+        self._output = [[]]
+        self._matches = None
+        self._built = False
+        for keyword in keywords:
+            if isinstance(keyword, str):
+                self.add(keyword)
+            else:
+                self.add(*keyword)
+
+    def __len__(self):
+        return sum(len(output) for output in self._output)
+
+    def add(self, keyword, whole_word=True):
+        keyword = keyword.lower()
+        state = 0
+        for char in keyword:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            state = next_state
+        if (keyword, whole_word) not in self._output[state]:
+            self._output[state].append((keyword, whole_word))
+        self._built = False
+
+    def _build(self):
+        # breadth first, so the failure link of a state (its longest proper suffix in the trie)
+        # and its matches are final before its children are visited
+        matches = [list(output) for output in self._output]
+        queue = deque(self._goto[0].values())
+        for state in queue:
+            self._fail[state] = 0
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[next_state] = self._goto[fail].get(char, 0)
+                matches[next_state] += matches[self._fail[next_state]]
+        self._matches = matches
+        self._built = True
+
+    def finditer(self, text):
+        """Yield (keyword, start, end) for every keyword found in text."""
+        if not self._built:
+            self._build()
+        text = text.lower()
+        goto, fail, matches = self._goto, self._fail, self._matches
+        state = 0
+        for index, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for keyword, whole_word in matches[state]:
+                start = index + 1 - len(keyword)
+                if start and text[start - 1].isalnum():
+                    continue
+                end = index + 1
+                if whole_word and end < len(text) and text[end].isalnum():
+                    continue
+                yield keyword, start, end
+
+    def search(self, text):
+        """Return True if any keyword is found in text."""
+        return next(self.finditer(text), None) is not None
+
+
+def intent_keywords(patterns):
+    """Return the (keyword, whole word) pairs one of which every pattern requires.
+
+    The keywords of a pattern are the values of its first required token matching on LEMMA,
+    LOWER, ORTH or TEXT. Lemmas match as word prefixes (a final "e" is dropped, for "removing"),
+    plus their irregular forms.
+    """
+    keywords = set()
+    for value in patterns.values():
+        for pattern in value:
+            for token in pattern:
+                if token.get("OP") in ("?", "*"):
+                    continue
+                attr = next((key for key in LEXICAL_ATTRS if key in token), None)
+                if attr is None:
+                    continue
+                words = token[attr]
+                if isinstance(words, dict):
+                    words = words.get("IN", [])
+                if isinstance(words, str):
+                    words = [words]
+                for word in words:
+                    word = word.lower()
+                    if attr == "LEMMA":
+                        stem = word[:-1] if word.endswith("e") and len(word) > 3 else word
+                        keywords.add((stem, False))
+                        keywords.update((form, True) for form in IRREGULAR_FORMS.get(word, []))
+                    else:
+                        keywords.add((word, True))
+                break
+            else:
+                # no lexical token required, any text may match
+                return None
+    return keywords
+
+
+class IntentPrefilter:
+    """Tells in microseconds whether a text may match an intent or a cancel phrase."""
+
+    def __init__(self, patterns=None, cancel_phrases=CANCEL_PHRASES):
+        if patterns is None:
+            patterns = load_intent_patterns()
+        keywords = intent_keywords(patterns)
+        # a pattern without keyword makes the prefilter useless, it lets every text through
+        self.automaton = None
+        if keywords is not None:
+            keywords.update((phrase, False) for phrase in cancel_phrases)
+            self.automaton = KeywordAutomaton(sorted(keywords))
+
+    def may_match(self, text):
+        if self.automaton is None or not text:
+            return True
+        return self.automaton.search(text)
+
+
+_prefilter = None
+_prefilter_lock = threading.Lock()
+
+
+def get_intent_prefilter():
+    """Return the IntentPrefilter of the default patterns, built on first use."""
+    global _prefilter
+    with _prefilter_lock:
+        if _prefilter is None:
+            _prefilter = IntentPrefilter()
+        return _prefilter
+
 
 class ProcessText:
-    def __init__(self, input_statement, nlp):
-        self.nlp = nlp
-        self.doc = nlp(input_statement)
+    def __init__(self, input_statement, nlp=None):
+        if isinstance(input_statement, InputStatement) and nlp is None:
+            # reuse the parse of the turn
+            self.nlp = input_statement.analysis.nlp
+            self.doc = input_statement.analysis.doc
+        else:
+            self.nlp = nlp or get_nlp()
+            self.doc = self.nlp(input_statement)
         self.ents = self.doc.ents
         self.labels = ['PERSON', 'ORG', 'GPE', 'DATE', 'TIME', 'MONEY']
         self.properties = ['pos', 'tag', 'dep', 'lemma', 'is_alpha', 'morph', 'is_stop']
@@ -45,11 +319,4 @@ class ProcessText:
         return urls
 
     def get_intent(self):
-        intent_matchers = [
-            Matcher(self.doc.vocab).add(name, 'INTENT', patterns) for name, patterns in INTENT_PATTERNS.items()
-        ]
-        for matcher in intent_matchers:
-            matches = matcher(self.doc)
-            if matches:
-                return INTENT_MAPPING[matches[0][0]]
-        return None
+        return get_intent_index(self.doc.vocab).match(self.doc)
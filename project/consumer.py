@@ -2,10 +2,121 @@ import asyncio
 import json
 from channels.consumer import AsyncConsumer
 from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.utils.module_loading import import_string
 from asgiref.sync import async_to_sync
 from urllib.parse import parse_qs
 
+from main.Binder import AsyncBinder, SyncBinderAdapter
+from main.Statement import InputStatement
+
+
+def output_group(uuid):
+    """Return the name of the channel group receiving the bot output of a user."""
+    return f"output.{uuid}"
+
+
+def serialize_output(statement):
+    """Return the JSON sent to the websocket for an OutputStatement."""
+    return json.dumps(
+        {
+            "user_id": statement.user_id,
+            "confidence": statement.confidence,
+            "contents": [node.serialize() for node in statement.contents],
+        },
+        default=str,
+    )
+
+
+def send_output(uuid, statement):
+    """Push a statement to the websockets of a user, without waiting for them to send it."""
+    channel_layer = get_channel_layer()
+    if channel_layer is not None:
+        async_to_sync(channel_layer.group_send)(
+            output_group(uuid), {"type": "bot.output", "text": serialize_output(statement)}
+        )
+
+
+async def async_send_output(uuid, statement):
+    """Same as send_output, for the event loop of an AsyncBinder."""
+    channel_layer = get_channel_layer()
+    if channel_layer is not None:
+        await channel_layer.group_send(
+            output_group(uuid), {"type": "bot.output", "text": serialize_output(statement)}
+        )
+
+
+def input_statement(uuid, text):
+    """Return the InputStatement of a websocket message, a JSON object or plain text."""
+    try:
+        message = json.loads(text)
+    except ValueError:
+        message = None
+    if not isinstance(message, dict):
+        return InputStatement(uuid, text=text, input=text)
+    text = message.get("text")
+    return InputStatement(
+        uuid, text=text, input=message.get("input", text), flag=message.get("flag")
+    )
+
+
+class ChannelsOutputMixin:
+    """Binder mixin posting messages to the websockets of the user through the channel layer.
+
+    Set OUTPUT_MODE=main.Constant.OUTPUT_NODES on the binder to push the nodes of each block as
+    soon as they are produced. The output goes to the user of the turn's input, the messages of
+    a turn are sent after its state session closed. Override output_uuid to send them elsewhere.
+    """
+
+    recipient = None
+
+    def output_uuid(self):
+        if self.recipient is None:
+            return self.load_state().user_id
+        return self.recipient
+
+    def select_processor(self, input):
+        self.recipient = input.user_id
+        return super().select_processor(input)
+
+    def on_post_message(self, statement):
+        send_output(self.output_uuid(), statement)
+
+
+class AsyncChannelsOutputMixin(ChannelsOutputMixin):
+    """ChannelsOutputMixin of AsyncBinder and SyncBinderAdapter, posting from the event loop."""
+
+    def output_uuid(self):
+        if self.recipient is None:
+            raise RuntimeError("AsyncChannelsOutputMixin only posts the output of select_processor")
+        return self.recipient
+
+    async def select_processor(self, input):
+        self.recipient = input.user_id
+        return await super().select_processor(input)
+
+    async def on_post_message(self, statement):
+        await async_send_output(self.output_uuid(), statement)
+
+
+class ChannelsBinderAdapter(AsyncChannelsOutputMixin, SyncBinderAdapter):
+    """Runs a synchronous Binder on the event loop of the consumer, its output goes to the
+    websockets."""
+
+
+def get_binder(user):
+    """Return the AsyncBinder answering the websocket messages of a user, None without
+    settings.BOT_BINDER."""
+    if not getattr(settings, "BOT_BINDER", None):
+        return None
+    binder = import_string(settings.BOT_BINDER)(user)
+    if not isinstance(binder, AsyncBinder):
+        binder = ChannelsBinderAdapter(binder)
+    return binder
+
+
 class WebSocketConsumer(AsyncConsumer):
     async def websocket_connect(self,event):
         params = parse_qs(self.scope['query_string'].decode('utf8'))
@@ -13,18 +124,30 @@ class WebSocketConsumer(AsyncConsumer):
         token = params['token'][0]
         self.user = await self.authenticate(uuid,token)
         if self.user:
+            self.uuid = uuid
+            self.group = output_group(uuid)
+            if self.channel_layer is not None:
+                await self.channel_layer.group_add(self.group, self.channel_name)
             await self.send({'type':'websocket.accept', })
 
-    async def websocket_receive(self, object):
-        pass
+    async def websocket_receive(self, event):
+        if not getattr(self, "user", None) or not event.get("text"):
+            return
+        binder = await database_sync_to_async(get_binder)(self.user)
+        if binder is not None:
+            await binder.select_processor(input_statement(self.uuid, event["text"]))
 
     async def websocket_disconnect(self,event):
-        pass
+        if getattr(self, "group", None) and self.channel_layer is not None:
+            await self.channel_layer.group_discard(self.group, self.channel_name)
+
+    async def bot_output(self, event):
+        await self.send({"type": "websocket.send", "text": event["text"]})
 
     async def authenticate(self, uuid, token):
-        return await database_sync_to_async(get_user_model().objects.filter)(
-            uuid=uuid, token=token
-        )
+        return await database_sync_to_async(
+            lambda: get_user_model().objects.filter(uuid=uuid, token=token).first()
+        )()
 
 class WebSocketDebug(AsyncConsumer):
     async def websocket_connect(self, event):
@@ -74,6 +74,9 @@ MIDDLEWARE = [
 PROMETHEUS_EXPORT_MIGRATIONS = False
 ROOT_URLCONF = "project.urls"
 ASGI_APPLICATION = "project.routing.application"
+CHANNEL_LAYERS = {"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}}
+# callable returning the binder of the messages received on the websocket, called with the user
+BOT_BINDER = os.getenv("BOT_BINDER")
 
 
 TEMPLATES = [
@@ -248,3 +251,31 @@ GITLAB = {
     "DELETE_PIPELINE_ID": os.getenv("GITLAB_DELETE_PIPELINE_ID"),
     "REF_BRANCH": os.getenv("GITLAB_REF_BRANCH"),
 }
+
+
+# --------------------------------------------------------------------------------------------------
+# NLP Settings
+# --------------------------------------------------------------------------------------------------
+
+
+# spaCy models loaded when a worker boots, see main.Nlp.ModelManager
+NLP_MODELS = os.getenv("NLP_MODELS", "en_core_web_sm").split(",")
+NLP_WARM_UP = bool(os.getenv("NLP_WARM_UP"))
+
+# parse the texts of concurrent turns in batches, see main.Nlp.NlpBatcher
+NLP_BATCHING = bool(os.getenv("NLP_BATCHING"))
+NLP_BATCH_SIZE = int(os.getenv("NLP_BATCH_SIZE", 64))
+NLP_BATCH_WAIT = float(os.getenv("NLP_BATCH_WAIT", 0.005))
+
+# parsed reference phrases and their similarities, see main.Nlp.DocCache
+NLP_DOC_CACHE_SIZE = int(os.getenv("NLP_DOC_CACHE_SIZE", 4096))
+NLP_DOC_CACHE_MEMORY = int(os.getenv("NLP_DOC_CACHE_MEMORY", 64 * 2**20))
+
+# intent model of UtteranceDistance, written by the train_intent_model command and loaded when a
+# worker boots, see main.IntentModel
+INTENT_MODEL_PATH = os.getenv("INTENT_MODEL_PATH", "models/intent")
+INTENT_MODEL_EPOCHS = int(os.getenv("INTENT_MODEL_EPOCHS", 200))
+
+# skill routing index, updated when skills are published to the SkillStore and shared by the
+# workers of a host, see main.SkillIndex
+SKILL_INDEX_PATH = os.getenv("SKILL_INDEX_PATH", "models/skills")
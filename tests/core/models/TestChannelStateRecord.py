@@ -0,0 +1,73 @@
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from core.models import ChannelStateRecord
+from core.state import DjangoStateStore
+from main.State import ChannelState
+
+
+KEY = ("user", "operator", "channel")
+
+
+def state_dict(block_id="b1", **data):
+    skill = {"package": "com.test.skill", "version": "1"}
+    return ChannelState(*KEY, skill=skill, block_id=block_id, data=data, lang="en").serialize()
+
+
+class TestDjangoStateStore:
+    @pytest.mark.django_db
+    def test_roundtrip(self):
+        store = DjangoStateStore()
+        assert store.load(KEY) is None
+        store.save(KEY, state_dict(name="Ada"))
+        assert DjangoStateStore().load(KEY) == state_dict(name="Ada")
+        store.delete(KEY)
+        assert store.load(KEY) is None
+
+    @pytest.mark.django_db
+    def test_update_fields(self):
+        store = DjangoStateStore()
+        store.save(KEY, state_dict(name="Ada"))
+        store = DjangoStateStore()
+        store.load(KEY)
+        with CaptureQueriesContext(connection) as queries:
+            store.save(KEY, state_dict(name="Ada"))
+        assert len(queries) == 0
+
+        with CaptureQueriesContext(connection) as queries:
+            store.save(KEY, state_dict(block_id="b2", name="Ada", city="Paris"))
+        assert len(queries) == 1
+        sql = queries[0]["sql"]
+        assert '"block_id"' in sql and '"data"' in sql and '"extra"' not in sql
+        assert store.load(KEY) == state_dict(block_id="b2", name="Ada", city="Paris")
+        assert store.writes == 1
+
+    @pytest.mark.django_db
+    def test_deleted_row(self):
+        store = DjangoStateStore()
+        store.save(KEY, state_dict(name="Ada"))
+        ChannelStateRecord.objects.all().delete()
+        store.save(KEY, state_dict(name="Bob"))
+        assert store.load(KEY) == state_dict(name="Bob")
+        assert ChannelStateRecord.objects.count() == 1
+
+    @pytest.mark.django_db
+    def test_save_delta(self):
+        store = DjangoStateStore()
+        store.save(KEY, state_dict(name="Ada"))
+        state = ChannelState.from_dict(store.load(KEY))
+        state.extra["visited"] = True
+        state.block_id = "b2"
+        with CaptureQueriesContext(connection) as queries:
+            assert store.save_delta(KEY, state.delta())
+        assert len(queries) == 1
+        sql = queries[0]["sql"]
+        assert '"block_id"' in sql and '"extra"' in sql and '"data"' not in sql
+        assert DjangoStateStore().load(KEY) == state.serialize()
+
+        # unknown or deleted rows are left to a full save
+        assert not DjangoStateStore().save_delta(KEY, state.delta())
+        ChannelStateRecord.objects.all().delete()
+        state.block_id = "b3"
+        assert not store.save_delta(KEY, state.delta())
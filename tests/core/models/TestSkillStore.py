@@ -0,0 +1,101 @@
+import io
+import json
+
+import pytest
+from django.core.management import call_command
+from django.db import transaction
+
+from core import signals
+from core.models import KeycloakRealm, SkillStore
+from main import SkillIndex as skill_index
+from main.Skill import SKILL_CACHE
+from main.SkillIndex import get_skill_index
+
+from tests.main.TestSkillIndex import SKILLS, embed
+
+
+def publish(package, state=SkillStore.STATE_PUBLISHED):
+    return SkillStore.objects.create(
+        name=package,
+        package=package,
+        summary="",
+        category="",
+        description="",
+        state=state,
+        data=json.dumps({"package": package, "utterances": SKILLS[package]}),
+    )
+
+
+@pytest.fixture
+def index_path(tmp_path, settings, monkeypatch):
+    monkeypatch.setattr(skill_index, "embed_texts", embed)
+    settings.SKILL_INDEX_PATH = str(tmp_path)
+    yield str(tmp_path)
+    skill_index.clear()
+
+
+def wait_index_updates():
+    signals._index_updates.submit(lambda: None).result(timeout=10)
+
+
+class TestSkillIndexSignals:
+    @pytest.mark.django_db(transaction=True)
+    def test_publish_and_remove(self, index_path):
+        skill = publish("com.bits.pizza")
+        wait_index_updates()
+        assert get_skill_index(index_path).packages == ["com.bits.pizza"]
+        skill.delete()
+        wait_index_updates()
+        assert get_skill_index(index_path).packages == []
+
+    @pytest.mark.django_db(transaction=True)
+    def test_draft_keeps_the_published_utterances(self, index_path):
+        publish("com.bits.pizza")
+        publish("com.bits.pizza", state=SkillStore.STATE_DRAFT)
+        wait_index_updates()
+        assert get_skill_index(index_path).packages == ["com.bits.pizza"]
+
+    @pytest.mark.django_db(transaction=True)
+    def test_index_is_updated_after_the_commit(self, index_path):
+        with transaction.atomic():
+            publish("com.bits.pizza")
+            wait_index_updates()
+            assert get_skill_index(index_path).packages == []
+        wait_index_updates()
+        assert get_skill_index(index_path).packages == ["com.bits.pizza"]
+
+    @pytest.mark.django_db
+    def test_rolled_back_save_isnt_indexed(self, index_path):
+        publish("com.bits.pizza")
+        wait_index_updates()
+        assert get_skill_index(index_path).packages == []
+
+    @pytest.mark.django_db(transaction=True)
+    def test_publish_drops_the_cached_skill(self, index_path):
+        SKILL_CACHE.put({"package": "com.bits.pizza", "version": "1", "blocks": []})
+        publish("com.bits.pizza")
+        assert SKILL_CACHE.get("com.bits.pizza", "1") is None
+
+    @pytest.mark.django_db(transaction=True)
+    def test_index_failure_doesnt_fail_the_save(self, index_path, monkeypatch):
+        def fail(*args):
+            raise OSError("disk full")
+
+        monkeypatch.setattr(skill_index, "update_skill_index", fail)
+        publish("com.bits.pizza")
+        wait_index_updates()
+        assert SkillStore.objects.filter(package="com.bits.pizza").exists()
+
+
+class TestRealmSignals:
+    @pytest.mark.django_db
+    def test_realm_delete_keeps_the_keycloak_realm(self, monkeypatch):
+        class Controller:
+            deleted = []
+
+            def delete_realm(self, realm):
+                self.deleted.append(realm)
+
+        monkeypatch.setattr(signals, "MasterRealmController", Controller)
+        KeycloakRealm.objects.create(realm="bits").delete()
+        assert Controller.deleted == []
@@ -0,0 +1,312 @@
+import copy
+import threading
+import time
+
+import numpy as np
+import pytest
+import spacy
+
+from main import Constant
+from main.Binder import get_blocks
+from main.Block import BaseBlock, InputPayment, InputSelection, PromptText
+from main.Flag import FLAG_START_SKILL
+from main.Processor import StartSkill
+from main.Skill import compile_skill
+from main.Statement import InputStatement
+
+from .binder import MemoryBinder, input_text, make_skill, prompt
+
+
+def fetch_profile(binder, operator_id, package, data, **kwargs):
+    time.sleep(0.05)
+    return {"name": "Bob", "source": "profile"}
+
+
+def fetch_orders(binder, operator_id, package, data, **kwargs):
+    return {"orders": 3, "source": "orders"}
+
+
+def fetch_slowly(binder, operator_id, package, data, **kwargs):
+    time.sleep(0.5)
+    return {"late": True}
+
+
+# the branches of test_branches_run_concurrently all meet here, which they can't if run one by one
+meeting = threading.Barrier(4, timeout=1)
+# keeps the branches of test_hung_branches_free_their_workers running until the test ends
+release = threading.Event()
+
+
+def fetch_together(binder, operator_id, package, data, **kwargs):
+    meeting.wait()
+    return {"met": True}
+
+
+def fetch_hung(binder, operator_id, package, data, **kwargs):
+    release.wait(5)
+    return {"late": True}
+
+
+def exchange(block_id, function):
+    return {
+        "id": block_id,
+        "component": "main.Block.DataExchange",
+        "properties": [{"name": "component", "value": f"{__name__}.{function.__name__}"}],
+        "connections": [],
+    }
+
+
+def parallel(block_id, branches, next_id, reject_id, timeout=None):
+    return {
+        "id": block_id,
+        "component": "main.Block.ParallelBlock",
+        "properties": [
+            {"name": "branches", "value": branches},
+            {"name": "timeout", "value": timeout},
+        ],
+        "connections": [[1, next_id], [-1, reject_id]],
+    }
+
+
+def run(branches, timeout=None):
+    functions = [fetch_profile, fetch_orders, fetch_slowly, fetch_together, fetch_hung]
+    blocks = [parallel("b0", [block_id for block_id, _ in branches], "wait", "failed", timeout)]
+    blocks += [exchange(block_id, function) for block_id, function in branches]
+    blocks += [prompt("failed", "Failed", "wait"), input_text("wait", "answer")]
+    binder = MemoryBinder()
+    for function in functions:
+        binder.registry.register(function)
+    StartSkill().on_process(binder, InputStatement("user", input=make_skill(blocks)))
+    return binder
+
+
+class TestParallelBlock:
+    def test_merges_branches_in_order(self):
+        binder = run([("e0", fetch_profile), ("e1", fetch_orders)])
+
+        assert binder.messages == []
+        assert binder.state.block_id == "wait"
+        # both branches write "source", the last branch wins whichever finished first
+        assert binder.state.data == {"name": "Bob", "orders": 3, "source": "orders"}
+
+    def test_branches_run_concurrently(self):
+        binder = run([(f"e{i}", fetch_together) for i in range(4)])
+
+        assert binder.messages == []
+        assert binder.state.block_id == "wait"
+        assert binder.state.data == {"met": True}
+
+    def test_timed_out_branch_is_discarded(self):
+        binder = run([("e0", fetch_orders), ("e1", fetch_slowly)], timeout=0.1)
+
+        assert [str(message) for message in binder.messages] == ["Failed"]
+        assert binder.state.data == {"orders": 3, "source": "orders"}
+
+    def test_hung_branches_free_their_workers(self):
+        try:
+            for _ in range(Constant.PARALLEL_BLOCK_WORKERS + 1):
+                binder = run([("e0", fetch_orders), ("e1", fetch_hung)], timeout=0.05)
+                assert binder.state.data == {"orders": 3, "source": "orders"}
+        finally:
+            release.set()
+
+    def test_exposed_to_skill_builder(self):
+        components = [block["component"] for block in get_blocks()]
+        assert "main.Block.ParallelBlock" in components
+
+
+class DeltaBinder(MemoryBinder):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.deltas = []
+
+    def on_save_state_delta(self, state, delta):
+        self.deltas.append(delta)
+        super().on_save_state_delta(state, delta)
+
+
+class TestDataExchange:
+    def test_saves_only_the_keys_written(self):
+        blocks = [prompt("b0", "Name?", "b1"), input_text("b1", "name", "e0")]
+        blocks += [exchange("e0", fetch_orders), prompt("b2", "City?", "b3")]
+        blocks[2]["connections"] = [[1, "b2"]]
+        skill = make_skill(blocks + [input_text("b3", "city")])
+        binder = DeltaBinder(skills={skill["package"]: skill})
+        binder.registry.register(fetch_orders)
+        binder.select_processor(
+            InputStatement("user", input=skill["package"], flag=FLAG_START_SKILL)
+        )
+        binder.select_processor(InputStatement("user", text="Ada", input="Ada"))
+
+        assert binder.state.data == {"name": "Ada", "orders": 3, "source": "orders"}
+        assert binder.deltas[-1].ops == [
+            ["field", "block_id", "b3"],
+            ["set", "data", "name", "Ada"],
+            ["set", "data", "orders", 3],
+            ["set", "data", "source", "orders"],
+        ]
+
+
+WORDS = ["draft", "published", "archived", "pending", "review", "blue", "red", "car", "house"]
+
+
+@pytest.fixture(scope="module")
+def nlp():
+    nlp = spacy.blank("en")
+    random = np.random.default_rng(0)
+    for word in WORDS:
+        nlp.vocab.set_vector(word, random.random(16, dtype=np.float32))
+    return nlp
+
+
+def similarities(nlp, selections, value):
+    # InputSelection._augment_results before the label vectors were precomputed
+    doc = nlp(value)
+    tokens = [token for token in doc if not token.is_stop]
+    results = []
+    for item in selections:
+        item_doc = nlp(item[1])
+        item_tokens = [token for token in item_doc if not token.is_stop]
+        score = doc.similarity(item_doc)
+        for token in tokens:
+            score += max(token.similarity(item_token) for item_token in item_tokens)
+        score /= len(tokens) + len(item_tokens)
+        results.append((score, item[0]))
+    return sorted(results, reverse=True)
+
+
+class TestInputSelection:
+    selections = [
+        ["draft", "Draft"],
+        ["published", "the published review"],
+        ["archived", "archived house"],
+        ["car", "red car"],
+        ["unknown", "pending zzz"],
+    ]
+
+    def block(self, nlp):
+        properties = [{"name": "selections", "value": self.selections}]
+        return InputSelection(nlp=nlp, context={}, id="b0", properties=properties, connections=[])
+
+    @pytest.mark.filterwarnings("ignore")
+    @pytest.mark.parametrize("value", ["a blue car", "review", "the house", "zzz", "draft"])
+    def test_same_ranking_as_token_similarities(self, nlp, value):
+        expected = similarities(nlp, self.selections, value)
+        assert self.block(nlp)._augment_results(value) == [item[1] for item in expected]
+
+    @pytest.mark.filterwarnings("ignore")
+    def test_label_vectors_are_shared(self, nlp):
+        assert self.block(nlp)._vectors() is self.block(nlp)._vectors()
+
+
+def template_classes():
+    """Return fresh block classes, so their templates aren't built yet, and their builds."""
+    builds = []
+
+    class Greeting(BaseBlock):
+        __slots__ = ()
+
+        def on_descriptor(self):
+            return {"name": "Greeting"}
+
+        def load_template(self):
+            builds.append(type(self).__name__)
+            self.append_template_properties(
+                [
+                    {"name": "text", "format": "string", "value": None},
+                    {"name": "required", "format": "boolean", "value": False},
+                ]
+            )
+
+    class OptionalGreeting(Greeting):
+        __slots__ = ()
+
+        def load_template(self):
+            super().load_template()
+            self.remove_template_properties("required")
+
+    return Greeting, OptionalGreeting, builds
+
+
+def names(template):
+    return [item["name"] for item in template]
+
+
+class TestBlockTemplate:
+    def test_built_once_per_class(self):
+        Greeting, OptionalGreeting, builds = template_classes()
+        properties = [{"name": "text", "value": "Hi"}]
+        blocks = [Greeting(context={}, id=f"b{i}", properties=properties) for i in range(3)]
+        assert builds == []
+
+        assert all(block.template_properties is Greeting.get_template() for block in blocks)
+        assert OptionalGreeting.get_template() is OptionalGreeting.get_template()
+        assert builds == ["Greeting", "OptionalGreeting"]
+
+    def test_instances_dont_change_the_class_template(self):
+        template = copy.deepcopy(PromptText.get_template())
+        properties = [{"name": "primary_text", "value": ["Hello"]}]
+        block = PromptText(context={}, id="b0", properties=properties, connections=[[1, "b1"]])
+
+        assert block.serialize()["template"] == template
+        assert PromptText.get_template() == template
+
+    def test_removed_property_stays_in_the_parent_template(self):
+        Greeting, OptionalGreeting, builds = template_classes()
+        assert names(OptionalGreeting.get_template()) == ["text"]
+        assert names(Greeting.get_template()) == ["text", "required"]
+        assert names(OptionalGreeting.get_template()) == ["text"]
+
+
+def scan_property(properties, name):
+    # the lookup of blocks before the properties were indexed
+    return next((prop["value"] for prop in properties if prop["name"] == name), None)
+
+
+class TestBlockIndexes:
+    properties = [
+        {"name": "primary_text", "value": ["Hello"]},
+        {"name": "key", "value": "first"},
+        {"name": "key", "value": "second"},
+        {"name": "required", "value": False},
+    ]
+    connections = [[1, "b1"], [-1, "b2"], [1, "b3"]]
+
+    def block(self, properties, connections):
+        return PromptText(context={}, id="b0", properties=properties, connections=connections)
+
+    @pytest.mark.parametrize("name", ["primary_text", "key", "required", "unknown"])
+    def test_property_value(self, name):
+        value = self.block(self.properties, self.connections).property_value(name)
+        assert value == scan_property(self.properties, name)
+
+    def test_connections(self):
+        block = self.block(self.properties, self.connections)
+        assert block.move().connection == "b1"
+        assert block.reject().connection == "b2"
+        assert block.accept().connection is None
+        assert block.find_connection(7) is None
+
+    def test_without_properties_and_connections(self):
+        block = self.block(None, None)
+        assert block.property_value("primary_text") is None
+        assert block.move().connection is None
+
+    def test_payment_without_required(self):
+        properties = [{"name": "component", "value": "apps.bench.Payment"}]
+        block = InputPayment(context={}, id="b0", properties=properties, connections=[[1, "b1"]])
+        assert block.property_value("required") is None
+        assert block.property_value("component") == "apps.bench.Payment"
+
+        # no skip option, and no answer still moves on like before the properties were indexed
+        binder = MemoryBinder()
+        assert len(block.on_search(binder, "user", "")) == 1
+        assert block.process(binder, "operator", InputStatement("user")).connection == "b1"
+
+    def test_compiled_blocks_share_the_indexes(self):
+        binder = MemoryBinder()
+        skill = compile_skill(make_skill([prompt("b0", "Hi", "b1")]), binder.get_registry())
+        first, second = (skill.get_block({}, "b0") for _ in range(2))
+        assert first is not second
+        assert first._values is second._values and first._targets is second._targets
+        assert first.property_value("primary_text") == ["Hi"]
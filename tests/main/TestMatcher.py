@@ -0,0 +1,135 @@
+import spacy
+from spacy.tokens import Doc
+
+from main import Nlp, matcher
+from main.Intents import BookIntentMatcher
+from main.Statement import InputStatement
+from main.matcher import (
+    IntentIndex,
+    IntentPrefilter,
+    KeywordAutomaton,
+    ProcessText,
+    get_intent_index,
+    load_intent_patterns,
+)
+
+from .binder import MemoryBinder, input_text, make_skill, prompt
+
+
+def annotated(nlp, *tokens):
+    words, pos, tags, lemmas = zip(*tokens)
+    return Doc(
+        nlp.vocab,
+        words=list(words),
+        pos=list(pos),
+        tags=list(tags),
+        lemmas=list(lemmas),
+        deps=["dep"] * len(words),
+        heads=[0] * len(words),
+    )
+
+
+class TestIntentIndex:
+    nlp = spacy.blank("en")
+
+    def book_doc(self):
+        return annotated(
+            self.nlp,
+            ("please", "INTJ", "UH", "please"),
+            ("book", "VERB", "VB", "book"),
+            ("a", "DET", "DT", "a"),
+            ("table", "NOUN", "NN", "table"),
+        )
+
+    def test_default_patterns(self):
+        index = get_intent_index(self.nlp.vocab)
+        assert index is get_intent_index(self.nlp.vocab)
+        assert len(index) == len(load_intent_patterns())
+        assert isinstance(index.match(self.book_doc()), BookIntentMatcher)
+
+    def test_evicted_models_release_their_index(self, monkeypatch):
+        monkeypatch.setattr(Nlp.MODELS, "loader", lambda name: spacy.blank("en"))
+        nlp = Nlp.MODELS.get("test-intents")
+        index = get_intent_index(nlp.vocab)
+        Nlp.MODELS.evict("test-intents")
+
+        assert id(nlp.vocab) not in matcher._indexes
+        assert get_intent_index(nlp.vocab) is not index
+        assert get_intent_index(self.nlp.vocab) is get_intent_index(self.nlp.vocab)
+
+    def test_first_added_intent_wins(self):
+        index = IntentIndex(self.nlp.vocab)
+        index.add("Polite", [[{"LOWER": "please"}]], intent="polite")
+        index.add("Table", [[{"LOWER": "table"}]], intent="table")
+        assert index.match(self.book_doc()) == "polite"
+
+    def test_incremental_add_and_remove(self):
+        index = IntentIndex(self.nlp.vocab)
+        assert index.match(self.book_doc()) is None
+        index.add("Table", [[{"LOWER": "table"}]], intent="table")
+        assert index.match(self.book_doc()) == "table"
+        index.add("Table", [[{"LOWER": "chair"}]], intent="chair")
+        assert index.match(self.book_doc()) is None
+        index.remove("Table")
+        assert "Table" not in index
+
+    def test_process_text(self):
+        text = ProcessText("book a table", nlp=lambda text: self.book_doc())
+        assert isinstance(text.get_intent(), BookIntentMatcher)
+
+
+class TestKeywordAutomaton:
+    def test_overlapping_keywords(self):
+        automaton = KeywordAutomaton([("he", True), ("she", True), ("hers", False), ("his", True)])
+        assert list(automaton.finditer("Ushers: HIS, she")) == [("his", 8, 11), ("she", 13, 16)]
+
+    def test_prefix_keywords(self):
+        automaton = KeywordAutomaton([("book", False)])
+        assert automaton.search("I booked it")
+        assert not automaton.search("a notebook")
+
+
+class CountingBinder(MemoryBinder):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.intent_calls = 0
+
+    def on_cancel_intent(self, statement):
+        self.intent_calls += 1
+        return False
+
+    def on_skill_intent(self, statement):
+        self.intent_calls += 1
+        return self.skills and next(iter(self.skills))
+
+
+class TestIntentPrefilter:
+    def test_default_patterns(self):
+        prefilter = IntentPrefilter()
+        for text in ("Please book a table", "removing it", "I bought shoes", "never mind"):
+            assert prefilter.may_match(text)
+        for text in ("John Smith", "his name", "42", "bob@example.com"):
+            assert not prefilter.may_match(text)
+
+    def test_pattern_without_keyword_lets_everything_through(self):
+        prefilter = IntentPrefilter({"AnyVerb": [[{"POS": "VERB"}]]})
+        assert prefilter.may_match("John Smith")
+
+    def test_skips_intent_hooks(self):
+        skill = make_skill([input_text("b0", "name")])
+        for enabled, calls in ((False, 2), (True, 1)):
+            binder = CountingBinder(skills={skill["package"]: skill}, INTENT_PREFILTER=enabled)
+            for text in ("John", "stop"):
+                binder.state.skill = {"package": skill["package"]}
+                binder.state.block_id = "b0"
+                binder.select_processor(InputStatement("user", text=text, input=text))
+            assert binder.intent_calls == calls
+
+    def test_skill_intents_are_not_filtered(self):
+        # skills start on their own trigger phrases, which the intent patterns don't know
+        skill = make_skill([prompt("b0", "Which one?", "b1"), input_text("b1", "pizza")])
+        binder = CountingBinder(skills={skill["package"]: skill}, INTENT_PREFILTER=True)
+        binder.select_processor(InputStatement("user", text="pizza", input="pizza"))
+
+        assert binder.intent_calls == 1
+        assert [str(message) for message in binder.messages] == ["Which one?"]
@@ -0,0 +1,262 @@
+from concurrent.futures import ThreadPoolExecutor
+import gc
+import threading
+import time
+import weakref
+
+import numpy as np
+import pytest
+import spacy
+
+from main import Nlp
+from main.Block import InputSelection
+from main.Flag import FLAG_START_SKILL
+from main.Intents import SentenceSimilarity, TokenSimilarity
+from main.Nlp import Analysis, DocCache, ModelManager, NlpBatcher, doc_size, model_size
+from main.Statement import InputStatement
+
+from .binder import MemoryBinder, input_text, make_skill, prompt
+
+
+class SlowLoader:
+    def __init__(self, pipes=()):
+        self.pipes = pipes
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def __call__(self, name):
+        with self.lock:
+            self.calls.append(name)
+        time.sleep(0.05)
+        nlp = spacy.blank("en")
+        for pipe in self.pipes:
+            nlp.add_pipe(pipe)
+        if self.pipes:
+            nlp.initialize()
+        return nlp
+
+
+class TestModelManager:
+    def test_loads_once_per_name(self):
+        loader = SlowLoader()
+        models = ModelManager(loader=loader)
+        with ThreadPoolExecutor(8) as pool:
+            loaded = list(pool.map(lambda _: models.get("en"), range(16)))
+
+        assert loader.calls == ["en"]
+        assert all(nlp is loaded[0] for nlp in loaded)
+        assert models.loads == 1
+
+    def test_least_recently_used_model_is_evicted(self):
+        models = ModelManager(max_models=2, loader=SlowLoader())
+        models.get("a")
+        models.get("b")
+        models.get("a")
+        models.get("c")
+
+        assert "a" in models and "c" in models
+        assert "b" not in models
+
+    def test_memory_budget(self):
+        loader = SlowLoader(pipes=("tok2vec",))
+        models = ModelManager(max_models=10, loader=loader)
+        size = model_size(models.get("a"))
+        assert size > 0
+        assert models.memory() == {"a": size}
+
+        models.memory_budget = size
+        models.get("b")
+        assert list(models.memory()) == ["b"]
+
+    def test_input_selection_loads_model_on_use(self):
+        models = ModelManager(loader=SlowLoader())
+        nlp = models.get("en")
+        block = InputSelection(context={}, id="b0", properties=[], connections=[])
+        assert block._nlp is None
+
+        block = InputSelection(nlp=nlp, context={}, id="b0", properties=[], connections=[])
+        assert block.nlp is nlp
+
+
+class TestNlpBatcher:
+    def test_concurrent_texts_are_parsed_together(self):
+        batcher = NlpBatcher(spacy.blank("en"), max_batch=16, max_wait=0.05)
+        texts = [f"text number {index}" for index in range(32)]
+        with ThreadPoolExecutor(32) as pool:
+            docs = list(pool.map(batcher, texts))
+        batcher.close()
+
+        assert [doc.text for doc in docs] == texts
+        assert batcher.texts == 32
+        assert batcher.batches < 32
+
+    def test_errors_reach_the_callers(self):
+        class Broken:
+            def pipe(self, texts, **kwargs):
+                raise ValueError("broken model")
+
+        batcher = NlpBatcher(Broken(), max_wait=0)
+        with pytest.raises(ValueError):
+            batcher("text")
+        batcher.close()
+
+    def test_get_nlp_returns_batcher(self, monkeypatch):
+        models = ModelManager(loader=SlowLoader())
+        monkeypatch.setattr(Nlp, "MODELS", models)
+        Nlp.enable_batching(max_wait=0)
+        try:
+            batcher = Nlp.get_nlp("en")
+            assert isinstance(batcher, NlpBatcher)
+            assert batcher.nlp is models.get("en")
+            assert batcher("hello world").text == "hello world"
+        finally:
+            Nlp.disable_batching()
+        assert Nlp.get_nlp("en") is models.get("en")
+
+
+class CountingNlp:
+    def __init__(self, nlp):
+        self.nlp = nlp
+        self.calls = 0
+
+    def __getattr__(self, name):
+        return getattr(self.nlp, name)
+
+    def __call__(self, text):
+        self.calls += 1
+        return self.nlp(text)
+
+
+class IntentBinder(MemoryBinder):
+    def on_cancel_intent(self, statement):
+        return "cancel" in statement.analysis.lemmas
+
+
+class TestAnalysis:
+    def test_parsed_once(self):
+        analysis = Analysis("Mail bob@example.com or call +1 555 010 9999", nlp=spacy.blank("en"))
+        assert analysis.parses == 0
+        assert analysis.emails == ["bob@example.com"]
+        assert analysis.phones == ["+1 555 010 9999"]
+        assert analysis.tokens[0] == "Mail"
+        assert analysis.parses == 1
+
+    @pytest.mark.filterwarnings("ignore")
+    def test_one_parse_per_message(self, monkeypatch):
+        blank = spacy.blank("en")
+        random = np.random.default_rng(0)
+        for word in ("red", "car", "blue", "house", "automobile"):
+            blank.vocab.set_vector(word, random.random(8, dtype=np.float32))
+        nlp = CountingNlp(blank)
+        monkeypatch.setattr(Nlp, "MODELS", ModelManager(loader=lambda name: nlp))
+
+        selection = {
+            "id": "b1",
+            "component": "main.Block.InputSelection",
+            "properties": [
+                {"name": "key", "value": "choice"},
+                {"name": "required", "value": True},
+                {"name": "selections", "value": [["car", "red car"], ["house", "blue house"]]},
+            ],
+            "connections": [[1, "b2"]],
+        }
+        skill = make_skill([prompt("b0", "Pick one", "b1"), selection, input_text("b2", "name")])
+        binder = IntentBinder(skills={skill["package"]: skill})
+        binder.select_processor(
+            InputStatement("user", input=skill["package"], flag=FLAG_START_SKILL)
+        )
+
+        statement = InputStatement("user", text="a red automobile", input="a red automobile")
+        binder.select_processor(statement)
+
+        assert binder.state.data == {"choice": "car"}
+        assert statement.analysis.parses == 1
+        assert nlp.calls == 1
+
+
+def vector_nlp():
+    nlp = spacy.blank("en")
+    random = np.random.default_rng(0)
+    for word in ("red", "car", "blue", "house", "automobile", "home"):
+        nlp.vocab.set_vector(word, random.random(8, dtype=np.float32))
+    return nlp
+
+
+class TestDocCache:
+    def test_similarity(self):
+        nlp = CountingNlp(vector_nlp())
+        cache = DocCache()
+        similarity = SentenceSimilarity(nlp, cache)
+        expected = nlp.nlp("red car").similarity(nlp.nlp("blue automobile"))
+        assert similarity.get_similarity("red car", "blue automobile") == expected
+        assert similarity.get_similarity("red car", "blue automobile") == expected
+        assert TokenSimilarity(nlp, cache).get_similarity("red car", "house") == pytest.approx(
+            nlp.nlp("red car").similarity(nlp.nlp("house"))
+        )
+        # "red car" is parsed once for both pairs, the repeated pair isn't compared again
+        assert nlp.calls == 3
+        assert (cache.hits, cache.misses) == (1, 3)
+        assert (cache.similarity_hits, cache.similarity_misses) == (1, 2)
+        assert cache.stats()["similarity_hit_rate"] == pytest.approx(1 / 3)
+
+    def test_models(self):
+        cache = DocCache()
+        first, second = vector_nlp(), vector_nlp()
+        assert cache.doc(first, "red car").vocab is first.vocab
+        assert cache.doc(second, "red car").vocab is second.vocab
+        assert cache.doc(first, "red car") is cache.doc(first, "red car")
+
+    def test_eviction(self):
+        nlp = vector_nlp()
+        cache = DocCache(max_docs=2, max_similarities=1)
+        for text in ("red", "car", "blue"):
+            cache.doc(nlp, text)
+        assert len(cache) == 2
+        cache.doc(nlp, "car")
+        assert cache.hits == 1
+        cache.doc(nlp, "red")
+        assert cache.misses == 4
+        cache.similarity(nlp, "red", "car")
+        cache.similarity(nlp, "red", "blue")
+        cache.similarity(nlp, "red", "car")
+        assert cache.similarity_misses == 3
+
+    def test_evicted_models_are_purged(self):
+        cache = DocCache()
+        models = ModelManager(max_models=1, loader=lambda name: vector_nlp())
+        models.on_evict(lambda name, nlp: cache.purge(nlp))
+        first = models.get("a")
+        cache.similarity(first, "red car", "blue house")
+        cache.similarity(models.get("b"), "red car", "home")
+        assert len(cache) == 2 and cache.stats()["similarities"] == 1
+
+        # the cache doesn't keep the evicted model alive
+        model = weakref.ref(first)
+        del first
+        gc.collect()
+        assert model() is None
+
+    def test_evicted_models_release_their_selections(self, monkeypatch):
+        monkeypatch.setattr(Nlp.MODELS, "loader", lambda name: vector_nlp())
+        first = Nlp.MODELS.get("test-selections")
+        other = vector_nlp()
+        Nlp.selection_vectors(first, ["red car", "blue house"])
+        kept = Nlp.selection_vectors(other, ["red car"])
+        Nlp.MODELS.evict("test-selections")
+
+        assert Nlp.selection_vectors(other, ["red car"]) is kept
+        model = weakref.ref(first)
+        del first
+        gc.collect()
+        assert model() is None
+
+    def test_memory_budget(self):
+        nlp = vector_nlp()
+        size = doc_size(nlp("red car blue house"))
+        cache = DocCache(memory_budget=size * 2)
+        for index in range(10):
+            cache.doc(nlp, f"red car blue {index}")
+        assert len(cache) == 2 and cache.memory <= size * 2
+        assert cache.memory == sum(doc_size(nlp(f"red car blue {i}")) for i in (8, 9))
+        cache.clear()
+        assert len(cache) == 0 and cache.memory == 0 and cache.hit_rate() == 0.0
@@ -0,0 +1,75 @@
+import copy
+import pickle
+
+import pytest
+
+from main import Node
+from main.State import ChannelState
+from main.Statement import InputStatement, OutputStatement
+
+
+def node_classes(cls=Node.BaseNode):
+    for subclass in cls.__subclasses__():
+        yield subclass
+        yield from node_classes(subclass)
+
+
+class TestSlots:
+    @pytest.mark.parametrize("cls", list(node_classes()), ids=lambda cls: cls.__name__)
+    def test_nodes(self, cls):
+        node = cls.__new__(cls)
+        Node.BaseNode.__init__(node, "big.bot.core.text", "data", None)
+        assert not hasattr(node, "__dict__")
+
+    def test_statements_and_state(self):
+        state = ChannelState.from_dict(ChannelState("user", "operator", "channel").serialize())
+        for item in (InputStatement("user", text="hi"), OutputStatement("user"), state):
+            assert not hasattr(item, "__dict__")
+
+    def test_state_copies(self):
+        state = ChannelState.from_dict(
+            ChannelState("user", "operator", "channel", data={"name": "Ada"}, lang="en").serialize()
+        )
+        state.data["city"] = "Paris"
+        for other in (copy.copy(state), copy.deepcopy(state), pickle.loads(pickle.dumps(state))):
+            assert other.serialize() == state.serialize()
+            assert other.delta().ops == state.delta().ops
+
+
+class TestRegistry:
+    def test_every_node_type_is_registered(self):
+        for cls in node_classes():
+            if "NODE_TYPE" in cls.__dict__:
+                assert Node.NODE_CLASSES[cls.NODE_TYPE] is cls
+        assert Node.NODE_CLASSES["big.bot.core.picker.file"] is Node.InputFileNode
+
+    @pytest.mark.parametrize("node_type", sorted(Node.NODE_CLASSES))
+    def test_deserialize(self, node_type):
+        node = Node.BaseNode.deserialize({"node": node_type, "data": "value", "meta": {"a": 1}})
+        assert type(node) is Node.NODE_CLASSES[node_type]
+        assert node.node == node_type and node.data == "value" and node.meta["a"] == 1
+
+    def test_oauth_meta(self):
+        meta = {"scope": "email"}
+        node = Node.BaseNode.deserialize({"node": "big.bot.core.oauth", "data": 1, "meta": meta})
+        assert node.get_meta() == meta
+
+    def test_invalid_node(self):
+        with pytest.raises(ValueError, match="Invalid node type"):
+            Node.BaseNode.deserialize({"node": "big.bot.core.unknown"})
+        with pytest.raises(ValueError):
+            InputStatement("user", input={"node": "big.bot.core.unknown"}).get_node()
+
+    def test_get_node(self):
+        assert InputStatement("user", text="hi", input="hi").get_node() is None
+        assert InputStatement("user", input={"file": "a.png"}).get_node() is None
+        search = Node.SearchNode.wrap_cancel().serialize()
+        node = InputStatement("user", input=search).get_node()
+        assert isinstance(node, Node.SearchNode)
+        assert isinstance(node.get_node(), Node.CancelNode)
+
+    def test_catalog(self):
+        catalog = Node.all()
+        assert [item["node"] for item in catalog] == [cls.NODE_TYPE for cls in Node.NODE_TYPES]
+        catalog[0]["data"] = "changed"
+        assert Node.all() == Node.all() and Node.all()[0]["data"] is None
@@ -0,0 +1,252 @@
+import asyncio
+
+from main.Binder import SyncBinderAdapter
+from main.Block import InputSelection
+from main.Constant import OUTPUT_NODES, OUTPUT_STREAM
+from main.Flag import FLAG_START_SKILL
+from main.Processor import SkillProcessor, StartSkill
+from main.Statement import InputStatement, OutputBuffer, OutputStatement
+from project import consumer
+
+from .binder import MemoryBinder, input_text, make_skill, prompt, terminal
+
+
+def start(binder, skill):
+    StartSkill().on_process(binder, InputStatement("user", input=skill))
+
+
+class TestSkillProcessor:
+    def test_walks_until_input_block(self):
+        skill = make_skill(
+            [
+                prompt("b0", "One", "b1"),
+                prompt("b1", "Two", "b2"),
+                input_text("b2", "name", "b3"),
+                terminal("b3"),
+            ]
+        )
+        binder = MemoryBinder()
+        start(binder, skill)
+
+        assert [str(message) for message in binder.messages] == ["One", "Two"]
+        assert binder.state.block_id == "b2"
+        assert binder.state.skill["package"] == skill["package"]
+
+    def test_completes_skill(self):
+        skill = make_skill([prompt("b0", "One", "b1"), terminal("b1")])
+        binder = MemoryBinder()
+        start(binder, skill)
+
+        assert [str(message) for message in binder.messages] == ["One"]
+        assert binder.state.skill is None
+        assert binder.state.block_id is None
+
+    def test_saves_once_per_turn(self):
+        blocks = [prompt(f"b{i}", str(i), f"b{i + 1}") for i in range(20)]
+        skill = make_skill(blocks + [terminal("b20")])
+        binder = MemoryBinder()
+        start(binder, skill)
+
+        # one save when the skill starts and one at the end of the turn
+        assert binder.saves == 2
+        assert len(binder.messages) == 20
+
+    def test_step_budget(self):
+        skill = make_skill([prompt("b0", "Ping", "b1"), prompt("b1", "Pong", "b0")])
+        binder = MemoryBinder(MAX_STEPS_PER_TURN=5)
+        start(binder, skill)
+
+        assert len(binder.messages) == 5
+        assert binder.state.block_id == "b1"
+
+        # the next turn resumes at the pending block
+        SkillProcessor(max_steps=2).on_process(binder, InputStatement("user", text="hi"))
+        assert [str(message) for message in binder.messages[5:]] == ["Pong", "Ping"]
+
+    def test_resumed_turn_gives_its_message_to_the_next_input(self):
+        blocks = [prompt(f"b{i}", str(i), f"b{i + 1}") for i in range(4)]
+        blocks += [input_text("b4", "name", "b5"), prompt("b5", "Bye", "b6"), terminal("b6")]
+        skill = make_skill(blocks)
+        binder = MemoryBinder(MAX_STEPS_PER_TURN=2)
+        start(binder, skill)
+        assert binder.state.block_id == "b2"
+
+        # b2 and b3 use up the budget, b4 still reads the message
+        binder.select_processor(InputStatement("user", text="Ada", input="Ada"))
+        assert [node.data for node in binder.messages[-1].contents] == ["2", "3"]
+        assert binder.state.data == {"name": "Ada"}
+        assert binder.state.block_id == "b5"
+
+
+class TestStateSession:
+    def test_one_load_and_save_per_turn(self):
+        blocks = [prompt(f"b{i}", str(i), f"b{i + 1}") for i in range(10)]
+        skill = make_skill(blocks + [input_text("b10", "name", "b11"), terminal("b11")])
+        binder = MemoryBinder(skills={skill["package"]: skill})
+
+        statement = InputStatement("user", input=skill["package"], flag=FLAG_START_SKILL)
+        binder.select_processor(statement)
+        assert binder.last_session.loads == 1
+        assert binder.last_session.saves == 1
+        assert (binder.loads, binder.saves) == (1, 1)
+        assert binder.state.block_id == "b10"
+
+        binder.select_processor(InputStatement("user", text="Bob", input="Bob"))
+        assert binder.last_session.backend_calls == 2
+        assert binder.state.skill is None
+
+    def test_read_only_turn_doesnt_save(self):
+        binder = MemoryBinder()
+        with binder.state_session() as session:
+            binder.load_state()
+            binder.load_state()
+        assert (session.loads, session.saves) == (1, 0)
+
+
+class TestOutputBuffer:
+    skill = make_skill(
+        [prompt("b0", "One", "b1"), prompt("b1", "Two", "b2"), prompt("b2", "Three", "b3")]
+        + [input_text("b3", "name", "b4"), terminal("b4")]
+    )
+
+    def start(self, binder):
+        statement = InputStatement("user", input=self.skill["package"], flag=FLAG_START_SKILL)
+        binder.select_processor(statement)
+
+    def test_one_message_per_turn(self):
+        binder = MemoryBinder(skills={self.skill["package"]: self.skill})
+        self.start(binder)
+
+        assert len(binder.messages) == 1
+        assert [node.data for node in binder.messages[0].contents] == ["One", "Two", "Three"]
+
+    def test_streamed_output(self):
+        binder = MemoryBinder(skills={self.skill["package"]: self.skill}, OUTPUT_MODE=OUTPUT_STREAM)
+        self.start(binder)
+
+        assert [str(message) for message in binder.messages] == ["One", "Two", "Three"]
+
+    def test_reposted_statement_is_sent_once(self):
+        buffer = OutputBuffer()
+        output = OutputStatement("operator")
+        output.append_text("One")
+        buffer.post(output)
+        output.append_text("Two")
+        buffer.post(output)
+
+        assert buffer.take() == [output]
+        assert buffer.take() == []
+
+    def test_reposted_statement_sends_new_nodes(self):
+        binder = MemoryBinder(OUTPUT_MODE=OUTPUT_NODES)
+        output = OutputStatement("operator")
+        with binder.output_buffer():
+            output.append_text("One")
+            binder.post_message(output)
+            output.append_text("Two")
+            binder.post_message(output)
+            assert [[node.data for node in item.contents] for item in binder.messages] == [
+                ["One"],
+                ["Two"],
+            ]
+        assert len(binder.messages) == 2
+
+    def test_async_nodes_output(self):
+        binder = MemoryBinder(skills={self.skill["package"]: self.skill}, OUTPUT_MODE=OUTPUT_NODES)
+        statement = InputStatement("user", input=self.skill["package"], flag=FLAG_START_SKILL)
+        asyncio.run(SyncBinderAdapter(binder).select_processor(statement))
+
+        assert [str(message) for message in binder.messages] == ["One", "Two", "Three"]
+
+
+class TestAsyncBinder:
+    def test_sync_adapter(self):
+        skill = make_skill(
+            [prompt("b0", "One", "b1"), input_text("b1", "name", "b2"), prompt("b2", "Bye", "b3")]
+            + [terminal("b3")]
+        )
+        binder = MemoryBinder(skills={skill["package"]: skill})
+        adapter = SyncBinderAdapter(binder)
+
+        async def conversation():
+            statement = InputStatement("user", input=skill["package"], flag=FLAG_START_SKILL)
+            await adapter.select_processor(statement)
+            await adapter.select_processor(InputStatement("user", text="Bob", input="Bob"))
+
+        asyncio.run(conversation())
+        assert [str(message) for message in binder.messages] == ["One", "Bye"]
+        assert binder.state.skill is None
+        assert adapter.last_session.backend_calls == 2
+
+    def test_step_budget(self):
+        # the sync and async engines walk the blocks with the same SkillProcessor.steps
+        skill = make_skill([prompt("b0", "Ping", "b1"), prompt("b1", "Pong", "b0")])
+        binder = MemoryBinder(skills={skill["package"]: skill}, MAX_STEPS_PER_TURN=5)
+        statement = InputStatement("user", input=skill["package"], flag=FLAG_START_SKILL)
+        asyncio.run(SyncBinderAdapter(binder).select_processor(statement))
+
+        # the turn's messages are sent as one
+        texts = [node.data for node in binder.messages[0].contents]
+        assert texts == ["Ping", "Pong", "Ping", "Pong", "Ping"]
+        assert binder.state.block_id == "b1"
+
+    def test_resumed_turn_gives_its_message_to_the_next_input(self):
+        skill = make_skill(
+            [prompt("b0", "One", "b1"), prompt("b1", "Two", "b2"), input_text("b2", "name", "b3")]
+            + [prompt("b3", "Bye", "b4"), input_text("b4", "city")]
+        )
+        binder = MemoryBinder(skills={skill["package"]: skill}, MAX_STEPS_PER_TURN=1)
+        adapter = SyncBinderAdapter(binder)
+
+        async def conversation():
+            statement = InputStatement("user", input=skill["package"], flag=FLAG_START_SKILL)
+            await adapter.select_processor(statement)
+            await adapter.select_processor(InputStatement("user", text="Ada", input="Ada"))
+
+        asyncio.run(conversation())
+        assert binder.state.data == {"name": "Ada"}
+        assert binder.state.block_id == "b3"
+
+    def test_selection_runs_in_a_thread(self):
+        assert InputSelection.blocking
+
+
+class ChannelsBinder(consumer.ChannelsOutputMixin, MemoryBinder):
+    pass
+
+
+class TestChannelsOutput:
+    skill = TestOutputBuffer.skill
+
+    def statement(self):
+        return InputStatement("user", input=self.skill["package"], flag=FLAG_START_SKILL)
+
+    def test_output_goes_to_the_user_of_the_turn(self, monkeypatch):
+        sent = []
+        monkeypatch.setattr(consumer, "send_output", lambda uuid, statement: sent.append(uuid))
+        binder = ChannelsBinder(skills={self.skill["package"]: self.skill})
+        binder.select_processor(self.statement())
+
+        # the coalesced message is sent after the session closed, without loading the state again
+        assert sent == ["user"]
+        assert binder.loads == 1
+
+    def test_async_output(self, monkeypatch):
+        sent = []
+
+        async def send(uuid, statement):
+            sent.append((uuid, [node.data for node in statement.contents]))
+
+        monkeypatch.setattr(consumer, "async_send_output", send)
+        binder = MemoryBinder(skills={self.skill["package"]: self.skill})
+        adapter = consumer.ChannelsBinderAdapter(binder)
+        asyncio.run(adapter.select_processor(self.statement()))
+
+        assert sent == [("user", ["One", "Two", "Three"])]
+        assert binder.loads == 1
+
+    def test_websocket_messages(self):
+        statement = consumer.input_statement("uuid", "Bob")
+        assert (statement.user_id, statement.text, statement.input) == ("uuid", "Bob", "Bob")
+        statement = consumer.input_statement("uuid", '{"input": "com.test.skill", "flag": 1}')
+        assert (statement.text, statement.input, statement.flag) == (None, "com.test.skill", 1)
@@ -0,0 +1,135 @@
+import pytest
+
+from main.Block import BlockNotFoundException, ComponentNotFoundException, PromptText
+from main.Skill import SkillCache, compile_skill
+from main.State import ChannelState
+
+from .binder import MemoryBinder, make_skill, prompt, terminal
+
+
+class TestCompiledSkill:
+    def test_get_block(self):
+        binder = MemoryBinder()
+        skill = make_skill([prompt("b0", "Hello", "b1"), terminal("b1")])
+        compiled = compile_skill(skill, binder.get_registry())
+
+        block = compiled.get_block(binder.on_context(), "b0")
+        assert isinstance(block, PromptText)
+        assert block.id == "b0"
+        assert compiled.get_connection("b0", 1) == "b1"
+        assert compiled.get_connection("b1", 1) is None
+
+    def test_missing_block(self):
+        binder = MemoryBinder()
+        compiled = compile_skill(make_skill([terminal("b0")]), binder.get_registry())
+        with pytest.raises(BlockNotFoundException):
+            compiled.get_block(None, "missing")
+
+    def test_missing_component(self):
+        binder = MemoryBinder()
+        block = terminal("b0")
+        block["component"] = "apps.unknown.Block"
+        compiled = compile_skill(make_skill([block]), binder.get_registry())
+        with pytest.raises(ComponentNotFoundException):
+            compiled.get_block(None, "b0")
+
+    def test_cache(self):
+        registry = MemoryBinder().get_registry()
+        skill = make_skill([terminal("b0")])
+        assert compile_skill(skill, registry) is compile_skill(skill, registry)
+
+        # Unversioned definitions are only reused for the same object
+        edited = make_skill([terminal("b0"), terminal("b1")])
+        assert "b1" in compile_skill(edited, registry)
+
+        versioned = make_skill([terminal("b0")], version=1)
+        copy = make_skill([terminal("b0")], version=1)
+        assert compile_skill(versioned, registry) is compile_skill(copy, registry)
+
+    def test_cache_per_blocks(self):
+        skill = make_skill([terminal("b0")], version=1)
+        first = compile_skill(skill, MemoryBinder().get_registry())
+        assert compile_skill(skill, MemoryBinder().get_registry()) is first
+
+        registry = MemoryBinder().get_registry()
+        registry.blocks.append(PromptText)
+        assert compile_skill(skill, registry) is not first
+
+
+class TestSkillCache:
+    def test_reference(self):
+        cache = SkillCache()
+        skill = make_skill([terminal("b0")])
+        reference = cache.reference(skill)
+        assert reference["package"] == "com.test.skill"
+        assert "blocks" not in reference
+
+        resolved = cache.resolve(reference)
+        assert resolved["blocks"][0]["id"] == "b0"
+        assert cache.resolve(reference) is resolved
+
+    def test_read_only(self):
+        cache = SkillCache()
+        skill = cache.put(make_skill([terminal("b0")]))
+        with pytest.raises(TypeError):
+            skill["start"] = "b1"
+        with pytest.raises(TypeError):
+            skill["blocks"][0]["id"] = "b1"
+
+    def test_eviction(self):
+        cache = SkillCache(max_size=2)
+        references = [cache.reference(make_skill([terminal("b0")], package=f"p{i}")) for i in range(3)]
+        assert len(cache) == 2
+        assert cache.resolve(references[0]) is None
+
+        # Evicted definitions are loaded again through the loader
+        loader = lambda package: make_skill([terminal("b0")], package=package)
+        assert cache.resolve(references[0], loader)["package"] == "p0"
+
+    def test_republished(self):
+        cache = SkillCache()
+        calls = []
+
+        def loader(package):
+            calls.append(package)
+            return make_skill([terminal("b0")], version=2)
+
+        old = {"package": "com.test.skill", "version": 1}
+        assert cache.resolve(old, loader)["version"] == 2
+        assert cache.resolve(old, loader)["version"] == 2
+        assert len(calls) == 1
+
+        cache.invalidate("com.test.skill")
+        cache.resolve(old, loader)
+        assert len(calls) == 2
+
+    def test_republished_under_the_same_version(self):
+        cache = SkillCache()
+        registry = MemoryBinder().get_registry()
+        published = [make_skill([terminal("b0")], package="com.test.same", version=1)]
+        reference = cache.reference(published[0])
+        first = compile_skill(cache.resolve(reference), registry)
+
+        blocks = [prompt("b0", "Hi"), terminal("b1")]
+        published.append(make_skill(blocks, package="com.test.same", version=1))
+        cache.invalidate("com.test.same")
+        skill = cache.resolve(reference, lambda package: published[-1])
+        assert skill["blocks"][0]["component"] == "main.Block.PromptText"
+        assert compile_skill(skill, registry) is not first
+
+    def test_state_follows_republished_version(self):
+        skill = make_skill([terminal("b0")], package="com.test.republished", version=2)
+        binder = MemoryBinder(skills={skill["package"]: skill})
+        reference = {"package": skill["package"], "version": 1}
+        state = ChannelState("user", "operator", "channel", skill=reference)
+        assert binder.load_skill(state)["version"] == 2
+        assert state.skill == {"package": skill["package"], "version": 2}
+
+    def test_state_migration(self):
+        skill = make_skill([terminal("b0")])
+        state = ChannelState.from_dict(
+            {"user_id": 1, "operator_id": 2, "channel_id": 3, "skill": skill, "block_id": "b0"}
+        )
+        assert "blocks" not in state.skill
+        assert "blocks" not in state.to_json()
+        assert MemoryBinder().load_skill(state)["start"] == "b0"
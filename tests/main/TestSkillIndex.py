@@ -0,0 +1,163 @@
+import json
+import multiprocessing
+import os
+
+import numpy as np
+import pytest
+
+from main import SkillIndex as skill_index
+from main.SkillIndex import SkillIndex, get_skill_index, update_skill_index
+
+
+WIDTH = 16
+
+
+def embed(texts):
+    # a fixed random vector per word, a text is the sum of its words
+    vectors = []
+    for text in texts:
+        vector = np.zeros(WIDTH, np.float32)
+        for word in text.split():
+            seed = sum(ord(char) * (index + 1) for index, char in enumerate(word))
+            vector += np.random.default_rng(seed).standard_normal(WIDTH).astype(np.float32)
+        vectors.append(vector)
+    return np.array(vectors, np.float32)
+
+
+SKILLS = {
+    "com.bits.booking": ["book a table", "reserve a table for two"],
+    "com.bits.weather": ["what is the weather", "will it rain"],
+    "com.bits.pizza": ["order a pizza", "i want a pizza", "pizza delivery"],
+}
+
+
+def make_index(dtype=np.float32):
+    index = SkillIndex(dtype=dtype, embed=embed)
+    for package, utterances in SKILLS.items():
+        index.add(package, utterances)
+    return index
+
+
+def best_scores(query):
+    query = query / np.linalg.norm(query)
+    scores = {}
+    for package, utterances in SKILLS.items():
+        vectors = embed(utterances)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        scores[package] = float((vectors @ query).max())
+    return scores
+
+
+def add_packages(path, worker):
+    # a worker process publishing skills, the index it holds gets stale
+    for n in range(worker * 5, worker * 5 + 5):
+        update_skill_index(f"com.bits.p{n}", SKILLS["com.bits.pizza"], path)
+
+
+def index_meta(path):
+    with open(os.path.join(path, "meta.json")) as file:
+        return json.load(file)
+
+
+@pytest.fixture
+def path(tmp_path):
+    yield str(tmp_path)
+    skill_index.clear()
+
+
+class TestSkillIndex:
+    def test_search(self):
+        index = make_index()
+        assert index.vectors.shape == (7, WIDTH) and index.vectors.flags.c_contiguous
+        query = embed(["reserve a table"])[0]
+        expected = sorted(best_scores(query).items(), key=lambda item: -item[1])
+        results = index.search(query, k=2)
+        assert [package for package, _ in results] == [package for package, _ in expected[:2]]
+        assert [score for _, score in results] == pytest.approx([s for _, s in expected[:2]])
+        assert len(index.search(query, k=10)) == 3
+        assert index.route(query) == "com.bits.booking"
+        assert index.route(embed(["zebra crossing"])[0], threshold=0.99) is None
+
+    def test_batch(self):
+        index = make_index()
+        queries = embed(["will it rain tomorrow", "a pizza please"])
+        results = index.search(queries, k=1)
+        assert [result[0][0] for result in results] == ["com.bits.weather", "com.bits.pizza"]
+        for result, query in zip(results, queries):
+            assert result == [(result[0][0], pytest.approx(index.search(query, k=1)[0][1]))]
+
+    def test_float16(self):
+        index = make_index(np.float16)
+        exact = make_index()
+        assert index.vectors.dtype == np.float16
+        query = embed(["order pizza"])[0]
+        assert index.scores(query) == pytest.approx(exact.scores(query), abs=1e-3)
+
+    def test_add_remove(self):
+        index = make_index()
+        index.remove("com.bits.weather")
+        assert index.packages == ["com.bits.booking", "com.bits.pizza"]
+        assert index.counts.tolist() == [2, 3] and len(index.vectors) == 5
+        index.add("com.bits.booking", ["cancel my booking"])
+        assert index.packages == ["com.bits.pizza", "com.bits.booking"]
+        query = embed(["cancel my booking"])[0]
+        assert index.search(query, k=1)[0] == ("com.bits.booking", pytest.approx(1.0))
+        index.add("com.bits.empty", [])
+        index.remove("com.bits.unknown")
+        assert len(index) == 2
+        assert SkillIndex(embed=embed).search(query) == []
+
+    def test_save_load(self, path):
+        index = make_index(np.float16)
+        index.save(path)
+        loaded = SkillIndex.load(path, embed=embed)
+        assert isinstance(loaded.vectors, np.memmap) and loaded.vectors.dtype == np.float16
+        assert loaded.packages == index.packages
+        query = embed(["book a table"])[0]
+        assert loaded.search(query) == index.search(query)
+        loaded.add("com.bits.new", ["brand new"])
+        loaded.save(path)
+        assert len(os.listdir(path)) == 2
+        assert SkillIndex.load(path, embed=embed).packages[-1] == "com.bits.new"
+
+    def test_format_version(self, path):
+        make_index().save(path)
+        with open(os.path.join(path, "meta.json")) as file:
+            meta = file.read()
+        with open(os.path.join(path, "meta.json"), "w") as file:
+            file.write(meta.replace('"format": 1', '"format": 2'))
+        with pytest.raises(ValueError):
+            SkillIndex.load(path)
+
+    def test_shared_index(self, path, monkeypatch):
+        monkeypatch.setattr(skill_index, "embed_texts", embed)
+        monkeypatch.setattr(skill_index.Constant, "SKILL_INDEX_REFRESH", 0)
+        assert len(get_skill_index(path)) == 0
+        reader = get_skill_index(path)
+        updated = update_skill_index("com.bits.pizza", SKILLS["com.bits.pizza"], path)
+        assert len(reader) == 0 and get_skill_index(path) is updated
+        # another process saves a newer index
+        other = SkillIndex.load(path, embed=embed)
+        other.add("com.bits.weather", SKILLS["com.bits.weather"])
+        other.save(path)
+        os.utime(os.path.join(path, "meta.json"), ns=(0, 0))
+        assert get_skill_index(path).packages == ["com.bits.pizza", "com.bits.weather"]
+        update_skill_index("com.bits.pizza", [], path)
+        assert get_skill_index(path).packages == ["com.bits.weather"]
+
+    def test_concurrent_updates(self, path, monkeypatch):
+        monkeypatch.setattr(skill_index, "embed_texts", embed)
+        context = multiprocessing.get_context("fork")
+        workers = [
+            context.Process(target=add_packages, args=(path, worker)) for worker in range(4)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        index = SkillIndex.load(path)
+        assert sorted(index.packages) == sorted(f"com.bits.p{n}" for n in range(20))
+        assert [name for name in os.listdir(path) if name.startswith("vectors")] == [
+            index_meta(path)["vectors"]
+        ]
@@ -0,0 +1,308 @@
+import copy
+import datetime
+import decimal
+import json
+import random
+import time
+
+import pytest
+
+from main.Flag import FLAG_START_SKILL
+from main.State import (
+    ChannelState,
+    KeyValueStateStore,
+    LocalKeyValue,
+    LruStateStore,
+    StateDelta,
+    StateStore,
+    StateStoreMixin,
+)
+from main.Statement import InputStatement
+
+from .binder import MemoryBinder, input_text, make_skill, prompt, terminal
+
+
+KEY = ("user", "operator", "channel")
+
+
+def state_dict(**data):
+    return ChannelState(*KEY, block_id="b1", data=data).serialize()
+
+
+class CountingStore(KeyValueStateStore):
+    def __init__(self):
+        super().__init__(LocalKeyValue())
+        self.loads = 0
+        self.saves = 0
+        self.fail = False
+
+    def load(self, key):
+        self.loads += 1
+        return super().load(key)
+
+    def save(self, key, state_dict):
+        if self.fail:
+            raise ConnectionError("backend down")
+        self.saves += 1
+        super().save(key, state_dict)
+
+
+class DeltaStore(CountingStore):
+    # applies the changes itself, like a store with partial updates
+    save_delta = StateStore.save_delta
+
+
+class StoreBinder(StateStoreMixin, MemoryBinder):
+    def __init__(self, store, **kwargs):
+        super().__init__(**kwargs)
+        self.state_store = store
+
+    def state_key(self):
+        return KEY
+
+
+def loaded(**data):
+    return ChannelState.from_dict(state_dict(**data))
+
+
+def mutate(state, rng):
+    """Make a random change to a state, the way blocks change it."""
+    target = rng.choice([state.data, state.extra])
+    key = rng.choice("abcdef")
+    action = rng.randrange(9)
+    if action == 0:
+        target[key] = rng.randrange(100)
+    elif action == 1:
+        target.pop(key, None)
+    elif action == 2:
+        target.setdefault(key, [])
+    elif action == 3:
+        target.update({key: {"n": rng.randrange(100)}})
+    elif action == 4 and isinstance(target.get(key), list):
+        target[key].append(rng.randrange(100))
+    elif action == 5 and target:
+        target.popitem()
+    elif action == 6:
+        state.block_id = rng.choice(["b1", "b2", "b3"])
+    elif action == 7:
+        state.skill = rng.choice([None, {"package": "com.test.skill", "version": "1"}])
+    elif action == 8 and rng.random() < 0.2:
+        setattr(state, rng.choice(["data", "extra"]), {key: "replaced"})
+
+
+class TestChannelStateDelta:
+    def test_no_changes(self):
+        state = loaded(name="Ada")
+        state.data["name"] = "Ada"
+        state.block_id = "b1"
+        delta = state.delta()
+        assert not [op for op in delta.ops if op[0] == "field"]
+        assert delta.apply(state_dict(name="Ada")) == state.serialize()
+        assert not loaded(name="Ada").delta()
+
+    def test_operations(self):
+        state = loaded(name="Ada", city="Paris")
+        state.block_id = "b2"
+        state.update_data("age", 36)
+        del state.data["city"]
+        state.extra["visited"] = True
+        assert state.delta().ops == [
+            ["field", "block_id", "b2"],
+            ["delete", "data", "city"],
+            ["set", "data", "age", 36],
+            ["set", "extra", "visited", True],
+        ]
+        json.dumps(state.delta().to_dict())
+
+    def test_nested_mutation(self):
+        state = loaded(items=[1], address={"city": "Paris"})
+        state.data["items"].append(2)
+        state.data["address"]["city"] = "Berlin"
+        assert state.delta().ops == [
+            ["set", "data", "items", [1, 2]],
+            ["set", "data", "address", {"city": "Berlin"}],
+        ]
+
+    def test_values_json_cant_encode(self):
+        # stored states may hold dates and decimals, and dicts with int and str keys
+        state = loaded(
+            dates=[datetime.date(2023, 6, 1)], price={"amount": decimal.Decimal("9.99")}
+        )
+        state.extra["answers"] = {1: "one", "two": 2}
+        state.kwargs["opened"] = {"at": datetime.date(2023, 6, 1)}
+        state.mark_saved()
+        assert not state.delta()
+
+        state.data["dates"].append(datetime.date(2023, 6, 2))
+        state.extra["answers"][3] = "three"
+        assert state.delta().ops == [
+            ["set", "data", "dates", [datetime.date(2023, 6, 1), datetime.date(2023, 6, 2)]],
+            ["set", "extra", "answers", {1: "one", "two": 2, 3: "three"}],
+        ]
+        state.kwargs["opened"]["at"] = datetime.date(2023, 6, 3)
+        assert state.delta().snapshot == state.serialize()
+
+    def test_snapshot(self):
+        # a state made by hand has no saved version to compare with
+        state = ChannelState(*KEY, data={"name": "Ada"})
+        assert state.delta().snapshot == state.serialize()
+
+        state = loaded(name="Ada")
+        state.kwargs["lang"] = "fr"
+        assert state.delta().snapshot == state.serialize()
+        assert state.delta().apply({}) == state.serialize()
+
+    def test_mark_saved(self):
+        state = loaded()
+        state.data["name"] = "Ada"
+        state.mark_saved()
+        assert not state.delta()
+        state.data["name"] = "Bob"
+        assert state.delta().ops == [["set", "data", "name", "Bob"]]
+
+    def test_copies(self):
+        state = loaded(name="Ada")
+        data = copy.deepcopy(state.data)
+        data["name"] = "Bob"
+        assert state.data == {"name": "Ada"} and data.changed == {"name": None}
+        branch = copy.copy(state)
+        branch.data = {"name": "Bob"}
+        assert state.data == {"name": "Ada"} and not state.delta()
+
+    def test_replay(self):
+        rng = random.Random(7)
+        for _ in range(200):
+            state = loaded(a=1, b=[1])
+            stored = state.serialize()
+            stored = json.loads(json.dumps(stored))
+            for _ in range(rng.randrange(1, 5)):
+                for _ in range(rng.randrange(8)):
+                    mutate(state, rng)
+                delta = StateDelta.from_dict(json.loads(json.dumps(state.delta().to_dict())))
+                stored = delta.apply(stored)
+                state.mark_saved()
+                assert stored == json.loads(json.dumps(state.serialize()))
+
+
+class TestKeyValueStateStore:
+    def test_roundtrip(self):
+        store = KeyValueStateStore()
+        assert store.load(KEY) is None
+        store.save(KEY, state_dict(name="Ada"))
+        assert store.client.get("bigbot:state:user:operator:channel") is not None
+        assert store.load(KEY) == state_dict(name="Ada")
+        store.delete(KEY)
+        assert store.load(KEY) is None
+
+    def test_ttl(self):
+        store = KeyValueStateStore(ttl=0.05)
+        store.save(KEY, state_dict())
+        assert store.load(KEY) is not None
+        time.sleep(0.06)
+        assert store.load(KEY) is None
+
+
+class TestLruStateStore:
+    def test_write_through(self):
+        backend = CountingStore()
+        store = LruStateStore(backend, max_size=2)
+        store.save(KEY, state_dict(name="Ada"))
+        assert backend.load(KEY) == state_dict(name="Ada")
+        assert store.load(KEY) == state_dict(name="Ada")
+        assert (store.hits, store.misses, backend.loads) == (1, 0, 1)
+
+        # every load gets its own copy
+        store.load(KEY)["data"]["name"] = "Bob"
+        assert store.load(KEY)["data"] == {"name": "Ada"}
+
+    def test_eviction(self):
+        backend = CountingStore()
+        store = LruStateStore(backend, max_size=2)
+        for channel in ("a", "b", "c"):
+            store.save(("user", "operator", channel), state_dict())
+        assert len(store) == 2
+        assert store.load(("user", "operator", "a")) == state_dict()
+        assert (store.misses, backend.loads) == (1, 1)
+        assert store.load(("user", "operator", "missing")) is None
+        assert len(store) == 2
+
+    def test_failed_write(self):
+        backend = CountingStore()
+        store = LruStateStore(backend)
+        store.save(KEY, state_dict(name="Ada"))
+        backend.fail = True
+        with pytest.raises(ConnectionError):
+            store.save(KEY, state_dict(name="Bob"))
+        backend.fail = False
+        assert store.load(KEY) == state_dict(name="Ada")
+        assert store.misses == 1
+
+    def test_save_delta(self):
+        backend = DeltaStore()
+        store = LruStateStore(backend)
+        store.save(KEY, state_dict(name="Ada"))
+        state = ChannelState.from_dict(store.load(KEY))
+        state.data["city"] = "Paris"
+        assert store.save_delta(KEY, state.delta())
+        assert store.load(KEY) == backend.load(KEY) == state.serialize()
+
+        assert not store.save_delta(("user", "operator", "missing"), state.delta())
+        assert store.load(("user", "operator", "missing")) is None
+
+    def test_delete(self):
+        store = LruStateStore(CountingStore())
+        store.save(KEY, state_dict())
+        store.delete(KEY)
+        assert store.load(KEY) is None and len(store) == 0
+
+
+class TestStateStoreMixin:
+    def test_conversation(self):
+        store = LruStateStore(CountingStore())
+        blocks = [prompt("b0", "Name?", "b1"), input_text("b1", "name", "b2")]
+        skill = make_skill(blocks + [input_text("b2", "city", "b3"), terminal("b3")])
+        binder = StoreBinder(store, skills={skill["package"]: skill})
+
+        assert binder.on_load_state().serialize() == ChannelState(*KEY).serialize()
+        binder.select_processor(
+            InputStatement("user", input=skill["package"], flag=FLAG_START_SKILL)
+        )
+        assert store.load(KEY)["block_id"] == "b1"
+
+        binder = StoreBinder(store, skills={skill["package"]: skill})
+        binder.select_processor(InputStatement("user", text="Ada", input="Ada"))
+        assert store.backend.load(KEY)["data"] == {"name": "Ada"}
+        assert store.backend.load(KEY)["block_id"] == "b2"
+        assert store.backend.saves == 2
+
+    def test_key_value_store_saves_the_whole_state(self):
+        backend = CountingStore()
+        store = LruStateStore(backend)
+        binder = StoreBinder(store)
+        store.save(KEY, state_dict(name="Ada"))
+        with binder.state_session():
+            state = binder.load_state()
+            state.data["city"] = "Paris"
+            binder.save_state(state)
+
+        # one write of the state, without reading it back to apply the changes
+        assert (backend.loads, backend.saves) == (0, 2)
+        assert store.load(KEY)["data"] == {"name": "Ada", "city": "Paris"}
+
+    def test_state_key_is_required(self):
+        class KeylessBinder(StateStoreMixin, MemoryBinder):
+            pass
+
+        with pytest.raises(TypeError, match="state_key"):
+            KeylessBinder()
+
+    def test_unchanged_state_is_not_written(self):
+        store = LruStateStore(CountingStore())
+        skill = make_skill([prompt("b0", "Name?", "b1"), input_text("b1", "name"), terminal("b2")])
+        binder = StoreBinder(store, skills={skill["package"]: skill})
+        binder.select_processor(
+            InputStatement("user", input=skill["package"], flag=FLAG_START_SKILL)
+        )
+        with binder.state_session():
+            binder.save_state(binder.load_state())
+        assert store.backend.saves == 1
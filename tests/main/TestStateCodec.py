@@ -0,0 +1,69 @@
+import json
+
+import msgpack
+import pytest
+
+from main import StateCodec
+from main.State import ChannelState, KeyValueStateStore
+
+from .binder import make_skill, terminal
+
+
+KEY = ("user", "operator", "channel")
+
+
+def state_dict():
+    skill = {"package": "com.test.skill", "version": "1"}
+    data = {"name": "Ada", "items": [1, 2.5, None], "address": {"city": "Paris"}}
+    return ChannelState(*KEY, skill=skill, block_id="b1", data=data, lang="en").serialize()
+
+
+class TestStateCodec:
+    def test_roundtrip(self):
+        encoded = StateCodec.encode(state_dict())
+        assert isinstance(encoded, bytes)
+        assert StateCodec.decode(encoded) == state_dict()
+        assert StateCodec.decode(StateCodec.encode_json(state_dict())) == state_dict()
+        assert len(encoded) < len(json.dumps(state_dict()))
+
+    def test_json_layout(self):
+        document = json.loads(StateCodec.encode_json(state_dict()))
+        assert document["version"] == StateCodec.SCHEMA_VERSION
+        assert document["kwargs"] == {"lang": "en"}
+        assert "lang" not in document
+
+    def test_channel_state(self):
+        state = ChannelState.from_dict(state_dict())
+        assert ChannelState.from_bytes(state.to_bytes()).serialize() == state_dict()
+        assert ChannelState.from_json(state.to_json()).serialize() == state_dict()
+        assert not ChannelState.from_bytes(state.to_bytes()).delta()
+
+    def test_upgrade_version_1(self):
+        # the ChannelState.to_json output before the schema was versioned
+        skill = make_skill([terminal("b0")])
+        legacy = {"user_id": "user", "operator_id": "operator", "channel_id": "channel"}
+        legacy.update(skill=skill, block_id="b0", data={"name": "Ada"}, extra={}, lang="en")
+        state_dict = StateCodec.decode(json.dumps(legacy))
+        assert "blocks" not in state_dict["skill"]
+        assert state_dict["lang"] == "en" and state_dict["data"] == {"name": "Ada"}
+
+    def test_kwarg_named_like_the_schema(self):
+        state = dict(state_dict(), version="beta", kwargs=[1])
+        assert StateCodec.decode(StateCodec.encode(state)) == state
+        assert StateCodec.decode(StateCodec.encode_json(state)) == state
+
+    def test_refused_documents(self):
+        document = json.loads(StateCodec.encode_json(state_dict()))
+        with pytest.raises(ValueError, match="Unknown state fields"):
+            StateCodec.decode(json.dumps(dict(document, color="red")))
+        with pytest.raises(ValueError, match="Unsupported"):
+            StateCodec.decode(json.dumps(dict(document, version=99)))
+        with pytest.raises(ValueError, match="Unsupported"):
+            StateCodec.decode(msgpack.packb([99, "user"]))
+
+    def test_key_value_store_reads_json_values(self):
+        store = KeyValueStateStore()
+        store.client.set(store.name(KEY), json.dumps(state_dict()))
+        assert store.load(KEY) == state_dict()
+        store.save(KEY, state_dict())
+        assert not store.client.get(store.name(KEY)).startswith(b"{")
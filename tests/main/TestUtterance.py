@@ -0,0 +1,178 @@
+import json
+import os
+
+import numpy as np
+import pytest
+import textdistance
+
+from main import IntentModel as intent_model
+from main.IntentModel import IntentModel, load_training_data
+from main.Utterance import UtteranceDistance, UtteranceIndex, edit_distance
+
+
+EXAMPLES = {
+    "greet": ["hello", "hi there", "good morning", "hey", "good evening"],
+    "book_table": [
+        "book a table for two",
+        "reserve a table tonight",
+        "I want to book a table",
+        "can I reserve a table for four",
+    ],
+    "weather": [
+        "what is the weather like",
+        "will it rain tomorrow",
+        "how is the weather today",
+        "is it sunny outside",
+    ],
+}
+
+NLU = """## intent:greet
+- hello
+- hi there
+
+## synonym:hello
+- hey
+
+## intent:book_table
+- book a table for [two](people)
+* reserve a table
+"""
+
+
+def random_texts(random, count, alphabet="abcde fé😀"):
+    return ["".join(random.choice(list(alphabet), random.integers(0, 30))) for _ in range(count)]
+
+
+@pytest.fixture(scope="module")
+def model():
+    return IntentModel.train(EXAMPLES)
+
+
+class TestIntentModel:
+    def test_load_training_data(self, tmp_path):
+        path = tmp_path / "nlu.md"
+        path.write_text(NLU)
+        assert load_training_data(str(path)) == {
+            "greet": ["hello", "hi there"],
+            "book_table": ["book a table for two", "reserve a table"],
+        }
+
+    def test_rank(self, model):
+        assert model.rank("please book me a table")[0]["name"] == "book_table"
+        assert model.rank("hello!")[0]["name"] == "greet"
+        ranking = model.rank("is it going to rain")
+        assert ranking[0]["name"] == "weather"
+        assert [result["confidence"] for result in ranking] == sorted(
+            (result["confidence"] for result in ranking), reverse=True
+        )
+        assert sum(result["confidence"] for result in ranking) == pytest.approx(1.0)
+
+    def test_sparse_training(self):
+        # a text without any feature leaves an empty row
+        examples = dict(EXAMPLES, greet=EXAMPLES["greet"] + ["!!"])
+        dense = IntentModel.train(examples)
+        sparse = IntentModel.train(examples, dense_limit=0)
+        np.testing.assert_allclose(sparse.weights, dense.weights, atol=1e-5)
+        np.testing.assert_allclose(sparse.bias, dense.bias, atol=1e-5)
+
+    def test_unknown_words(self, model):
+        assert len(model.rank("")) == len(EXAMPLES)
+        assert len(model.rank("zzzz qqqq")) == len(EXAMPLES)
+
+    def test_save_load(self, model, tmp_path):
+        model.save(str(tmp_path))
+        loaded = IntentModel.load(str(tmp_path))
+        assert isinstance(loaded.weights, np.memmap)
+        assert loaded.intents == model.intents
+        assert loaded.meta["examples"] == 13
+        for text in ("book a table", "hey", "sunny today", "nothing"):
+            assert loaded.rank(text) == model.rank(text)
+
+    def test_format_version(self, model, tmp_path):
+        model.save(str(tmp_path))
+        meta_path = os.path.join(str(tmp_path), "meta.json")
+        with open(meta_path) as file:
+            meta = json.load(file)
+        meta["format"] = intent_model.FORMAT_VERSION + 1
+        with open(meta_path, "w") as file:
+            json.dump(meta, file)
+        with pytest.raises(ValueError):
+            IntentModel.load(str(tmp_path))
+
+    def test_get_intent_model(self, model, tmp_path):
+        model.save(str(tmp_path))
+        try:
+            loaded = intent_model.warm_up(str(tmp_path))
+            assert intent_model.get_intent_model() is loaded
+            assert intent_model.get_intent_model(str(tmp_path)) is loaded
+        finally:
+            intent_model.clear()
+            intent_model._default_path = intent_model.Constant.INTENT_MODEL_PATH
+
+
+class TestUtteranceDistance:
+    def test_inference_only(self, model, monkeypatch):
+        def train(*args, **kwargs):
+            raise AssertionError("UtteranceDistance must not train")
+
+        monkeypatch.setattr(IntentModel, "train", train)
+        utterances = ["book a table", "what is the weather", "hello", "cancel"]
+        distance = UtteranceDistance(utterances, "book a table", model=model)
+        ranking = model.rank("book a table")
+        assert distance.results == ranking
+        expected = [
+            textdistance.levenshtein.normalized_similarity("book a table", text)
+            * (1 - (ranking[i]["confidence"] if i < len(ranking) else 0.0))
+            for i, text in enumerate(utterances)
+        ]
+        assert distance.get_distance() == pytest.approx(min(expected))
+        assert distance.get_index() == expected.index(min(expected))
+        assert distance.get_text() == utterances[distance.get_index()]
+
+    def test_no_query(self, model):
+        distance = UtteranceDistance(["hello"], "", model=model)
+        assert distance.get_text() is None and distance.get_distance() is None
+
+
+class TestUtteranceIndex:
+    def test_edit_distance(self):
+        random = np.random.default_rng(0)
+        texts = random_texts(random, 100)
+        for query, text in zip(texts, reversed(texts)):
+            assert edit_distance(query, text) == textdistance.levenshtein(query, text)
+
+    @pytest.mark.parametrize("length", [0, 1, 5, 64, 65, 90])
+    def test_scores(self, length):
+        random = np.random.default_rng(length)
+        texts = random_texts(random, 50) + ["", "x" * 100]
+        index = UtteranceIndex(texts)
+        for query in random_texts(random, 3, "abcde fé😀" * 10):
+            query = (query * 10)[:length]
+            expected = [textdistance.levenshtein.normalized_similarity(query, t) for t in texts]
+            assert index.scores(query).tolist() == expected
+            assert (index.bounds(query) >= expected).all()
+
+    def test_top(self):
+        random = np.random.default_rng(1)
+        texts = random_texts(random, 300)
+        index = UtteranceIndex(texts, batch=16)
+        for query in random_texts(random, 5):
+            scores = [textdistance.levenshtein.normalized_similarity(query, t) for t in texts]
+            for k in (1, 5, 50):
+                expected = sorted(range(len(texts)), key=lambda i: (-scores[i], i))[:k]
+                assert index.top(query, k) == [(i, scores[i]) for i in expected]
+        assert index.top("abc", 0) == [] and UtteranceIndex([]).top("abc") == []
+
+    def test_utterance_distance(self, model):
+        texts = ["book a table", "what is the weather", "hello", "cancel"] * 3
+        index = UtteranceIndex(texts)
+        for query in ("book a table", "hi", "rain"):
+            distance = UtteranceDistance(texts, query, model=model, utterance_index=index)
+            ranking = model.rank(query)
+            scores = [
+                textdistance.levenshtein.normalized_similarity(query, text)
+                * (1 - (ranking[i]["confidence"] if i < len(ranking) else 0.0))
+                for i, text in enumerate(texts)
+            ]
+            assert distance.get_index() == scores.index(min(scores))
+            assert distance.get_distance() == min(scores)
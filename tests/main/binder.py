@@ -0,0 +1,80 @@
+"""In-memory binder used by the main package tests."""
+
+from main.Binder import Binder, Registry
+from main.State import ChannelState
+
+
+def make_skill(blocks, start="b0", package="com.test.skill", **kwargs):
+    return {"name": "Test", "package": package, "start": start, "blocks": blocks, **kwargs}
+
+
+def prompt(block_id, text, next_id=None):
+    return {
+        "id": block_id,
+        "component": "main.Block.PromptText",
+        "properties": [{"name": "primary_text", "value": [text]}],
+        "connections": [[1, next_id]] if next_id else [],
+    }
+
+
+def input_text(block_id, key, next_id=None):
+    return {
+        "id": block_id,
+        "component": "main.Block.InputText",
+        "properties": [{"name": "key", "value": key}, {"name": "required", "value": True}],
+        "connections": [[1, next_id]] if next_id else [],
+    }
+
+
+def terminal(block_id):
+    return {
+        "id": block_id,
+        "component": "main.Block.TerminalBlock",
+        "properties": [{"name": "post_skill", "value": None}],
+        "connections": [],
+    }
+
+
+class MemoryBinder(Binder):
+    def __init__(self, skills=None, **kwargs):
+        super().__init__(Registry(), **kwargs)
+        self.skills = skills or {}
+        self.state = ChannelState("user", "operator", "channel")
+        self.messages = []
+        self.loads = 0
+        self.saves = 0
+
+    def on_load_oauth_token(self, component, user_id):
+        return None
+
+    def on_save_oauth_token(self, component, user_id, token):
+        pass
+
+    def on_context(self):
+        return {}
+
+    def on_get_component_config(self, component):
+        return {}
+
+    def on_standard_input(self, input, output):
+        return None
+
+    def on_post_message(self, statement):
+        self.messages.append(statement)
+
+    def on_load_state(self):
+        self.loads += 1
+        return ChannelState.from_dict(self.state.serialize())
+
+    def on_save_state(self, state_json):
+        self.saves += 1
+        self.state = ChannelState.from_dict(state_json)
+
+    def on_get_skill(self, package):
+        return self.skills.get(package)
+
+    def on_cancel_intent(self, statement):
+        return False
+
+    def on_skill_intent(self, statement):
+        return None